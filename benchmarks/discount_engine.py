@@ -0,0 +1,203 @@
+"""
+Benchmark of the discount engine.
+
+Measures the throughput and the latency percentiles of
+
+- ``DiscountValidator`` (via :meth:`viur.shop.modules.discount.Discount.can_apply`)
+  for each manual discount on each cart,
+- :meth:`viur.shop.types.price.Price.shop_current_discount` for each article,
+- :meth:`viur.shop.types.price.Price.choose_best_discount_set` for each leaf of each cart,
+
+for N discounts × M articles × K carts of synthetic data
+(see :mod:`generators`) in an in-memory datastore (see :mod:`memory_datastore`).
+
+The shop needs its project (the article skeleton, the hook customizations,
+...), so the benchmark has to run in the deploy directory of a project.
+``--setup`` names the module which initializes the ViUR application with
+``viur.core.setup()`` (usually ``main``). The module is imported after the
+in-memory datastore has been installed, so no real datastore is touched.
+
+.. code-block:: shell
+
+   cd deploy
+   python ../viur-shop/benchmarks/discount_engine.py --setup main -n 200 -m 1000 -k 50 --rounds 2
+
+Each cart (and each article) is evaluated in a new simulated request, the
+instance caches persist between the requests. The first round runs with
+cold instance caches, later rounds with warm ones.
+"""
+
+import argparse
+import contextlib
+import dataclasses
+import importlib
+import json
+import math
+import random
+import sys
+import time
+import typing as t  # noqa
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from generators import Scenario, ScenarioGenerator  # noqa: E402
+from memory_datastore import MemoryDatastore  # noqa: E402
+from viur.core import current  # noqa: E402
+from viur.shop import SHOP_INSTANCE  # noqa: E402
+from viur.shop.types import Price  # noqa: E402
+
+
+@dataclasses.dataclass
+class Measurement:
+    """The samples of one benchmark"""
+
+    name: str
+    samples: list[float] = dataclasses.field(default_factory=list)
+    """Wall time of each call in seconds"""
+
+    datastore: dict[str, int] = dataclasses.field(default_factory=dict)
+    """Datastore operations during the benchmark"""
+
+    def percentile(self, percent: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+    def summary(self) -> dict[str, t.Any]:
+        total = sum(self.samples)
+        return {
+            "name": self.name,
+            "calls": len(self.samples),
+            "total_s": total,
+            "throughput_per_s": len(self.samples) / total if total else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p90_ms": self.percentile(90) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": max(self.samples, default=0.0) * 1000,
+            "datastore": self.datastore,
+        }
+
+
+class Benchmark:
+    """Runs the benchmarks on a scenario and collects the measurements"""
+
+    def __init__(self, datastore: MemoryDatastore, *, seed: int = 0, discounts_per_leaf: int = 5):
+        super().__init__()
+        self.shop = SHOP_INSTANCE.get()
+        self.datastore = datastore
+        self.random = random.Random(seed)
+        self.discounts_per_leaf = discounts_per_leaf
+        self.measurements: list[Measurement] = []
+
+    @staticmethod
+    def new_request() -> None:
+        """Simulate a new request, the request-local caches are empty"""
+        current.request_data.set({})
+
+    @contextlib.contextmanager
+    def measurement(self, name: str) -> t.Iterator[Measurement]:
+        measurement = Measurement(name)
+        stats_before = self.datastore.stats.copy()
+        yield measurement
+        measurement.datastore = dict(self.datastore.stats - stats_before)
+        self.measurements.append(measurement)
+
+    def run(self, scenario: Scenario, suffix: str = "") -> None:
+        self.validator(scenario, suffix)
+        self.shop_current_discount(scenario, suffix)
+        self.choose_best_discount_set(scenario, suffix)
+
+    def validator(self, scenario: Scenario, suffix: str = "") -> None:
+        with self.measurement(f"DiscountValidator{suffix}") as measurement:
+            for cart_key in scenario.carts:
+                self.new_request()
+                for discount_skel in scenario.manual_discounts:
+                    start = time.perf_counter()
+                    self.shop.discount.can_apply(discount_skel, cart_key=cart_key)
+                    measurement.samples.append(time.perf_counter() - start)
+
+    def shop_current_discount(self, scenario: Scenario, suffix: str = "") -> None:
+        with self.measurement(f"shop_current_discount{suffix}") as measurement:
+            for article_skel in scenario.articles:
+                self.new_request()
+                price = Price(article_skel, use_snapshot=False)
+                start = time.perf_counter()
+                price.shop_current_discount(article_skel)
+                measurement.samples.append(time.perf_counter() - start)
+
+    def choose_best_discount_set(self, scenario: Scenario, suffix: str = "") -> None:
+        discounts = scenario.manual_discounts
+        with self.measurement(f"choose_best_discount_set{suffix}") as measurement:
+            for cart_key in scenario.carts:
+                self.new_request()
+                for leaf_skels in self.shop.cart.get_leafs_by_article(cart_key).values():
+                    for leaf_skel in leaf_skels:
+                        cart_discounts = self.random.sample(discounts, min(len(discounts), self.discounts_per_leaf))
+                        price = Price(leaf_skel, cart_discounts=cart_discounts)
+                        start = time.perf_counter()
+                        price.choose_best_discount_set()
+                        measurement.samples.append(time.perf_counter() - start)
+
+
+def format_table(summaries: list[dict[str, t.Any]]) -> str:
+    columns = ("name", "calls", "throughput_per_s", "p50_ms", "p90_ms", "p99_ms", "max_ms")
+    rows = [columns] + [
+        tuple(f"{summary[col]:.3f}" if isinstance(summary[col], float) else str(summary[col]) for col in columns)
+        for summary in summaries
+    ]
+    widths = [max(len(row[idx]) for row in rows) for idx in range(len(columns))]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows]
+    for summary in summaries:
+        operations = ", ".join(f"{op}={count}" for op, count in sorted(summary["datastore"].items()))
+        lines.append(f"{summary['name']}: {operations or 'no datastore operations'}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--setup", default="main", help="Module which initializes the ViUR application")
+    parser.add_argument("-n", "--discounts", type=int, default=100, help="Number of discounts")
+    parser.add_argument("-m", "--articles", type=int, default=500, help="Number of articles")
+    parser.add_argument("-k", "--carts", type=int, default=20, help="Number of carts")
+    parser.add_argument("--conditions-per-discount", type=int, default=2)
+    parser.add_argument("--articles-per-cart", type=int, default=5)
+    parser.add_argument("--discounts-per-leaf", type=int, default=5,
+                        help="Number of cart discounts passed to choose_best_discount_set")
+    parser.add_argument("--rounds", type=int, default=1, help="Rounds, the first one runs with cold caches")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="Write the results as JSON into this file")
+    args = parser.parse_args(argv)
+
+    datastore = MemoryDatastore()
+    with datastore.installed():
+        importlib.import_module(args.setup)
+
+        benchmark = Benchmark(datastore, seed=args.seed, discounts_per_leaf=args.discounts_per_leaf)
+        benchmark.new_request()
+        start = time.perf_counter()
+        scenario = ScenarioGenerator(
+            benchmark.shop,
+            seed=args.seed,
+            conditions_per_discount=args.conditions_per_discount,
+            articles_per_cart=args.articles_per_cart,
+        ).build(discounts=args.discounts, articles=args.articles, carts=args.carts)
+        print(f"Generated {len(scenario.discounts)} discounts ({len(scenario.automatically_discounts)} automatically), "
+              f"{len(scenario.conditions)} conditions, {len(scenario.articles)} articles "
+              f"and {len(scenario.carts)} carts in {time.perf_counter() - start:.1f}s")
+        datastore.stats.clear()
+
+        for round_ in range(1, args.rounds + 1):
+            benchmark.run(scenario, suffix="" if args.rounds == 1 else f" #{round_}")
+
+    summaries = [measurement.summary() for measurement in benchmark.measurements]
+    print(format_table(summaries))
+    if args.json:
+        args.json.write_text(json.dumps({"arguments": vars(args) | {"json": str(args.json)},
+                                         "results": summaries}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Synthetic data for the benchmarks.
+
+The :class:`ScenarioGenerator` writes articles, discount conditions, discounts
+and carts with the skeletons of the shop (and the article skeleton of the
+project). All values are derived from a seeded :class:`random.Random`, so a
+scenario is reproducible and two runs of the benchmark are comparable.
+"""
+
+import dataclasses
+import random
+from datetime import timedelta as td
+
+from viur.core import db, utils
+from viur.core.skeleton import SkeletonInstance
+from viur.shop import Shop
+from viur.shop.types import (
+    ApplicationDomain, CartType, CodeType, ConditionOperator, CustomerGroup, DiscountType, VatRateCategory,
+)
+
+
+@dataclasses.dataclass
+class Scenario:
+    """The written data of a benchmark run"""
+
+    articles: list[SkeletonInstance] = dataclasses.field(default_factory=list)
+    conditions: list[SkeletonInstance] = dataclasses.field(default_factory=list)
+    discounts: list[SkeletonInstance] = dataclasses.field(default_factory=list)
+    """All discounts, manual and automatically"""
+
+    carts: list[db.Key] = dataclasses.field(default_factory=list)
+    """Keys of the root nodes"""
+
+    @property
+    def manual_discounts(self) -> list[SkeletonInstance]:
+        return [skel for skel in self.discounts if not skel["activate_automatically"]]
+
+    @property
+    def automatically_discounts(self) -> list[SkeletonInstance]:
+        return [skel for skel in self.discounts if skel["activate_automatically"]]
+
+
+class ScenarioGenerator:
+    """
+    Generates and writes synthetic shop data.
+
+    :param shop: The shop instance of the project.
+    :param seed: Seed of the random values.
+    :param conditions_per_discount: Maximum number of conditions of a discount.
+    :param articles_per_cart: Maximum number of leafs of a cart.
+    :param automatically_ratio: Share of discounts which are activated automatically.
+    :param scope_article_ratio: Share of conditions which are limited to some articles.
+    """
+
+    def __init__(
+        self,
+        shop: Shop,
+        *,
+        seed: int = 0,
+        conditions_per_discount: int = 2,
+        articles_per_cart: int = 5,
+        automatically_ratio: float = 0.2,
+        scope_article_ratio: float = 0.3,
+    ):
+        super().__init__()
+        self.shop = shop
+        self.random = random.Random(seed)
+        self.conditions_per_discount = conditions_per_discount
+        self.articles_per_cart = articles_per_cart
+        self.automatically_ratio = automatically_ratio
+        self.scope_article_ratio = scope_article_ratio
+
+    def build(self, *, discounts: int, articles: int, carts: int) -> Scenario:
+        """Write N discounts (with their conditions), M articles and K carts"""
+        scenario = Scenario()
+        scenario.articles = [self.article(idx) for idx in range(articles)]
+        for idx in range(discounts):
+            conditions = [
+                self.condition(f"{idx}.{cdx}", scenario.articles)
+                for cdx in range(self.random.randint(1, self.conditions_per_discount))
+            ]
+            scenario.conditions.extend(conditions)
+            automatically = self.random.random() < self.automatically_ratio
+            scenario.discounts.append(self.discount(idx, conditions, automatically))
+        scenario.carts = [self.cart(idx, scenario.articles) for idx in range(carts)]
+        return scenario
+
+    def article(self, idx: int) -> SkeletonInstance:
+        skel = self.shop.article_skel()
+        price = round(self.random.uniform(1.0, 500.0), 2)
+        skel["shop_name"] = f"Article {idx}"
+        skel["shop_description"] = f"Synthetic article {idx}"
+        skel["shop_price_retail"] = price
+        skel["shop_price_recommended"] = round(price * self.random.uniform(1.0, 1.3), 2)
+        skel["shop_listed"] = True
+        skel["shop_art_no_or_gtin"] = f"BENCH-{idx:06d}"
+        skel["shop_vat_rate_category"] = self.random.choice(list(VatRateCategory))
+        skel.write(update_relations=False)
+        return skel
+
+    def condition(self, name: str, articles: list[SkeletonInstance]) -> SkeletonInstance:
+        skel = self.shop.discount_condition.addSkel()
+        now = utils.utcNow()
+        skel["name"] = f"Condition {name}"
+        skel["code_type"] = CodeType.NONE
+        skel["application_domain"] = self.random.choice(list(ApplicationDomain))
+        skel["quantity_volume"] = -1
+        skel["scope_customer_group"] = CustomerGroup.ALL
+        skel["scope_combinable_other_discount"] = self.random.random() < 0.5
+        if self.random.random() < 0.5:
+            skel["scope_minimum_order_value"] = round(self.random.uniform(0, 300), 2)
+        if self.random.random() < 0.3:
+            skel["scope_minimum_quantity"] = self.random.randint(1, 5)
+        if self.random.random() < 0.3:
+            skel["scope_date_start"] = now - td(days=self.random.randint(0, 30))
+            skel["scope_date_end"] = now + td(days=self.random.randint(-5, 30))
+        if articles and self.random.random() < self.scope_article_ratio:
+            for article in self.random.sample(articles, min(len(articles), self.random.randint(1, 3))):
+                skel.setBoneValue("scope_article", article["key"], append=True)
+        skel.write(update_relations=False)
+        return skel
+
+    def discount(self, idx: int, conditions: list[SkeletonInstance], automatically: bool) -> SkeletonInstance:
+        skel = self.shop.discount.addSkel()
+        skel["name"] = f"Discount {idx}"
+        skel["discount_type"] = discount_type = self.random.choice([DiscountType.PERCENTAGE, DiscountType.ABSOLUTE])
+        if discount_type == DiscountType.PERCENTAGE:
+            skel["percentage"] = self.random.randint(5, 30)
+        else:
+            skel["absolute"] = self.random.randint(1, 20)
+        skel["condition_operator"] = self.random.choice(list(ConditionOperator))
+        skel["activate_automatically"] = automatically
+        for condition in conditions:
+            skel.setBoneValue("condition", condition["key"], append=True)
+        skel.write(update_relations=False)
+        return skel
+
+    def cart(self, idx: int, articles: list[SkeletonInstance]) -> db.Key:
+        cart = self.shop.cart
+        root_skel = cart.addSkel("node")
+        root_skel["is_root_node"] = True
+        root_skel["name"] = f"Cart {idx}"
+        root_skel["cart_type"] = CartType.BASKET
+        root_skel.write(update_relations=False)
+        for article in self.random.sample(articles, min(len(articles), self.random.randint(1, self.articles_per_cart))):
+            leaf_skel = cart.addSkel("leaf")
+            leaf_skel["parententry"] = root_skel["key"]
+            leaf_skel["parentrepo"] = root_skel["key"]
+            leaf_skel.setBoneValue("article", article["key"])
+            leaf_skel["quantity"] = self.random.randint(1, 3)
+            leaf_skel = cart.copy_article_values(article, leaf_skel)
+            leaf_skel.write(update_relations=False)
+        return root_skel["key"]
@@ -0,0 +1,171 @@
+"""
+In-memory replacement of the datastore for the benchmarks.
+
+:class:`MemoryDatastore` replaces the datastore functions of :mod:`viur.core.db`
+(and the query backend of :class:`viur.core.db.Query`) while it is installed,
+so the synthetic data never reaches a real datastore and the measured
+times contain only the work of the shop itself.
+
+Each operation is counted in :attr:`MemoryDatastore.stats`, which makes
+changes in the number of datastore accesses visible even though they are
+not slow here.
+
+Limitations: Only the operators of single queries (``=``, ``<``, ``>``, ``<=``,
+``>=``) are supported (``IN`` and ``!=`` are split into multiple queries by
+:class:`viur.core.db.Query` anyway), without composite indexes, distinct
+queries and kindless queries.
+"""
+
+import collections
+import contextlib
+import copy
+import itertools
+import threading
+import typing as t  # noqa
+from unittest import mock
+
+from viur.core import db
+
+
+class MemoryDatastore:
+    """A datastore in the memory of the process, see the module documentation"""
+
+    def __init__(self):
+        super().__init__()
+        self.entities: dict[db.Key, db.Entity] = {}
+        self.stats: collections.Counter[str] = collections.Counter()
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+
+    # --- Installation --------------------------------------------------------
+
+    @contextlib.contextmanager
+    def installed(self) -> t.Iterator[t.Self]:
+        """Use this datastore instead of the real one inside the ``with`` block"""
+        with contextlib.ExitStack() as stack:
+            for name, replacement in (
+                ("Get", self.get),
+                ("Put", self.put),
+                ("Delete", self.delete),
+                ("RunInTransaction", self.run_in_transaction),
+                ("IsInTransaction", self.is_in_transaction),
+            ):
+                stack.enter_context(mock.patch.object(db, name, replacement))
+            datastore = self
+
+            def run_single_filter_query(query: db.Query, query_definition: db.QueryDefinition, limit: int):
+                return datastore.run_query(query_definition, limit)
+
+            stack.enter_context(mock.patch.object(db.Query, "_runSingleFilterQuery", run_single_filter_query))
+            yield self
+
+    # --- Entities ------------------------------------------------------------
+
+    @staticmethod
+    def _copy(entity: db.Entity | None) -> db.Entity | None:
+        # Like a real datastore, callers must never share the stored objects
+        if entity is None:
+            return None
+        result = db.Entity(entity.key, set(entity.exclude_from_indexes))
+        result.update(copy.deepcopy(dict(entity)))
+        return result
+
+    def get(self, keys: db.Key | t.Iterable[db.Key]) -> db.Entity | list[db.Entity | None] | None:
+        if isinstance(keys, db.Key):
+            self.stats["get"] += 1
+            return self._copy(self.entities.get(keys))
+        keys = list(keys)
+        self.stats["get_multi"] += 1
+        self.stats["get_multi_keys"] += len(keys)
+        return [self._copy(self.entities.get(key)) for key in keys]
+
+    def put(self, entities: db.Entity | list[db.Entity]) -> db.Entity | list[db.Entity]:
+        single = isinstance(entities, db.Entity)
+        for entity in [entities] if single else entities:
+            if entity.key.is_partial:
+                entity.key = db.Key(entity.key.kind, next(self._ids), parent=entity.key.parent)
+            self.entities[entity.key] = self._copy(entity)
+            self.stats["put"] += 1
+        return entities
+
+    def delete(self, keys: db.Key | db.Entity | list[db.Key | db.Entity]) -> None:
+        if not isinstance(keys, list):
+            keys = [keys]
+        for key in keys:
+            self.entities.pop(key.key if isinstance(key, db.Entity) else key, None)
+            self.stats["delete"] += 1
+
+    def run_in_transaction(self, callback: t.Callable, *args: t.Any, **kwargs: t.Any) -> t.Any:
+        # Single threaded benchmarks need no isolation, a transaction only has to be detectable
+        kwargs.pop("__allowOverriding__", None)
+        self.stats["transaction"] += 1
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        try:
+            return callback(*args, **kwargs)
+        finally:
+            self._local.depth = depth
+
+    def is_in_transaction(self) -> bool:
+        return getattr(self._local, "depth", 0) > 0
+
+    # --- Queries -------------------------------------------------------------
+
+    @classmethod
+    def _resolve(cls, value: t.Any, path: list[str]) -> list[t.Any]:
+        """Resolve a (dotted) property path, lists (multiple bones) are flattened"""
+        if isinstance(value, list):
+            return [result for item in value for result in cls._resolve(item, path)]
+        if not path:
+            return [value]
+        name, *path = path
+        if name == "__key__" and isinstance(value, db.Entity):
+            return cls._resolve(value.key, path)
+        if not isinstance(value, dict) or name not in value:
+            return []
+        return cls._resolve(value[name], path)
+
+    _OPERATORS: t.Final[dict[str, t.Callable[[t.Any, t.Any], bool]]] = {
+        "=": lambda a, b: a == b,
+        "<": lambda a, b: a < b,
+        ">": lambda a, b: a > b,
+        "<=": lambda a, b: a <= b,
+        ">=": lambda a, b: a >= b,
+    }
+
+    def _matches(self, entity: db.Entity, filters: dict[str, t.Any]) -> bool:
+        for filter_str, requested in filters.items():
+            prop, operator = filter_str.split(" ")
+            compare = self._OPERATORS[operator]
+            values = self._resolve(entity, prop.split("."))
+            try:
+                if not any(value is not None and compare(value, requested) for value in values):
+                    return False
+            except TypeError:  # not comparable types (e.g. str and int) never match
+                return False
+        return True
+
+    def run_query(self, query_definition: db.QueryDefinition, limit: int) -> list[db.Entity]:
+        self.stats["query"] += 1
+        result = [
+            entity for entity in self.entities.values()
+            if entity.key.kind == query_definition.kind and self._matches(entity, query_definition.filters)
+        ]
+        for prop, order in reversed(query_definition.orders or []):
+            # stable sort, so the first order has the highest priority
+            result.sort(
+                key=lambda entity: [(value is None, value) for value in self._resolve(entity, prop.split("."))[:1]],
+                reverse=order in (db.SortOrder.Descending, db.SortOrder.InvertedAscending),
+            )
+        total = len(result)
+        offset = int(query_definition.startCursor or 0)
+        result = result[offset:offset + limit] if limit and limit > 0 else result[offset:]
+        end = offset + len(result)
+        # the cursor is just the offset of the next result
+        query_definition.currentCursor = str(end) if result and end < total else None
+        self.stats["query_results"] += len(result)
+        return [self._copy(entity) for entity in result]
+
+    def clear(self) -> None:
+        self.entities.clear()
+        self.stats.clear()
@@ -143,6 +143,15 @@ TRANSLATIONS = {
     "viur.shop.vat_rate_category.zero": {
         "de": "Nullsatz",
     },
+    # Shipping tier measure
+    "viur.shop.shipping_tier_measure.quantity": {
+        "de": "Anzahl",
+        "en": "Quantity",
+    },
+    "viur.shop.shipping_tier_measure.weight": {
+        "de": "Gewicht",
+        "en": "Weight",
+    },
     # Costumer type
     "skeleton.address.customer_type.private": {
         "en": "Private customer",
@@ -855,6 +864,16 @@ TRANSLATIONS = {
         "de": "Wird auch als Kundenkommentar im Frontend ausgegeben",
         "en": "Is also displayed as a customer comment in the frontend",
     },
+    "viur.shop.skeleton.shipping.free_shipping_threshold": {
+        "_hint": "bone free_shipping_threshold<NumericBone> in ShippingSkel in viur.shop",
+        "de": "Versandkostenfrei ab",
+        "en": "Free shipping from",
+    },
+    "viur.shop.skeleton.shipping.cost_tiers": {
+        "_hint": "bone cost_tiers<RecordBone> in ShippingSkel in viur.shop",
+        "de": "Versandkosten-Staffeln",
+        "en": "Shipping cost tiers",
+    },
     "viur.shop.skeleton.shipping.supplier": {
         "_hint": "bone supplier<SelectBone> in ShippingSkel in viur.shop",
         "de": "Lieferant",
@@ -887,6 +906,30 @@ TRANSLATIONS = {
         "en": "Zip code",
         "fr": "Code postal",
     },
+    "viur.shop.skeleton.shippingpreconditionrel.zip_code.tooltip": {
+        "de": "Postleitzahlen (12345), Präfixe (123*) oder Bereiche (10000..10999)",
+        "en": "Zip codes (12345), prefixes (123*) or ranges (10000..10999)",
+    },
+    "viur.shop.skeleton.shippingpreconditionrel.zip_code_exclude": {
+        "_hint": "bone zip_code_exclude<StringBone> in ShippingPreconditionRelSkel in viur.shop",
+        "de": "Ausgeschlossene Postleitzahlen",
+        "en": "Excluded zip codes",
+    },
+    "viur.shop.skeleton.shippingtierrel.measure": {
+        "_hint": "bone measure<SelectBone> in ShippingTierRelSkel in viur.shop",
+        "de": "Maßgröße",
+        "en": "Measure",
+    },
+    "viur.shop.skeleton.shippingtierrel.minimum": {
+        "_hint": "bone minimum<NumericBone> in ShippingTierRelSkel in viur.shop",
+        "de": "Ab",
+        "en": "From",
+    },
+    "viur.shop.skeleton.shippingtierrel.shipping_cost": {
+        "_hint": "bone shipping_cost<NumericBone> in ShippingTierRelSkel in viur.shop",
+        "de": "Versandkosten",
+        "en": "Shipping costs",
+    },
     "viur.shop.skeleton.vat.category": {
         "en": "Vat category",
         "de": "Steuersatz-Kategorie",
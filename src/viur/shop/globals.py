@@ -22,4 +22,4 @@ class Sentinel:
 SENTINEL: t.Final[Sentinel] = Sentinel()
 
 DEBUG_DISCOUNTS = ContextVar("DEBUG_DISCOUNTS", default=False)
-"""Print detailed discount evaluation for debugging"""
+"""Log the trace of each discount evaluation for debugging, see :mod:`viur.shop.services.tracing`"""
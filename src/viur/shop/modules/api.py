@@ -3,12 +3,14 @@ import typing as t  # noqa
 from google.protobuf.message import DecodeError
 
 import viur.shop.types.exceptions as e
+from viur import toolkit
 from viur.core import current, db, errors, exposed, force_post
 from viur.core.render.json.default import DefaultRender as JsonRenderer
 from viur.shop.modules.abstract import ShopModuleAbstract
-from viur.shop.skeletons import ShippingSkel
+from viur.shop.skeletons import ArticleAbstractSkel, ShippingSkel
 from viur.shop.types import *
 from ..globals import SENTINEL, SHOP_INSTANCE_VI, SHOP_LOGGER
+from ..services import DISCOUNT_TRACER
 
 if t.TYPE_CHECKING:
     from viur.shop import OrderSkel, SkeletonInstance_T
@@ -40,6 +42,27 @@ class Api(ShopModuleAbstract):
             raise errors.NotFound(f"{parent_cart_key} has no article with {article_key=}")
         return JsonResponse(res)
 
+    @exposed
+    def article_list(
+        self,
+        *,
+        country: str | None = None,
+        **kwargs,
+    ) -> JsonResponse[list[SkeletonInstance_T[ArticleAbstractSkel]]]:
+        """
+        List the listed articles of the shop
+
+        The cheapest shipping (``shop_shipping``) of the whole page is resolved
+        at once with :meth:`Shipping.choose_shipping_for_articles`.
+
+        :param country: Ignore the context and get shipping for this country.
+        """
+        query: db.Query = self.shop.article_skel().all().filter("shop_listed =", True)
+        query.mergeExternalFilter(kwargs)  # Allow more filtering, cursor, amount, ...
+        article_skels = query.fetch()
+        self.shop.shipping.choose_shipping_for_articles(article_skels, country=country)
+        return JsonResponse(article_skels)
+
     @exposed
     @force_post
     def article_add(
@@ -524,6 +547,31 @@ class Api(ShopModuleAbstract):
         cart_key = self._normalize_external_key(cart_key, "cart_key")
         return JsonResponse(self.shop.shipping.get_shipping_skels_for_cart(cart_key=cart_key))
 
+    # --- Debugging -----------------------------------------------------------
+
+    @exposed
+    def discount_trace(
+        self,
+        *,
+        discount_key: str | db.Key = None,
+        is_fulfilled: bool | None = None,
+        limit: int = 100,
+    ) -> JsonResponse[list[dict]]:
+        """
+        Lists the latest discount evaluations of this instance (root users only)
+
+        The traces are kept by each :class:`RingBufferSink` registered on the :data:`DISCOUNT_TRACER`.
+
+        :param discount_key: Only traces of this discount
+        :param is_fulfilled: Only traces with this result
+        :param limit: Maximum number of traces, the latest first
+        """
+        if not toolkit.user_has_access("root"):
+            raise errors.Unauthorized()
+        discount_key = self._normalize_external_key(discount_key, "discount_key", True)
+        traces = DISCOUNT_TRACER.query(discount_key=discount_key, is_fulfilled=is_fulfilled, limit=limit)
+        return JsonResponse([trace.as_dict() for trace in traces])
+
     # --- Internal helpers  ----------------------------------------------------
 
     def _normalize_external_key(
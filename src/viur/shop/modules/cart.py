@@ -1,3 +1,4 @@
+import collections
 import typing as t  # noqa
 
 import viur.shop.types.exceptions as e
@@ -210,8 +211,43 @@ class Cart(ShopModuleAbstract, Tree):
         cache[parent_cart_key] = children
         return children
 
+    def get_leafs_by_article(
+        self,
+        root_key: db.Key,
+    ) -> dict[db.Key, tuple[SkeletonInstance_T[CartItemSkel], ...]]:
+        """
+        Get all leafs of a root cart, grouped by the key of their article.
+
+        The tree is walked with :meth:`get_children_from_cache` and the result is cached
+        for the current request, so conditions can test the articles of a cart without a query.
+
+        :param root_key: Key of the root node of the cart.
+        """
+        cache = current.request_data.get().setdefault("shop_cache_cart_articles", {})
+        try:
+            return cache[root_key]
+        except KeyError:
+            pass
+        leafs = collections.defaultdict(list)
+        node_queue = collections.deque([root_key])
+        while node_queue:
+            for child in self.get_children_from_cache(node_queue.popleft()):
+                if issubclass(child.skeletonCls, self.nodeSkelCls):
+                    node_queue.append(child["key"])
+                elif child["article"]:
+                    leafs[child["article"]["dest"]["key"]].append(child)
+        cache[root_key] = result = {article_key: tuple(skels) for article_key, skels in leafs.items()}
+        return result
+
+    def get_article_keys(self, root_key: db.Key) -> frozenset[db.Key]:
+        """Get the keys of all articles in a root cart, cached for the current request"""
+        return frozenset(self.get_leafs_by_article(root_key))
+
     def clear_children_cache(self) -> None:
         current.request_data.get()["shop_cache_cart_children"] = {}
+        current.request_data.get()["shop_cache_cart_articles"] = {}
+        current.request_data.get()["shop_cache_cart_shipping"] = {}
+        CartPricing.clear_cache()
 
     # --- (internal) API methods ----------------------------------------------
 
@@ -314,6 +350,7 @@ class Cart(ShopModuleAbstract, Tree):
         if skel["quantity"] == 0:
             skel.delete()
             EVENT_SERVICE.call(Event.ARTICLE_CHANGED, skel=skel, deleted=True)
+            self.clear_children_cache()
             return None
         try:
             discount_type = parent_skel["discount"]["dest"]["discount_type"]
@@ -385,6 +422,7 @@ class Cart(ShopModuleAbstract, Tree):
         skel["parententry"] = new_parent_cart_key
         skel.write()
         EVENT_SERVICE.call(Event.ARTICLE_CHANGED, skel=skel, deleted=False)
+        self.clear_children_cache()
         return skel
 
     def cart_add(
@@ -530,6 +568,7 @@ class Cart(ShopModuleAbstract, Tree):
         # This delete could fail if the cart is used by an order
         skel.delete()
         self.deleteRecursive(cart_key)
+        self.clear_children_cache()
         if skel["parententry"] is None or skel["is_root_node"]:
             logger.info(f"{skel['key']} was a root node!")
             # raise NotImplementedError("Cannot delete root node")
@@ -694,6 +733,7 @@ class Cart(ShopModuleAbstract, Tree):
         leaf_skel["parententry"] = new_parent_skel["key"]
         leaf_skel.write()
         EVENT_SERVICE.call(Event.ARTICLE_CHANGED, skel=leaf_skel, deleted=False)
+        self.clear_children_cache()
         return new_parent_skel
 
 
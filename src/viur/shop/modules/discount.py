@@ -1,20 +1,37 @@
-import io
+import concurrent.futures
+import contextvars
+import dataclasses
+import time
 import typing as t  # noqa
+from datetime import datetime as dt, timedelta as td
 
-import cachetools
-
-from viur.core import db, errors
+from viur.core import current, db, errors, tasks, utils
 from viur.core.prototypes import List
 from viur.core.skeleton import SkeletonInstance
-from viur.shop import DEBUG_DISCOUNTS
 from viur.shop.types import *
 from .abstract import ShopModuleAbstract
 from ..globals import SHOP_LOGGER
+from ..services import DISCOUNT_TRACER, VersionStamp
 from ..skeletons import DiscountSkel
-from ..types.dc_scope import DiscountValidator
+from ..types.dc_catalog import AutomaticDiscountCatalog
+from ..types.dc_index import AutomaticDiscountIndex
+from ..types.dc_schedule import DiscountWindow
+from ..types.dc_scope import CompiledCondition, DiscountValidator, PREVALIDATION_OFFSET
 
 logger = SHOP_LOGGER.getChild(__name__)
 
+AUTOMATICALLY_DISCOUNTS_STAMP: t.Final[VersionStamp] = VersionStamp("automatically_discounts")
+"""Version of the automatically discounts catalog, bumped on every published rebuild"""
+
+BATCH_MAX_WORKERS: t.Final[int] = 8
+"""Default number of threads of :meth:`Discount.can_apply_batch`"""
+
+CATALOG_REBUILD_TIMEOUT: t.Final[td] = td(minutes=10)
+"""No further rebuild of the automatically discounts catalog is scheduled within this time"""
+
+CATALOG_EXPIRED_CHECK_INTERVAL: t.Final[float] = 60.0
+"""Seconds between the checks of an expired catalog for a newer build"""
+
 
 class Discount(ShopModuleAbstract, List):
     moduleName = "discount"
@@ -37,6 +54,28 @@ class Discount(ShopModuleAbstract, List):
         ]
         return admin_info
 
+    def onAdded(self, skel: SkeletonInstance):
+        super().onAdded(skel)
+        if skel["activate_automatically"]:
+            self.on_automatically_discounts_changed()
+
+    def onEdit(self, skel: SkeletonInstance):
+        super().onEdit(skel)
+        skel_old = self.viewSkel()
+        skel_old.read(skel["key"])
+        current.request_data.get()[f'shop_skel_{skel["key"]}'] = skel_old
+
+    def onEdited(self, skel: SkeletonInstance):
+        super().onEdited(skel)
+        skel_old = current.request_data.get().get(f'shop_skel_{skel["key"]}')
+        if skel["activate_automatically"] or (skel_old is not None and skel_old["activate_automatically"]):
+            self.on_automatically_discounts_changed()
+
+    def onDeleted(self, skel: SkeletonInstance):
+        super().onDeleted(skel)
+        if skel["activate_automatically"]:
+            self.on_automatically_discounts_changed()
+
     # --- Apply logic ---------------------------------------------------------
 
     def search(
@@ -57,6 +96,15 @@ class Discount(ShopModuleAbstract, List):
                 raise errors.NotFound
             return [skel]
         elif code is not None:
+            entry = self.shop.discount_condition.code_index.lookup(code)
+            if entry is None:  # Unknown code
+                raise errors.NotFound
+            elif entry is not False:
+                discount_skels = skel.all().filter("condition.dest.__key__ =", entry["condition_key"]).fetch(100)
+                logger.debug(f"{code = } yields <{len(discount_skels)}>{discount_skels = }")
+                return discount_skels
+            # The code index has not been built yet, use the queries
+            self.shop.discount_condition.ensure_code_index()
             # Get condition skel(s) with this code
             cond_skels = list(self.shop.discount_condition.get_by_code(code))
             logger.debug(f"{code = } yields <{len(cond_skels)}>{cond_skels = }")
@@ -143,15 +191,12 @@ class Discount(ShopModuleAbstract, List):
             all_leafs = []
             for cv in dv.condition_validator_instances:
                 if cv.is_fulfilled and cv.condition_skel["scope_article"]:
-                    leaf_skels = (
-                        self.shop.cart.viewSkel("leaf").all()
-                        .filter("parentrepo =", cart_key)
-                        .filter(
-                            "article.dest.__key__ IN",
-                            [article["dest"]["key"] for article in cv.condition_skel["scope_article"]]
-                        )
-                        .fetch()
-                    )
+                    leafs_by_article = self.shop.cart.get_leafs_by_article(cart_key)
+                    leaf_skels = [
+                        leaf_skel.clone()
+                        for article_key in {article["dest"]["key"] for article in cv.condition_skel["scope_article"]}
+                        for leaf_skel in leafs_by_article.get(article_key, ())
+                    ]
                     logger.debug(f"<{len(leaf_skels)}>{leaf_skels = }")
                     # if not leaf_skels:
                     #     raise errors.NotFound("expected article is missing on cart")
@@ -185,15 +230,25 @@ class Discount(ShopModuleAbstract, List):
         skel: SkeletonInstance_T[DiscountSkel],
         *,
         cart_key: db.Key | None = None,
+        cart_skel: SkeletonInstance_T[CartNodeSkel] | None = None,
         article_skel: SkeletonInstance | None = None,
         code: str | None = None,
         context: DiscountValidationContext = DiscountValidationContext.NORMAL,
+        live_conditions: frozenset[db.Key] = frozenset(),
     ) -> tuple[bool, DiscountValidator | None]:
+        """
+        Check if a discount can be applied.
+
+        :param cart_key: Key of the cart, which will be read.
+        :param cart_skel: The already read cart, replaces ``cart_key``.
+        """
         logger.debug(f"--- Calling can_apply() ---")
         logger.debug(f'{skel["name"] = } // {skel["description"] = }')
         # logger.debug(f"{skel = }")
 
-        if cart_key is None:
+        if cart_skel is not None:
+            cart = cart_skel
+        elif cart_key is None:
             cart = None
         else:
             cart = self.shop.cart.viewSkel("node")
@@ -204,32 +259,120 @@ class Discount(ShopModuleAbstract, List):
             logger.info(f"looking for not automatically, but is automatically discount")
             return False, None
 
+        start = time.perf_counter()
         dv = DiscountValidator()(
             cart_skel=cart, article_skel=article_skel,
             discount_skel=skel, code=code,
-            context=context,
+            context=context, live_conditions=live_conditions,
         )
         # logger.debug(f"{dv.is_fulfilled=} | {dv=}")
 
-        if DEBUG_DISCOUNTS.get():
-            # Use a buffer to make sure we write it on-block
-            buffer = io.StringIO()
-            print(f'Checking {skel["key"]!r} {skel["name"]}', file=buffer)
-            for cv in dv.condition_validator_instances:
-                code = f"{'+' if cv.is_fulfilled else '-'}"
-                print(f'  {code} {dv.__class__.__name__} : '
-                      f'{cv.condition_skel["key"]!r} {cv.condition_skel["name"]}', file=buffer)
-                for s in cv.scope_instances:
-                    code = f"{'+' if s.is_applicable else '-'}/{'+' if s.is_fulfilled else '-'}"
-                    print(f"    {code} {s.__class__.__name__} : {s.is_applicable=} | {s.is_fulfilled=}", file=buffer)
-            print(f">>> {dv.is_fulfilled=}", file=buffer)
-            print(buffer.getvalue(), end="", flush=True)
+        if DISCOUNT_TRACER.enabled:
+            DISCOUNT_TRACER.trace(dv, start)
 
         return dv.is_fulfilled, dv
 
-    @property
-    @cachetools.cached(cache=cachetools.TTLCache(maxsize=1024, ttl=3600))
-    def current_automatically_discounts(self) -> list[SkeletonInstance_T[DiscountSkel]]:
+    def can_apply_batch(
+        self,
+        discounts: t.Iterable[SkeletonInstance_T[DiscountSkel] | db.Key],
+        cart_keys: t.Iterable[db.Key],
+        *,
+        context: DiscountValidationContext = DiscountValidationContext.NORMAL,
+        max_workers: int = BATCH_MAX_WORKERS,
+    ) -> dict[db.Key, dict[db.Key, bool | None]]:
+        """
+        Check which discounts can be applied on which carts (e.g. on abandoned carts).
+
+        The discounts and the carts are read with one multi-get each, and the
+        conditions of all discounts are read and compiled once. The carts are
+        validated in a thread pool, each cart in a copy of the current context
+        with its own request data.
+
+        Carts are not related to their customer, so discounts limited to a customer
+        group can't be validated; they are None for all carts.
+
+        :param discounts: The discount skeletons or their keys.
+        :param cart_keys: Keys of the (root) carts.
+        :param max_workers: Number of threads.
+        :return: The applicability matrix as ``{discount_key: {cart_key: applicable}}``,
+            None for carts which don't exist or couldn't be validated.
+        """
+        discounts = list(discounts)
+        if discount_keys := [discount for discount in discounts if isinstance(discount, db.Key)]:
+            loaded = dict(zip(discount_keys, db.Get(discount_keys)))
+            discount_skels = []
+            for discount in discounts:
+                if not isinstance(discount, db.Key):
+                    discount_skels.append(discount)
+                elif (entity := loaded[discount]) is None:
+                    logger.warning(f"Discount {discount!r} does not exist")
+                else:
+                    discount_skels.append(skel := self.viewSkel())
+                    skel.setEntity(entity)
+        else:
+            discount_skels = discounts
+
+        cart_keys = list(dict.fromkeys(cart_keys))
+        cart_skels = {}
+        for cart_key, entity in zip(cart_keys, db.Get(cart_keys) if cart_keys else ()):
+            if entity is None:
+                logger.warning(f"Cart {cart_key!r} does not exist")
+                continue
+            cart_skels[cart_key] = skel = self.shop.cart.viewSkel("node")
+            skel.setEntity(entity)
+
+        # Warm the condition caches, so the validators of all threads share them
+        for condition_skel in self.shop.discount_condition.get_many(list(dict.fromkeys(
+            condition["dest"]["key"] for skel in discount_skels for condition in skel["condition"]
+        ))):
+            if condition_skel is not None:
+                CompiledCondition.get(condition_skel)
+
+        # The customer group would be the one of the current user, not of the customer of the cart
+        customer_group_dependent = {
+            discount_skel["key"]
+            for discount_skel in discount_skels
+            if any(
+                condition_skel is not None
+                and condition_skel["scope_customer_group"] not in (None, CustomerGroup.ALL)
+                for condition_skel in self.shop.discount_condition.get_many(
+                    condition["dest"]["key"] for condition in discount_skel["condition"]
+                )
+            )
+        }
+
+        def validate_cart(cart_skel: SkeletonInstance_T[CartNodeSkel]) -> dict[db.Key, bool | None]:
+            # The request caches (e.g. of the cart tree) must not be shared between the threads
+            current.request_data.set({})
+            results = {}
+            for discount_skel in discount_skels:
+                if discount_skel["key"] in customer_group_dependent:
+                    results[discount_skel["key"]] = None
+                    continue
+                try:
+                    results[discount_skel["key"]] = self.can_apply(
+                        discount_skel, cart_skel=cart_skel, context=context,
+                    )[0]
+                except Exception as exc:
+                    logger.exception(f'Failed to validate {discount_skel["key"]!r} on {cart_skel["key"]!r}: {exc}')
+                    results[discount_skel["key"]] = None
+            return results
+
+        matrix = {
+            discount_skel["key"]: dict.fromkeys(cart_keys)
+            for discount_skel in discount_skels
+        }
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(contextvars.copy_context().run, validate_cart, cart_skel): cart_key
+                for cart_key, cart_skel in cart_skels.items()
+            }
+            for future in concurrent.futures.as_completed(futures):
+                for discount_key, applicable in future.result().items():
+                    matrix[discount_key][futures[future]] = applicable
+        return matrix
+
+    def _prevalidate_automatically_discounts(self) -> list[SkeletonInstance_T[DiscountSkel]]:
         query = self.viewSkel().all().filter("activate_automatically =", True)
         discounts = []
         for skel in query.fetch(100):
@@ -240,6 +383,229 @@ class Discount(ShopModuleAbstract, List):
         logger.debug(f'current_automatically_discounts {discounts=}')
         return discounts
 
+    # --- Automatically discounts catalog -------------------------------------
+
+    _automatically_discounts_catalog: AutomaticDiscountCatalog | None = None
+    """The catalog of this instance"""
+
+    _automatically_discounts_catalog_checked_at: float = 0.0
+    """Last check of the expired catalog for a newer build (monotonic clock)"""
+
+    @property
+    def automatically_discounts_catalog_key(self) -> db.Key:
+        return db.Key(f"{self.shop.moduleName}_discount_catalog", "automatically")
+
+    @property
+    def automatically_discounts_catalog_rebuild_marker_key(self) -> db.Key:
+        return db.Key(f"{self.shop.moduleName}_discount_catalog", "automatically_rebuild")
+
+    @property
+    def current_automatically_discounts_catalog(self) -> AutomaticDiscountCatalog:
+        """
+        The catalog of the prevalidated automatically discounts.
+
+        The catalog is loaded again, if another version has been built in the meantime.
+        """
+        version = AUTOMATICALLY_DISCOUNTS_STAMP.current
+        catalog = Discount._automatically_discounts_catalog
+        if catalog is None or catalog.version != version:
+            catalog = Discount._automatically_discounts_catalog = self._load_automatically_discounts_catalog()
+            logger.debug(f"Loaded {catalog=}")
+        if catalog.is_expired:
+            catalog = self._renew_expired_automatically_discounts_catalog(catalog)
+        return catalog
+
+    def _renew_expired_automatically_discounts_catalog(
+        self,
+        catalog: AutomaticDiscountCatalog,
+    ) -> AutomaticDiscountCatalog:
+        """
+        Take over a newer build of an expired catalog or schedule a rebuild.
+
+        A rebuild with an unchanged set of discounts keeps the version and only
+        renews the ``built_at`` of the stored catalog, so this is checked at most
+        every :data:`CATALOG_EXPIRED_CHECK_INTERVAL` seconds.
+        """
+        now = time.monotonic()
+        if now - Discount._automatically_discounts_catalog_checked_at < CATALOG_EXPIRED_CHECK_INTERVAL:
+            return catalog
+        Discount._automatically_discounts_catalog_checked_at = now
+
+        entity = db.Get(self.automatically_discounts_catalog_key)
+        if entity and entity["version"] == catalog.version and entity["built_at"] > catalog.built_at:
+            catalog = dataclasses.replace(catalog, built_at=entity["built_at"])
+            Discount._automatically_discounts_catalog = catalog
+            logger.debug(f"Renewed {catalog=}")
+        if catalog.is_expired and self._claim_automatically_discounts_catalog_rebuild():
+            self.rebuild_automatically_discounts_catalog()
+        return catalog
+
+    def _claim_automatically_discounts_catalog_rebuild(self) -> bool:
+        """
+        Register a pending rebuild of the catalog.
+
+        The marker is stored in the datastore, so only one instance schedules
+        the rebuild. After :data:`CATALOG_REBUILD_TIMEOUT` (e.g. if the task failed)
+        it can be scheduled again.
+
+        :return: True, if no rebuild is pending and it must be scheduled now.
+        """
+
+        def txn(key: db.Key) -> bool:
+            entity = db.Get(key) or db.Entity(key)
+            now = utils.utcNow()
+            if entity.get("pending_until") and entity["pending_until"] > now:
+                return False
+            entity["pending_until"] = now + CATALOG_REBUILD_TIMEOUT
+            db.Put(entity)
+            return True
+
+        return db.RunInTransaction(txn, self.automatically_discounts_catalog_rebuild_marker_key)
+
+    def _load_automatically_discounts_catalog(self) -> AutomaticDiscountCatalog:
+        if not (entity := db.Get(self.automatically_discounts_catalog_key)):
+            # Not built yet, do it now in this request
+            discounts = self._prevalidate_automatically_discounts()
+            entity = self._write_automatically_discounts_catalog(
+                [skel["key"] for skel in discounts], AUTOMATICALLY_DISCOUNTS_STAMP.current,
+            )
+            return AutomaticDiscountCatalog(entity["version"], tuple(discounts), entity["built_at"])
+
+        discounts = []
+        for discount_entity in db.Get(entity["discount_keys"]) if entity["discount_keys"] else ():
+            if discount_entity is None:  # deleted in the meantime
+                continue
+            skel = self.viewSkel()
+            skel.setEntity(discount_entity)
+            discounts.append(skel)
+        return AutomaticDiscountCatalog(entity["version"], tuple(discounts), entity["built_at"])
+
+    def _write_automatically_discounts_catalog(self, discount_keys: list[db.Key], version: int) -> db.Entity:
+        entity = db.Entity(self.automatically_discounts_catalog_key)
+        entity["discount_keys"] = discount_keys
+        entity["version"] = version
+        entity["built_at"] = utils.utcNow()
+        db.Put(entity)
+        return entity
+
+    @tasks.CallDeferred
+    def rebuild_automatically_discounts_catalog(self, force: bool = False) -> None:
+        """
+        Prevalidate the automatically discounts and store the catalog.
+
+        If the set of discounts has changed (or ``force`` is set), a new version
+        is published and the persisted article prices are refreshed.
+
+        :param force: Publish a new version, even if the set of discounts is unchanged.
+        """
+        self.shop.discount_condition.clear_skel_cache()
+        discount_keys = [skel["key"] for skel in self._prevalidate_automatically_discounts()]
+
+        old_entity = db.Get(self.automatically_discounts_catalog_key)
+        if not force and old_entity and old_entity["discount_keys"] == discount_keys:
+            # Nothing changed, keep the version (and all caches based on it)
+            self._write_automatically_discounts_catalog(discount_keys, old_entity["version"])
+            return
+
+        version = AUTOMATICALLY_DISCOUNTS_STAMP.bump()
+        self._write_automatically_discounts_catalog(discount_keys, version)
+        logger.info(f"Published automatically discounts catalog {version=} with {len(discount_keys)} discounts")
+        if self.shop.persist_article_prices:
+            self.refresh_article_prices()
+
+    @property
+    def current_automatically_discounts(self) -> tuple[SkeletonInstance_T[DiscountSkel], ...]:
+        """The prevalidated automatically discounts of the current catalog, these must not be modified"""
+        return self.current_automatically_discounts_catalog.discounts
+
+    @property
+    def current_automatically_discounts_window(self) -> DiscountWindow:
+        """The automatically discounts which are live right now, swapped at each start and end date"""
+        return self.current_automatically_discounts_catalog.current_window
+
+    @property
+    def current_automatically_discounts_index(self) -> AutomaticDiscountIndex:
+        """Index of the live automatically discounts by their scopes."""
+        return self.current_automatically_discounts_window.index
+
+    def get_next_automatically_discounts_boundary(self, now: dt | None = None) -> dt:
+        """
+        Get the next point in time at which the set of live automatically discounts can change.
+
+        These are the upcoming ``scope_date_start`` and ``scope_date_end`` values of the conditions.
+        Discounts beyond the prevalidation period are unknown, so the result is never later than that.
+        """
+        if now is None:
+            now = utils.utcNow()
+        boundary = now + PREVALIDATION_OFFSET
+        if (next_boundary := self.current_automatically_discounts_catalog.schedule.next_boundary(now)) is not None:
+            boundary = min(boundary, next_boundary)
+        return boundary
+
+    # --- Persisted article prices --------------------------------------------
+
+    @property
+    def article_prices_refresh_marker_key(self) -> db.Key:
+        return db.Key(f"{self.shop.moduleName}_discount_catalog", "article_prices_refresh")
+
+    def _claim_article_prices_refresh(self, boundary: dt) -> bool:
+        """
+        Register a refresh of the article prices at this boundary.
+
+        The pending boundaries are stored in the datastore, so all instances schedule
+        each boundary only once. Past boundaries are removed.
+
+        :return: True, if the refresh has not been scheduled yet and must be scheduled now.
+        """
+
+        def txn(key: db.Key) -> bool:
+            entity = db.Get(key) or db.Entity(key)
+            now = utils.utcNow()
+            boundaries = [pending for pending in entity.get("boundaries") or () if pending > now]
+            if boundary in boundaries:
+                return False
+            entity["boundaries"] = boundaries + [boundary]
+            db.Put(entity)
+            return True
+
+        return db.RunInTransaction(txn, self.article_prices_refresh_marker_key)
+
+    def on_automatically_discounts_changed(self) -> None:
+        """Called after an automatically discount or one of its conditions has been changed"""
+        self.rebuild_automatically_discounts_catalog(force=True)
+
+    @tasks.CallDeferred
+    def refresh_article_prices(self, cursor: str | None = None) -> None:
+        """
+        Rewrite the ``shop_price_cached`` snapshot of all articles.
+
+        Runs in chunks, each chunk defers the next one. After the last chunk,
+        the next run is scheduled at the next boundary of the automatically discounts.
+        """
+        if not self.shop.persist_article_prices:
+            return
+        if cursor is None:
+            # Start with fresh discounts, this instance could have cached outdated ones
+            AUTOMATICALLY_DISCOUNTS_STAMP.invalidate()
+            self.shop.discount_condition.clear_skel_cache()
+
+        query = self.shop.article_skel().all().setCursor(cursor)
+        skels = query.fetch(100)
+        for skel in skels:
+            try:
+                skel.write(update_relations=False)
+            except Exception as exc:
+                logger.exception(f'Failed to refresh price of article {skel["key"]!r}: {exc}')
+
+        if skels and (cursor := query.getCursor()):
+            self.refresh_article_prices(cursor)
+            return
+
+        logger.info("Finished refresh of article prices")
+        boundary = self.get_next_automatically_discounts_boundary()
+        if self._claim_article_prices_refresh(boundary):
+            self.refresh_article_prices(_eta=boundary)
+
     def remove(
         self,
         discount_key: db.Key,
@@ -1,17 +1,20 @@
+import math
 import random
 import string
+import threading
+import time
 import typing as t
+from datetime import timedelta as td
 
-import cachetools
-
-from viur import toolkit
-from viur.core import current, db, tasks
+from viur.core import conf, current, db, tasks, utils
+from viur.core.bones import RelationalBone
+from viur.core.cache import flushCache
 from viur.core.prototypes import List
 from viur.core.skeleton import SkeletonInstance
 from .abstract import ShopModuleAbstract
 from ..globals import SHOP_INSTANCE, SHOP_LOGGER
-from ..services import Event, on_event
-from ..types import CodeType, SkeletonInstance_T
+from ..services import Event, ShardedCounter, StatsLRUCache, VersionStamp, on_event
+from ..types import CodeType, CompiledCondition, DiscountCodeIndex, ReadOnlySkeletonInstance, SkeletonInstance_T
 
 if t.TYPE_CHECKING:
     from ..skeletons import DiscountConditionSkel
@@ -22,6 +25,27 @@ CODE_CHARS = sorted(set(string.ascii_uppercase + string.digits).difference(set("
 CODE_LENGTH = 8
 SUFFIX_LENGTH = 6
 
+GENERATION_SHARD_SIZE: t.Final[int] = 1000
+"""Number of subcodes generated by one deferred task (shard)"""
+
+GENERATION_CHUNK_SIZE: t.Final[int] = 100
+"""Number of subcodes checked and indexed in one batch"""
+
+GENERATION_TIME_BUDGET: t.Final[float] = 8 * 60
+"""Seconds after which a shard continues in a new task"""
+
+CODE_INDEX_REBUILD_TIMEOUT: t.Final[td] = td(minutes=30)
+"""No further rebuild of the code index is scheduled within this time"""
+
+CODE_INDEX_REBUILD_CHECK_INTERVAL: t.Final[float] = 60.0
+"""Seconds between the attempts of an instance to schedule a rebuild of the code index"""
+
+QUANTITY_USED_COUNTER: t.Final[ShardedCounter] = ShardedCounter("quantity_used", "quantity_used")
+"""Usages of the conditions, rolled up periodically into ``quantity_used``"""
+
+CONDITION_STAMP: t.Final[VersionStamp] = VersionStamp("discount_condition")
+"""Version of the discount conditions, bumped on every edit and deletion"""
+
 
 class DiscountCondition(ShopModuleAbstract, List):
     moduleName = "discount_condition"
@@ -90,6 +114,10 @@ class DiscountCondition(ShopModuleAbstract, List):
         super().onEdited(skel)
         self.on_changed(skel, "edited")
 
+    def onDeleted(self, skel: SkeletonInstance):
+        super().onDeleted(skel)
+        self.on_changed(skel, "deleted")
+
     def on_change(self, skel, event: str):
         # logger.debug(pprint.pformat(skel, width=120))
         skel_old = self.viewSkel()
@@ -99,6 +127,18 @@ class DiscountCondition(ShopModuleAbstract, List):
 
     def on_changed(self, skel, event: str):
         # logger.debug(pprint.pformat(skel, width=120))
+        if event in {"edited", "deleted"}:
+            self.invalidate_skel(skel["key"])
+        self.update_code_index(skel, event)
+        if not skel["is_subcode"] and (
+            self.shop.discount.viewSkel().all()
+            .filter("condition.dest.__key__ =", skel["key"])
+            .filter("activate_automatically =", True)
+            .getSkel()
+        ) is not None:
+            self.shop.discount.on_automatically_discounts_changed()
+        if event == "deleted":
+            return
         if skel["code_type"] == CodeType.INDIVIDUAL and not skel["is_subcode"]:
             skel_old = current.request_data.get()[f'shop_skel_{skel["key"]}']
             query = self.viewSkel().all().filter("parent_code.dest.__key__ =", skel["key"])
@@ -110,53 +150,424 @@ class DiscountCondition(ShopModuleAbstract, List):
 
     @tasks.CallDeferred
     def generate_subcodes(self, parent_key: db.Key, prefix: str, amount: int):
-        """Generate subcodes for a parent individual code."""
-        chunk_amount = amount
-        while chunk_amount > 0:
-            skel = self.addSkel()  # .subskel("individual")
-            skel["is_subcode"] = True
-            skel["quantity_volume"] = 1
-            skel.setBoneValue("parent_code", parent_key)
-
-            _try = 1
-            while True:
-                skel["scope_code"] = "".join(
-                    (prefix, "".join(random.choice(CODE_CHARS) for _ in range(SUFFIX_LENGTH))))
+        """
+        Generate subcodes for a parent individual code.
 
-                try:
-                    self.onAdd(skel)
-                    skel.write()
-                    self.onAdded(skel)
-                    break
-                except ValueError as e:
-                    if "The unique value" in str(e):
-                        if _try == 30:
-                            logger.error(f"Try %d failed. Terminate generation.", _try)
-                            raise
-
-                        logger.error(f"Code %r is already forgiven. This was try: %d", skel["scope_code"], _try)
-                        _try += 1
-                    else:
-                        raise
-
-            chunk_amount -= 1
-
-            if amount - chunk_amount == 50:
-                self.generate_subcodes(parent_key, prefix, chunk_amount)
+        The generation is split into shards of :data:`GENERATION_SHARD_SIZE` codes,
+        which run as parallel deferred tasks. Use :meth:`get_generation_progress`
+        to track the progress.
+        """
+        shards = math.ceil(amount / GENERATION_SHARD_SIZE)
+        entity = db.Entity(self._generation_progress_key(parent_key))
+        entity["requested"] = amount
+        entity["shards"] = shards
+        entity["started_at"] = utils.utcNow()
+        db.Put(entity)
+        for shard in range(shards):
+            self.generate_subcodes_shard(
+                parent_key, prefix, min(GENERATION_SHARD_SIZE, amount - shard * GENERATION_SHARD_SIZE), shard,
+            )
+        logger.info(f"Started code generation of {amount} codes in {shards} shards for {parent_key} ({prefix=}).")
+
+    @tasks.CallDeferred
+    def generate_subcodes_shard(self, parent_key: db.Key, prefix: str, amount: int, shard: int, generated: int = 0):
+        """
+        Generate a shard of subcodes in chunks.
+
+        The codes of a chunk are created collision-free in memory and checked
+        in one batch, the subcodes and the index entries are written with one
+        multi-put each (see :meth:`_write_subcodes`).
+        The bloom filter of the code index is updated once per task, so parallel
+        shards don't compete for it after each chunk.
+        If the time budget of the task is used up, the shard continues in a new task.
+        """
+        started = time.monotonic()
+        codes = []
+        while generated < amount:
+            skels = []
+            for code in self._generate_unique_codes(prefix, min(GENERATION_CHUNK_SIZE, amount - generated)):
+                skel = self.addSkel()  # .subskel("individual")
+                skel["is_subcode"] = True
+                skel["quantity_volume"] = 1
+                skel.setBoneValue("parent_code", parent_key)
+                skel["scope_code"] = code
+                self.onAdd(skel)
+                skels.append(skel)
+            skels = self._write_subcodes(skels)
+            # Like onAdded, but the cache is flushed once per chunk, and the session of the task
+            # doesn't need to know the created keys
+            for skel in skels:
+                self.on_changed(skel, "added")
+            if skels:
+                flushCache(kind=skels[0].kindName)
+
+            entries = [(skel["scope_code"], parent_key, skel["key"]) for skel in skels]
+            self.code_index.write_entries(entries)
+            codes.extend(code for code, *_ in entries)
+            generated += len(entries)
+            self._write_generation_progress(parent_key, shard, generated)
+
+            if generated < amount and time.monotonic() - started > GENERATION_TIME_BUDGET:
+                self.code_index.update_filter(codes)
+                self.generate_subcodes_shard(parent_key, prefix, amount, shard, generated)
                 return
 
-        logger.info(f"Finished code generation for {parent_key} ({prefix=}).")
+        self.code_index.update_filter(codes)
+        logger.info(f"Finished shard {shard} of code generation for {parent_key} ({prefix=}).")
+
+    def _write_subcodes(self, skels: list[SkeletonInstance]) -> list[SkeletonInstance]:
+        """
+        Write new subcode skeletons in one transaction, instead of one transaction per skeleton.
+
+        This does what :meth:`viur.core.skeleton.Skeleton.write` does for a new entry (with
+        ``update_relations=False``), but with one multi-get of the unique locks of all codes
+        and one commit of the entities, their unique locks, blob locks and relation entries.
+        Codes which have been taken in the meantime (e.g. by a parallel shard) are skipped,
+        the next chunk replaces them. The ``onAdded`` hooks are run by the caller for the chunk.
+
+        :return: The written skeletons.
+        """
+        if not skels:
+            return []
+        kind_name = skels[0].kindName
+        keys = db.AllocateIDs([db.Key(kind_name) for _ in skels])
+        languages = conf.i18n.available_languages or [conf.i18n.default_language]
+        prepared = []
+        for skel, key in zip(skels, keys):
+            skel["key"] = key
+            skel.dbEntity = db.Entity(key)
+            skel.dbEntity["viur"] = {}
+            blobs = set()
+            lock_keys = []
+            for bone_name, bone in skel.items():
+                if bone_name == "key":
+                    continue
+                bone.performMagic(skel, bone_name, isAdd=True)
+                if not (bone_name in skel.accessedValues or bone.compute):
+                    _ = skel[bone_name]  # Ensure the datastore is filled with the default value
+                bone.serialize(skel, bone_name, True)
+                blobs.update(bone.getReferencedBlobs(skel, bone_name))
+                if bone.unique:
+                    values = bone.getUniquePropertyIndexValues(skel, bone_name)
+                    skel.dbEntity["viur"][f"{bone_name}_uniqueIndexValue"] = values
+                    lock_keys += [db.Key(f"{kind_name}_{bone_name}_uniquePropertyIndex", value) for value in values]
+
+            # Subcodes have no SEO keys, the key is used in all languages
+            seo_key = str(key.id_or_name)
+            skel.dbEntity["viur"]["viurCurrentSeoKeys"] = dict.fromkeys(languages, seo_key)
+            skel.dbEntity["viur"]["viurActiveSeoKeys"] = [seo_key]
+            skel.dbEntity["viur"]["viurLastRequestedSeoKeys"] = None
+            skel.dbEntity["viur"]["delayedUpdateTag"] = 0
+            skel.dbEntity = skel.preProcessSerializedData(skel.dbEntity)
+            for adapter in skel.database_adapters:
+                adapter.prewrite(skel, True, [])
+
+            blob_lock = db.Entity(db.Key("viur-blob-locks", key.id_or_name))
+            blob_lock["active_blob_references"] = list(skel.preProcessBlobLocks(blobs))
+            blob_lock["old_blob_references"] = []
+            blob_lock["has_old_blob_references"] = False
+            blob_lock["is_stale"] = False
+            entities = [skel.dbEntity, blob_lock, *self._make_relation_entities(skel)]
+            prepared.append((skel, lock_keys, entities))
+
+        def txn(prepared: list[tuple[SkeletonInstance, list[db.Key], list[db.Entity]]]) -> list[SkeletonInstance]:
+            all_lock_keys = [lock_key for _, lock_keys, _ in prepared for lock_key in lock_keys]
+            taken = {lock.key for lock in db.Get(all_lock_keys) if lock is not None} if all_lock_keys else set()
+            written = []
+            puts = []
+            for skel, lock_keys, entities in prepared:
+                if taken.intersection(lock_keys):
+                    logger.warning(f'Code {skel["scope_code"]!r} is already forgiven.')
+                    continue
+                for lock_key in lock_keys:
+                    lock = db.Entity(lock_key)
+                    lock["references"] = skel["key"].id_or_name
+                    puts.append(lock)
+                puts.extend(entities)
+                written.append(skel)
+            if puts:
+                db.Put(puts)
+            return written
+
+        written = db.RunInTransaction(txn, prepared)
+        for skel in written:
+            for bone_name, bone in skel.items():
+                if not isinstance(bone, RelationalBone):  # The relations have been written above
+                    bone.postSavedHandler(skel, bone_name, skel["key"])
+            skel.postSavedHandler(skel["key"], skel.dbEntity)
+            for adapter in skel.database_adapters:
+                adapter.write(skel, True, [])
+        return written
+
+    @staticmethod
+    def _make_relation_entities(skel: SkeletonInstance) -> list[db.Entity]:
+        """The ``viur-relations`` entries of the relational bones of a new entry, like their ``postSavedHandler``"""
+        entities = []
+        for bone_name, bone in skel.items():
+            if not isinstance(bone, RelationalBone) or not skel[bone_name]:
+                continue
+            if bone.multiple and bone.languages:
+                values = [value for values in skel[bone_name].values() for value in values]
+            elif bone.languages:
+                values = list(skel[bone_name].values())
+            elif bone.multiple:
+                values = skel[bone_name]
+            else:
+                values = [skel[bone_name]]
+            src = db.Entity()
+            src.key = skel.dbEntity.key
+            for name in bone.parentKeys or ():
+                if name != "key":
+                    src[name] = skel.dbEntity.get(name)
+            for value in values:
+                if value is None:
+                    continue
+                entity = db.Entity(db.Key("viur-relations", parent=skel["key"]))
+                entity["dest"] = value["dest"].serialize(parentIndexed=True)
+                entity["src"] = src
+                if bone.using is not None:
+                    entity["rel"] = value["rel"].serialize(parentIndexed=True)
+                entity["viur_delayed_update_tag"] = time.time()
+                entity["viur_src_kind"] = skel.kindName
+                entity["viur_src_property"] = bone_name
+                entity["viur_dest_kind"] = bone.kind
+                entity["viur_relational_updateLevel"] = bone.updateLevel.value
+                entity["viur_relational_consistency"] = bone.consistency.value
+                entity["viur_foreign_keys"] = list(bone._ref_keys)
+                entities.append(entity)
+        return entities
+
+    def _generate_unique_codes(self, prefix: str, amount: int) -> set[str]:
+        """Generate codes, which are not in use yet. Duplicates are rejected in memory, existing codes in batches."""
+        codes = set()
+        for _ in range(30):
+            while len(codes) < amount:
+                codes.add("".join((prefix, "".join(random.choice(CODE_CHARS) for _ in range(SUFFIX_LENGTH)))))
+            if not (taken := self._get_taken_codes(codes)):
+                return codes
+            logger.debug(f"{len(taken)} codes are already taken, generating new ones")
+            codes -= taken
+        raise ValueError(f"Failed to generate {amount} unique codes with {prefix=}")
+
+    def _get_taken_codes(self, codes: t.Iterable[str]) -> set[str]:
+        """Check which codes are already in use, with at most one multi-get"""
+        if (bloom := self.code_index.bloom) is not None:
+            # Only codes in the bloom filter can exist, everything else is free for sure
+            candidates = [code for code in codes if self.code_index.normalize(code) in bloom]
+            keys = [self.code_index.entry_key(code) for code in candidates]
+        else:
+            # The code index has not been built yet, use the unique locks of the scope_code bone
+            skel = self.addSkel()
+            candidates, keys = [], []
+            for code in codes:
+                skel["scope_code"] = code
+                for lock_value in skel.scope_code.getUniquePropertyIndexValues(skel, "scope_code"):
+                    candidates.append(code)
+                    keys.append(db.Key(f"{skel.kindName}_scope_code_uniquePropertyIndex", lock_value))
+        if not keys:
+            return set()
+        return {code for code, entity in zip(candidates, db.Get(keys)) if entity is not None}
+
+    def _generation_progress_key(self, parent_key: db.Key, shard: int | None = None) -> db.Key:
+        name = str(parent_key) if shard is None else f"{parent_key}-{shard}"
+        return db.Key(f"{self.shop.moduleName}_discount_code_generation", name)
+
+    def _write_generation_progress(self, parent_key: db.Key, shard: int, generated: int) -> None:
+        # Each shard has its own entity, so parallel shards don't compete for the same entity
+        entity = db.Entity(self._generation_progress_key(parent_key, shard))
+        entity["generated"] = generated
+        entity["updated_at"] = utils.utcNow()
+        db.Put(entity)
+
+    def get_generation_progress(self, parent_key: db.Key) -> dict[str, t.Any] | None:
+        """
+        Get the progress of the latest subcode generation of a condition.
+
+        :return: A dict with the amount of ``requested`` and ``generated`` codes, the number
+            of ``shards`` and the finished ones (``shards_finished``), or None if there was no generation.
+        """
+        if not (entity := db.Get(self._generation_progress_key(parent_key))):
+            return None
+        shard_entities = db.Get([self._generation_progress_key(parent_key, shard) for shard in range(entity["shards"])])
+        generated = [shard_entity["generated"] if shard_entity else 0 for shard_entity in shard_entities]
+        return {
+            "requested": entity["requested"],
+            "generated": sum(generated),
+            "shards": entity["shards"],
+            "shards_finished": sum(
+                value >= min(GENERATION_SHARD_SIZE, entity["requested"] - shard * GENERATION_SHARD_SIZE)
+                for shard, value in enumerate(generated)
+            ),
+            "started_at": entity["started_at"],
+        }
+
+    # --- Code index ----------------------------------------------------------
+
+    code_index: t.Final[DiscountCodeIndex] = DiscountCodeIndex()
+
+    _code_index_rebuild_checked_at: float = 0.0
+    """Last attempt to schedule a rebuild of the code index (monotonic clock)"""
+
+    @property
+    def code_index_rebuild_marker_key(self) -> db.Key:
+        return db.Key(f"{self.shop.moduleName}_discount_code_index", "rebuild")
+
+    def update_code_index(self, skel: SkeletonInstance, event: str) -> None:
+        """Keep the code index in sync with a changed condition (subcodes are added by :meth:`generate_subcodes`)"""
+        normalize = self.code_index.normalize
+        if event == "deleted":
+            old_code, new_code = skel["scope_code"], None
+        else:
+            skel_old = current.request_data.get().get(f'shop_skel_{skel["key"]}')
+            old_code = skel_old and skel_old["scope_code"]
+            new_code = None if skel["is_subcode"] else skel["scope_code"]
+        if old_code and normalize(old_code) != normalize(new_code or ""):
+            self.code_index.remove(old_code)
+        if new_code and normalize(new_code) != normalize(old_code or ""):
+            self.code_index.add([(new_code, skel["key"], skel["key"])])
+
+    def ensure_code_index(self) -> None:
+        """Schedule a rebuild of the code index, if it has not been built yet"""
+        if self.code_index.is_ready:
+            return
+        now = time.monotonic()
+        if now - DiscountCondition._code_index_rebuild_checked_at < CODE_INDEX_REBUILD_CHECK_INTERVAL:
+            return
+        DiscountCondition._code_index_rebuild_checked_at = now
+        if self._claim_code_index_rebuild():
+            self.rebuild_code_index()
+
+    def _claim_code_index_rebuild(self) -> bool:
+        """
+        Register a pending rebuild of the code index.
+
+        The marker is stored in the datastore, so only one instance schedules
+        the rebuild. After :data:`CODE_INDEX_REBUILD_TIMEOUT` (e.g. if the task failed)
+        it can be scheduled again.
+
+        :return: True, if no rebuild is pending and it must be scheduled now.
+        """
+
+        def txn(key: db.Key) -> bool:
+            entity = db.Get(key) or db.Entity(key)
+            now = utils.utcNow()
+            if entity.get("pending_until") and entity["pending_until"] > now:
+                return False
+            entity["pending_until"] = now + CODE_INDEX_REBUILD_TIMEOUT
+            db.Put(entity)
+            return True
+
+        return db.RunInTransaction(txn, self.code_index_rebuild_marker_key)
+
+    @tasks.CallDeferred
+    def rebuild_code_index(self, cursor: str | None = None, count: int = 0) -> None:
+        """
+        Write the index entries of all codes in chunks, afterward the bloom filter is built from these entries.
+
+        :param count: Number of the codes written by the previous chunks.
+        """
+        query = self.viewSkel().all().setCursor(cursor)
+        skels = query.fetch(100)
+        entries = [
+            (skel["scope_code"], skel["parent_code"]["dest"]["key"] if skel["is_subcode"] else skel["key"], skel["key"])
+            for skel in skels
+            if skel["scope_code"]
+        ]
+        self.code_index.write_entries(entries)
+        count += len(entries)
+        if skels and (cursor := query.getCursor()):
+            self.rebuild_code_index(cursor, count)
+            return
+
+        self.code_index.rebuild_filter(count)
+        db.Delete(self.code_index_rebuild_marker_key)
 
     # --- Helpers  ------------------------------------------------------------
 
+    _skel_cache: t.Final[StatsLRUCache] = StatsLRUCache(maxsize=4096)
+    """Instance-wide cache of the read-only condition skeletons (or None for non-existing keys)"""
+
+    _skel_cache_version: int | None = None
+    _skel_cache_lock: t.Final[threading.Lock] = threading.Lock()
+
     @classmethod
-    @cachetools.cached(cache=cachetools.TTLCache(maxsize=1024, ttl=3600))
-    def get_skel(cls, key: db.Key) -> SkeletonInstance_T["DiscountConditionSkel"] | None:
+    def get_skel(
+        cls,
+        key: db.Key,
+        *,
+        clone: bool = False,
+    ) -> SkeletonInstance_T["DiscountConditionSkel"] | None:
+        """
+        Get a condition skeleton from the cache.
+
+        :param clone: Return a copy, which can be modified.
+        :return: The shared read-only skeleton (or a copy), or None if it doesn't exist.
+        """
         # logger.debug(f"get_skel({key=})")
-        skel = SHOP_INSTANCE.get().discount_condition.viewSkel()
-        if not skel.read(key):
-            return None
-        return skel  # type: ignore
+        return cls.get_many([key], clone=clone)[0]
+
+    @classmethod
+    def get_many(
+        cls,
+        keys: t.Iterable[db.Key],
+        *,
+        clone: bool = False,
+    ) -> list[SkeletonInstance_T["DiscountConditionSkel"] | None]:
+        """
+        Get multiple condition skeletons from the cache, all missing ones are read in one multi-get.
+
+        :param clone: Return copies, which can be modified.
+        :return: The shared read-only skeleton (or a copy) of each key, or None if it doesn't exist,
+            in the order of the keys.
+        """
+        keys = list(keys)
+        cache = cls._skel_cache
+        version = CONDITION_STAMP.current
+        skels = {}
+        missing = []
+        with cls._skel_cache_lock:
+            if cls._skel_cache_version != version:
+                # Conditions have been changed on another instance
+                cache.invalidate()
+                cls._skel_cache_version = version
+            for key in keys:
+                try:
+                    skels[key] = cache[key]
+                except KeyError:
+                    missing.append(key)
+            cache.stats.hits += len(keys) - len(missing)
+            cache.stats.misses += len(missing)
+
+        if missing:
+            missing = list(dict.fromkeys(missing))
+            for key, entity in zip(missing, db.Get(missing)):
+                if entity is None:
+                    skel = None
+                else:
+                    skel = SHOP_INSTANCE.get().discount_condition.viewSkel()
+                    skel.setEntity(entity)
+                    ReadOnlySkeletonInstance.freeze(skel)
+                skels[key] = skel
+            with cls._skel_cache_lock:
+                for key in missing:
+                    cache[key] = skels[key]
+
+        if clone:
+            return [None if (skel := skels[key]) is None else skel.clone() for key in keys]
+        return [skels[key] for key in keys]
+
+    @classmethod
+    def invalidate_skel(cls, key: db.Key) -> None:
+        """Remove a changed condition from the caches of all instances"""
+        with cls._skel_cache_lock:
+            cls._skel_cache.invalidate(key)
+        CompiledCondition.invalidate(key)
+        CONDITION_STAMP.bump()
+
+    @classmethod
+    def clear_skel_cache(cls) -> None:
+        with cls._skel_cache_lock:
+            cls._skel_cache.invalidate()
 
     # --- Apply logic ---------------------------------------------------------
 
@@ -196,5 +607,18 @@ class DiscountCondition(ShopModuleAbstract, List):
             for condition in d_skel["condition"]:
                 # TODO: Increase only "active" conditions in case of OR operator
                 # cond_skel = toolkit.get_full_skel_from_ref_skel(condition["dest"])
-                res = toolkit.increase_counter(condition["dest"]["key"], "quantity_used", 1)
-                logger.debug(f"old value: {res = }")
+                QUANTITY_USED_COUNTER.increase(condition["dest"]["key"])
+
+    def get_quantity_used(self, condition_key: db.Key) -> int:
+        """
+        How often a condition has been used, including the usages not rolled up yet.
+
+        The value can be outdated by at most the staleness of :data:`QUANTITY_USED_COUNTER`.
+        """
+        return QUANTITY_USED_COUNTER.get(condition_key)
+
+
+@tasks.PeriodicTask(interval=td(minutes=5))
+def roll_up_quantity_used() -> None:
+    """Roll up the sharded usage counters into ``quantity_used`` of the conditions"""
+    QUANTITY_USED_COUNTER.roll_up_all()
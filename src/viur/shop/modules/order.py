@@ -10,7 +10,7 @@ from viur.shop.types.results import PaymentProviderResult
 from .abstract import ShopModuleAbstract
 from ..globals import SENTINEL, SHOP_LOGGER
 from ..payment_providers import PaymentProviderAbstract
-from ..services import EVENT_SERVICE, Event, HOOK_SERVICE, Hook
+from ..services import EVENT_SERVICE, Event, HOOK_SERVICE, Hook, on_event
 from ..skeletons.order import OrderSkel
 from ..types import exceptions as e
 
@@ -530,6 +530,41 @@ class Order(ShopModuleAbstract, List):
             raise e.TooManyArgumentsException(f"{self}.order_update", *kwargs.keys())
         return skel
 
+    # --- Customer group ------------------------------------------------------
+
+    def user_has_ordered(self, user_skel: "SkeletonInstance") -> bool:
+        """
+        Check if a user has at least one order (customer group follow-up order).
+
+        The status is cached in the ``shop_has_ordered`` bone of the user, so usually
+        this is a lookup in the current user. It's set by :meth:`mark_user_has_ordered`.
+        """
+        if (has_ordered := user_skel["shop_has_ordered"]) is not None:
+            return has_ordered
+        # Unknown yet (user existed before), count once and store the result
+        has_ordered = (
+            self.viewSkel().all()
+            .filter("customer.dest.__key__ =", user_skel["key"])
+            .filter("is_ordered =", True)
+            .count(1)
+        ) > 0
+
+        def set_if_unknown(entity: db.Entity) -> None:
+            if entity.get("shop_has_ordered") is None:
+                entity["shop_has_ordered"] = has_ordered
+
+        toolkit.set_status(key=user_skel["key"], values=set_if_unknown)
+        user_skel["shop_has_ordered"] = has_ordered
+        return has_ordered
+
+    @on_event(Event.ORDER_ORDERED)
+    @staticmethod
+    def mark_user_has_ordered(order_skel: "SkeletonInstance", payment: t.Any) -> None:
+        """Set the customer group status of the ordering user"""
+        if not order_skel["customer"]:  # guest order
+            return
+        toolkit.set_status(key=order_skel["customer"]["dest"]["key"], values={"shop_has_ordered": True})
+
     # --- Internal helpers  ----------------------------------------------------
 
     def get_payment_provider_by_name(
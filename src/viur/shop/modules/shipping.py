@@ -1,18 +1,32 @@
+import bisect
 import collections
-import itertools
+import threading
 import typing as t
 
 from viur.core import db, errors
 from viur.core.prototypes import List
-from viur.core.skeleton import RefSkel
-from viur.shop.skeletons import ArticleAbstractSkel, CartNodeSkel, ShippingSkel
-from viur.shop.types import SkeletonInstance_T
+from viur.core.skeleton import RefSkel, RelSkel, SkeletonInstance
+from viur.shop.skeletons import ArticleAbstractSkel, CartItemSkel, CartNodeSkel, ShippingConfigSkel, ShippingSkel
+from viur.shop.types import ShippingCostEngine, SkeletonInstance_T
 from .abstract import ShopModuleAbstract
 from .. import SENTINEL
 from ..globals import SHOP_LOGGER
+from ..services import StatsLRUCache, VersionStamp
+from ..types.response import make_json_dumpable
+from ..types.exceptions import DispatchError
+from ..types.zip_rules import ZipCodeRules
 
 logger = SHOP_LOGGER.getChild(__name__)
 
+SHIPPING_STAMP: t.Final[VersionStamp] = VersionStamp("shipping")
+"""Version of the shippings and shipping configs, bumped on every change"""
+
+ResolutionKey: t.TypeAlias = tuple[tuple[db.Key, ...], str | None, str | None, int]
+"""Key of a resolved shipping set: (sorted shipping config keys, country, zip code, minimum order value bucket)"""
+
+Resolution: t.TypeAlias = tuple[tuple[db.Key, int, db.Key], ...]
+"""The applicable shippings of a resolution as (shipping config key, position in its shipping bone, shipping key)"""
+
 
 class Shipping(ShopModuleAbstract, List):
     moduleName = "shipping"
@@ -23,6 +37,18 @@ class Shipping(ShopModuleAbstract, List):
         admin_info["icon"] = "truck"
         return admin_info
 
+    def onAdded(self, skel: SkeletonInstance):
+        super().onAdded(skel)
+        SHIPPING_STAMP.bump()
+
+    def onEdited(self, skel: SkeletonInstance):
+        super().onEdited(skel)
+        SHIPPING_STAMP.bump()
+
+    def onDeleted(self, skel: SkeletonInstance):
+        super().onDeleted(skel)
+        SHIPPING_STAMP.bump()
+
     def choose_shipping_skel_for_article(
         self,
         article_skel: SkeletonInstance_T[ArticleAbstractSkel],
@@ -42,14 +68,15 @@ class Shipping(ShopModuleAbstract, List):
             logger.debug(f'{article_skel["key"]} has no shop_shipping_config set.')  # TODO: fallback??
             return None
 
-        shipping_config_skel = article_skel["shop_shipping_config"]["dest"]
+        shipping_config_skel = self.get_shipping_config(article_skel["shop_shipping_config"]["dest"])
         # logger.debug(f"{shipping_config_skel=}")
 
+        catalog = self.shop.shipping_config.catalog
         applicable_shippings = []
-        for shipping in shipping_config_skel["shipping"]:
+        for pos, shipping in enumerate(shipping_config_skel["shipping"]):
             is_applicable, reason = self.shop.shipping_config.is_applicable(
                 shipping["dest"], shipping["rel"], article_skel=article_skel,
-                country=country)
+                country=country, zip_rules=catalog.get_zip_rules(shipping_config_skel["key"], pos))
             # logger.debug(f"{shipping=} --> {is_applicable=} | {reason=}")
             if is_applicable:
                 applicable_shippings.append(shipping)
@@ -63,6 +90,135 @@ class Shipping(ShopModuleAbstract, List):
         # logger.debug(f"{cheapest_shipping=}")
         return cheapest_shipping
 
+    def choose_shipping_for_articles(
+        self,
+        articles: t.Iterable[SkeletonInstance_T[ArticleAbstractSkel]],
+        country: str | None = None,
+        *,
+        prime: bool = True,
+    ) -> dict[db.Key, SkeletonInstance_T[ShippingSkel] | None | t.Literal[False]]:
+        """
+        Chooses the cheapest, applicable shipping for many articles (e.g. of a listing)
+
+        The articles are grouped by their shipping config and by the bucket of their price
+        (the number of distinct minimum order values it reaches). Since nothing else of
+        an article is relevant for the shipping preconditions, each group is resolved once.
+
+        :meth:`Api.article_list` uses this for its pages. Projects rendering the articles
+        in their own module should call it on the fetched page before rendering,
+        e.g. in an overwritten ``list``::
+
+            skellist = query.fetch()
+            SHOP_INSTANCE.get().shipping.choose_shipping_for_articles(skellist)
+            return self.render.list(skellist)
+
+        :param country: Ignore the context and get shipping for this country.
+        :param prime: Set the computed ``shop_shipping`` bone of the articles,
+            so it's not computed again while rendering.
+        :return: The result of :meth:`choose_shipping_skel_for_article` per article key.
+        """
+        articles = list(articles)
+        results = {}
+        groups: dict[tuple[db.Key, int], list[SkeletonInstance_T[ArticleAbstractSkel]]] = {}
+        thresholds: dict[db.Key, list[float]] = {}
+        for article_skel in articles:
+            if not article_skel["shop_shipping_config"]:
+                results[article_skel["key"]] = None
+                continue
+            shipping_config_skel = self.get_shipping_config(article_skel["shop_shipping_config"]["dest"])
+            shipping_config_key = shipping_config_skel["key"]
+            if shipping_config_key not in thresholds:
+                thresholds[shipping_config_key] = self._get_minimum_order_values(
+                    shipping["rel"] for shipping in shipping_config_skel["shipping"] or []
+                )
+            bucket = 0
+            if thresholds[shipping_config_key]:
+                bucket = bisect.bisect_right(thresholds[shipping_config_key], article_skel.shop_price_.current or 0)
+            groups.setdefault((shipping_config_key, bucket), []).append(article_skel)
+
+        for article_skels in groups.values():
+            cheapest_shipping = self.choose_shipping_skel_for_article(article_skels[0], country=country)
+            for article_skel in article_skels:
+                results[article_skel["key"]] = cheapest_shipping
+        logger.debug(f"Resolved the shippings of {len(results)} articles in {len(groups)} groups")
+
+        if prime:
+            for article_skel in articles:
+                article_skel.accessedValues["shop_shipping"] = make_json_dumpable(results[article_skel["key"]])
+
+        return results
+
+    def get_shipping_value_for_article(
+        self,
+        article_skel: SkeletonInstance_T[ArticleAbstractSkel],
+        *,
+        country: str | None = None,
+    ) -> dict[str, t.Any] | None | t.Literal[False]:
+        """
+        Get the cheapest shipping for an article in its JSON-serialized form (e.g. for computed bones)
+
+        Like :meth:`choose_shipping_skel_for_article`, but memoized instance-wide
+        per (shipping config key, country, price bucket) until a shipping (config) is changed.
+        The returned value is shared and must not be modified.
+
+        :param country: Ignore the context and get shipping for this country.
+        """
+        if not article_skel["shop_shipping_config"]:
+            return None
+
+        shipping_config_skel = self.get_shipping_config(article_skel["shop_shipping_config"]["dest"])
+        rels = [shipping["rel"] for shipping in shipping_config_skel["shipping"] or []]
+        bucket = 0
+        if thresholds := self._get_minimum_order_values(rels):
+            bucket = bisect.bisect_right(thresholds, article_skel.shop_price_.current or 0)
+        use_country = country
+        if not any(rel["country"] for rel in rels):
+            use_country = None
+        elif use_country is None:
+            try:
+                use_country = self.shop.shipping_config.get_current_country("article")
+            except DispatchError:
+                pass  # The country shippings are not applicable, like without a country
+        key = (shipping_config_skel["key"], use_country, bucket)
+
+        cache = Shipping._article_shipping_cache
+        version = SHIPPING_STAMP.current
+        with Shipping._article_shipping_cache_lock:
+            if Shipping._article_shipping_cache_version != version:
+                # Shippings have been changed on another instance
+                cache.invalidate()
+                Shipping._article_shipping_cache_version = version
+            try:
+                value = cache[key]
+            except KeyError:
+                cache.stats.misses += 1
+            else:
+                cache.stats.hits += 1
+                return value
+
+        value = make_json_dumpable(self.choose_shipping_skel_for_article(article_skel, country=country))
+        with Shipping._article_shipping_cache_lock:
+            # Don't store an outdated value, if the shippings have been changed in the meantime
+            if Shipping._article_shipping_cache_version == version:
+                cache[key] = value
+        return value
+
+    def get_shipping_config(self, shipping_config: RefSkel) -> SkeletonInstance_T[ShippingConfigSkel] | RefSkel:
+        """
+        Get the current shipping config of a relation from the catalog.
+
+        The (maybe outdated) copy in the relation is only used, if the config isn't in the catalog (yet).
+        """
+        if (skel := self.shop.shipping_config.catalog.get_shipping_config(shipping_config["key"])) is None:
+            logger.warning(f'{shipping_config["key"]!r} is not in the shipping catalog')
+            return shipping_config
+        return skel
+
+    @staticmethod
+    def _get_minimum_order_values(rels: t.Iterable[RelSkel]) -> list[float]:
+        """The distinct minimum order values of the shipping preconditions, ascending"""
+        return sorted({rel["minimum_order_value"] for rel in rels if rel["minimum_order_value"]})
+
     def get_shipping_skels_for_cart(
         self,
         *,
@@ -70,13 +226,22 @@ class Shipping(ShopModuleAbstract, List):
         cart_skel: SkeletonInstance_T[CartNodeSkel] = SENTINEL,
         country: str | None = None,
         use_cache: bool = False,
+        cheapest: bool = False,
     ) -> list[SkeletonInstance_T[ShippingSkel]]:
         """Get all configured and applicable shippings of all items in the cart
 
         # TODO: how do we handle free shipping discounts?
 
+        The applicable shippings are cached instance-wide by the shipping configs,
+        the country, the zip code and the bucket of the cart total
+        (see :meth:`_get_resolution_key`) until a shipping (config) is changed.
+        The ``shipping_cost`` of shippings with tiers or a free shipping threshold
+        is calculated for the leafs of this cart (see :mod:`viur.shop.types.shipping_cost`).
+
         :param cart_key: Key of the parent cart node, can be a sub-cart too
         :param country: Ignore the context and get shipping for this country.
+        :param cheapest: Return only the cheapest shipping per supplier needed
+            to deliver the cart (see :meth:`ShippingCostEngine.select_cheapest`).
         :return: A list of :class:`SkeletonInstance`s for the :class:`ShippingSkel`.
         """
         if not ((cart_key is SENTINEL) ^ (cart_skel is SENTINEL)):
@@ -95,6 +260,7 @@ class Shipping(ShopModuleAbstract, List):
             get_children = self.shop.cart.get_children
 
         all_shipping_configs: list[RefSkel] = []
+        leafs: dict[db.Key, list[SkeletonInstance_T[CartItemSkel]]] = {}
         # Walk down the entire cart tree and collect leafs in
         # `all_shipping_configs` and add nodes to the `node_queue`.
         node_queue = collections.deque([cart_key])
@@ -102,51 +268,188 @@ class Shipping(ShopModuleAbstract, List):
             for child in get_children(node_queue.pop()):
                 if issubclass(child.skeletonCls, CartNodeSkel):
                     node_queue.append(child["key"])
-                elif child.article_skel["shop_shipping_config"] is not None:
-                    all_shipping_configs.append(child.article_skel["shop_shipping_config"]["dest"])
+                elif (shipping_config := child.article_skel["shop_shipping_config"]) is not None:
+                    all_shipping_configs.append(shipping_config["dest"])
+                    leafs.setdefault(shipping_config["dest"]["key"], []).append(child)
 
-        # logger.debug(f"(before de-duplication) <{len(all_shipping_configs)}>{all_shipping_configs=}")
         # eliminate duplicates
-        all_shipping_configs = list(({sc["key"]: sc for sc in all_shipping_configs}).values())
-        # logger.debug(f"(after de-duplication) <{len(all_shipping_configs)}>{all_shipping_configs=}")
+        shipping_configs = {sc["key"]: sc for sc in all_shipping_configs}
+        shipping_configs = {key: self.get_shipping_config(sc) for key, sc in shipping_configs.items()}
 
-        if not all_shipping_configs:
+        if not shipping_configs:
             logger.debug(f'{cart_key=!r}\'s articles have no shop_shipping_config set.')  # TODO: fallback??
             return []
 
-        all_shipping = itertools.chain.from_iterable(
-            shipping_config_skel["shipping"] or []
-            for shipping_config_skel in all_shipping_configs
-        )
+        assert cart_skel is not None
+        shipping_address = cart_skel and cart_skel["shipping_address"] and cart_skel["shipping_address"]["dest"]
+        resolution_key = self._get_resolution_key(shipping_configs, cart_skel, shipping_address, country)
+        version, resolution = self._get_cached_resolution(resolution_key)
+        shippings = None
+        if resolution is not None:
+            try:
+                shippings = self._get_resolved_shippings(shipping_configs, resolution)
+            except (IndexError, KeyError, TypeError):
+                # The cart contains an outdated copy of a shipping config
+                logger.debug(f"Cached {resolution=} does not match the shipping configs of {cart_key=!r}")
+
+        if shippings is None:
+            resolution = self._resolve_shippings(shipping_configs, cart_skel, shipping_address, country)
+            self._store_resolution(resolution_key, resolution, version)
+            shippings = self._get_resolved_shippings(shipping_configs, resolution)
 
-        applicable_shippings: list[SkeletonInstance_T[ShippingSkel]] = []
-        for shipping in all_shipping:
-            is_applicable, reason = self.shop.shipping_config.is_applicable(
-                shipping["dest"], shipping["rel"], cart_skel=cart_skel,
-                country=country)
-            # logger.debug(f"{shipping=} --> {is_applicable=} | {reason=}")
-            if is_applicable:
-                applicable_shippings.append(shipping)
+        engine = ShippingCostEngine(self.shop.shipping_config.catalog.cost_tables, leafs)
+        shippings = engine.apply(shipping_configs, shippings)
+        if cheapest:
+            return engine.select_cheapest(shipping_configs, shippings)
+        return shippings
+
+    def _resolve_shippings(
+        self,
+        shipping_configs: dict[db.Key, RefSkel],
+        cart_skel: SkeletonInstance_T[CartNodeSkel],
+        shipping_address: SkeletonInstance | None,
+        country: str | None,
+    ) -> Resolution:
+        """Run the applicability checks of all shippings of the shipping configs"""
+        catalog = self.shop.shipping_config.catalog
+        applicable_shippings: list[tuple[tuple[db.Key, int, db.Key], dict]] = []
+        for shipping_config_key, shipping_config_skel in shipping_configs.items():
+            for pos, shipping in enumerate(shipping_config_skel["shipping"] or []):
+                is_applicable, reason = self.shop.shipping_config.is_applicable(
+                    shipping["dest"], shipping["rel"], cart_skel=cart_skel,
+                    country=country, zip_rules=catalog.get_zip_rules(shipping_config_key, pos))
+                # logger.debug(f"{shipping=} --> {is_applicable=} | {reason=}")
+                if is_applicable:
+                    applicable_shippings.append(((shipping_config_key, pos, shipping["dest"]["key"]), shipping))
 
-        # This is a workaround since we does not have a zip_code exclude list. # TODO
         # If we found any shipping for only the current zip code, we show only shippings with zip_codes.
-        assert cart_skel is not None
-        shipping_address = cart_skel and cart_skel["shipping_address"] and cart_skel["shipping_address"]["dest"]
+        # Shippings which are not available for some zip codes should rather use the zip_code_exclude list.
         has_zip_shipping = []
         if shipping_address:
-            for shipping in applicable_shippings:
+            for position, shipping in applicable_shippings:
                 rel = shipping["rel"]
-                if rel["zip_code"] and shipping_address["zip_code"] in rel["zip_code"]:
-                    has_zip_shipping.append(shipping)
+                if not rel["zip_code"]:
+                    continue
+                if (zip_rules := catalog.get_zip_rules(*position[:2])) is None:
+                    zip_rules = ZipCodeRules.of(rel)
+                if zip_rules.include.matches(shipping_address["zip_code"]):
+                    has_zip_shipping.append(position)
 
         if has_zip_shipping:
             logger.debug(f"Found {len(has_zip_shipping)} special zip shippings, return only these!")
-            return has_zip_shipping
+            return tuple(has_zip_shipping)
 
         # logger.debug(f"<{len(applicable_shippings)}>{applicable_shippings=}")
         if not applicable_shippings:
             logger.error("No suitable shipping found")  # TODO: fallback??
-            return []
+            return ()
+
+        # The costs are calculated per supplier by the ShippingCostEngine
+        return tuple(position for position, _ in applicable_shippings)
+
+    # --- Resolution cache ----------------------------------------------------
+
+    _resolution_cache: t.Final[StatsLRUCache] = StatsLRUCache(maxsize=4096)
+    """Instance-wide cache of the resolved shippings by :data:`ResolutionKey`"""
+
+    _resolution_cache_version: int | None = None
+    _resolution_cache_lock: t.Final[threading.Lock] = threading.Lock()
+
+    def _get_resolution_key(
+        self,
+        shipping_configs: dict[db.Key, RefSkel],
+        cart_skel: SkeletonInstance_T[CartNodeSkel],
+        shipping_address: SkeletonInstance | None,
+        country: str | None,
+    ) -> ResolutionKey:
+        """
+        Get the key of everything the applicability of the shippings depends on.
+
+        The country and the zip code are only part of the key if any shipping
+        is restricted by them. The cart total is reduced to its bucket, the number
+        of distinct minimum order values it reaches.
+        """
+        rels = [
+            shipping["rel"]
+            for shipping_config_skel in shipping_configs.values()
+            for shipping in shipping_config_skel["shipping"] or []
+        ]
+
+        if not any(rel["country"] for rel in rels):
+            country = None
+        elif country is None:
+            if shipping_address:
+                country = shipping_address["country"]
+            else:
+                try:
+                    country = self.shop.shipping_config.get_current_country("cart")
+                except DispatchError:
+                    pass  # The country shippings are not applicable, like without a country
+
+        zip_code = None
+        if shipping_address and any(rel["zip_code"] or rel["zip_code_exclude"] for rel in rels):
+            zip_code = shipping_address["zip_code"]
+
+        bucket = 0
+        if thresholds := self._get_minimum_order_values(rels):
+            bucket = bisect.bisect_right(thresholds, cart_skel["total_raw"])
+
+        return tuple(sorted(shipping_configs, key=str)), country, zip_code, bucket
+
+    @classmethod
+    def _get_cached_resolution(cls, key: ResolutionKey) -> tuple[int, Resolution | None]:
+        """Get a cached resolution (or None) and the version of the cache"""
+        cache = cls._resolution_cache
+        version = SHIPPING_STAMP.current
+        with cls._resolution_cache_lock:
+            if cls._resolution_cache_version != version:
+                # Shippings have been changed on another instance
+                cache.invalidate()
+                cls._resolution_cache_version = version
+            try:
+                resolution = cache[key]
+            except KeyError:
+                cache.stats.misses += 1
+                return version, None
+            cache.stats.hits += 1
+            return version, resolution
+
+    @classmethod
+    def _store_resolution(cls, key: ResolutionKey, resolution: Resolution, version: int) -> None:
+        """Cache a resolution, unless the shippings have been changed since its computation started"""
+        with cls._resolution_cache_lock:
+            if cls._resolution_cache_version == version:
+                cls._resolution_cache[key] = resolution
+
+    @staticmethod
+    def _get_resolved_shippings(shipping_configs: dict[db.Key, RefSkel], resolution: Resolution) -> list[dict]:
+        """
+        Get the shippings of a resolution from the shipping configs.
+
+        :raises KeyError: If a position refers to another shipping, e.g. in an outdated copy of a shipping config.
+        """
+        shippings = []
+        for shipping_config_key, pos, shipping_key in resolution:
+            shipping = shipping_configs[shipping_config_key]["shipping"][pos]
+            if shipping["dest"]["key"] != shipping_key:
+                raise KeyError(shipping_key)
+            shippings.append(shipping)
+        return shippings
+
+    @classmethod
+    def clear_resolution_cache(cls) -> None:
+        with cls._resolution_cache_lock:
+            cls._resolution_cache.invalidate()
+
+    # --- Article shipping cache ----------------------------------------------
+
+    _article_shipping_cache: t.Final[StatsLRUCache] = StatsLRUCache(maxsize=4096)
+    """Instance-wide cache of the serialized cheapest shipping by (shipping config key, country, price bucket)"""
+
+    _article_shipping_cache_version: int | None = None
+    _article_shipping_cache_lock: t.Final[threading.Lock] = threading.Lock()
 
-        # TODO(discuss): cheapest of each supplier?
-        return applicable_shippings
+    @classmethod
+    def clear_article_shipping_cache(cls) -> None:
+        with cls._article_shipping_cache_lock:
+            cls._article_shipping_cache.invalidate()
@@ -1,13 +1,19 @@
 import logging
+import threading
+import typing as t  # noqa
 
+from viur.core import current, db
 from viur.core.prototypes import List
-from viur.core.skeleton import RefSkel, RelSkel
-from viur.shop.skeletons import ArticleAbstractSkel, CartNodeSkel
+from viur.core.skeleton import RefSkel, RelSkel, SkeletonInstance
+from viur.shop.skeletons import ArticleAbstractSkel, CartNodeSkel, ShippingConfigSkel
 from viur.shop.types import SkeletonInstance_T
 from .abstract import ShopModuleAbstract
+from .shipping import SHIPPING_STAMP
 from ..globals import SHOP_LOGGER
 from ..services import HOOK_SERVICE, Hook
 from ..types.exceptions import DispatchError
+from ..types.shipping_catalog import ShippingCatalog
+from ..types.zip_rules import ZipCodeRules
 
 logger = SHOP_LOGGER.getChild(__name__)
 
@@ -21,6 +27,18 @@ class ShippingConfig(ShopModuleAbstract, List):
         admin_info["icon"] = "truck-flatbed"
         return admin_info
 
+    def onAdded(self, skel: SkeletonInstance):
+        super().onAdded(skel)
+        SHIPPING_STAMP.bump()
+
+    def onEdited(self, skel: SkeletonInstance):
+        super().onEdited(skel)
+        SHIPPING_STAMP.bump()
+
+    def onDeleted(self, skel: SkeletonInstance):
+        super().onDeleted(skel)
+        SHIPPING_STAMP.bump()
+
     def is_applicable(
         self,
         dest: RefSkel,
@@ -29,6 +47,7 @@ class ShippingConfig(ShopModuleAbstract, List):
         article_skel: SkeletonInstance_T[ArticleAbstractSkel] | None = None,
         cart_skel: SkeletonInstance_T[CartNodeSkel] | None = None,
         country: str | None = None,
+        zip_rules: ZipCodeRules | None = None,
     ) -> tuple[bool, str]:
         """
         Check if a shipping configuration is applicable in the current context.
@@ -37,6 +56,8 @@ class ShippingConfig(ShopModuleAbstract, List):
         xor `cart_skel` for cart context.
 
         :param country: If provided, check if the shipping configuration is applicable for this country.
+        :param zip_rules: The compiled zip code rules of the rel (see :meth:`ShippingCatalog.get_zip_rules`),
+            compiled on demand if not provided.
         """
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug(f'is_applicable({dest=}, {rel=}, '
@@ -62,7 +83,7 @@ class ShippingConfig(ShopModuleAbstract, List):
                 use_country = country
             elif article_skel is not None:
                 try:
-                    use_country = HOOK_SERVICE.dispatch(Hook.CURRENT_COUNTRY)("article")
+                    use_country = self.get_current_country("article")
                 except DispatchError:
                     logger.info("NOTE: This error can be eliminated by providing "
                                 "a `Hook.CURRENT_COUNTRY` customization.")
@@ -71,7 +92,7 @@ class ShippingConfig(ShopModuleAbstract, List):
                 use_country = shipping_address["country"]
             elif cart_skel is not None and not shipping_address:
                 try:
-                    use_country = HOOK_SERVICE.dispatch(Hook.CURRENT_COUNTRY)("cart")
+                    use_country = self.get_current_country("cart")
                 except DispatchError:
                     logger.info("NOTE: This error can be eliminated by providing "
                                 "a `Hook.CURRENT_COUNTRY` customization.")
@@ -80,13 +101,85 @@ class ShippingConfig(ShopModuleAbstract, List):
             if use_country not in rel["country"]:
                 return False, f'{use_country=} not in {rel["country"]=}'
 
+        if zip_rules is None and (rel["zip_code"] or rel["zip_code_exclude"]):
+            zip_rules = ZipCodeRules.of(rel)
+
         if rel["zip_code"]:
             if article_skel is not None:
                 return False, "cannot apply zip_code on article_skel"
             elif cart_skel is not None and not shipping_address:
                 return False, "cannot apply zip_code on cart_skel without shipping_address"
             elif cart_skel is not None:
-                if shipping_address["zip_code"] not in rel["zip_code"]:
+                if not zip_rules.include.matches(shipping_address["zip_code"]):
                     return False, f'{shipping_address["zip_code"]=} not in {rel["zip_code"]=}'
 
+        # Without a shipping_address, a zip code can't be excluded yet
+        if rel["zip_code_exclude"] and shipping_address:
+            if zip_rules.exclude.matches(shipping_address["zip_code"]):
+                return False, f'{shipping_address["zip_code"]=} in {rel["zip_code_exclude"]=}'
+
         return True, ""
+
+    # --- Request-local memoization -------------------------------------------
+
+    @property
+    def _request_cache(self) -> dict[str, t.Any]:
+        if current.request_data.get() is None:
+            return {}
+        return current.request_data.get().setdefault("viur.shop", {}).setdefault("shipping_config_cache", {})
+
+    def get_current_country(self, context: t.Literal["article", "cart"]) -> str:
+        """
+        Get the current country, the hook is dispatched only once per request and context.
+
+        :raises DispatchError: If there's no ``Hook.CURRENT_COUNTRY`` customization.
+        """
+        cache = self._request_cache.setdefault("country", {})
+        try:
+            country = cache[context]
+        except KeyError:
+            try:
+                country = HOOK_SERVICE.dispatch(Hook.CURRENT_COUNTRY)(context)
+            except DispatchError as exc:
+                country = exc
+            cache[context] = country
+        if isinstance(country, DispatchError):
+            raise country
+        return country
+
+    # --- Shipping catalog ----------------------------------------------------
+
+    _catalog: ShippingCatalog | None = None
+    """The catalog of this instance"""
+
+    _catalog_lock: t.Final[threading.Lock] = threading.Lock()
+
+    @property
+    def catalog(self) -> ShippingCatalog:
+        """
+        The catalog of all shippings and shipping configs.
+
+        The catalog is loaded again, if a shipping (config) has been changed in the meantime.
+        """
+        version = SHIPPING_STAMP.current
+        if (catalog := ShippingConfig._catalog) is None or catalog.version != version:
+            with ShippingConfig._catalog_lock:
+                if (catalog := ShippingConfig._catalog) is None or catalog.version != version:
+                    catalog = ShippingConfig._catalog = self._load_catalog(version)
+                    logger.debug(f"Loaded {catalog=}")
+        return catalog
+
+    def _load_catalog(self, version: int) -> ShippingCatalog:
+        def load(module: List, migrate: t.Callable[[db.Entity], db.Entity] = lambda entity: entity):
+            skels = {}
+            for entity in db.Query(module.viewSkel().kindName).iter():
+                skel = module.viewSkel()
+                skel.setEntity(migrate(entity))
+                skels[skel["key"]] = ShippingCatalog.freeze(skel)
+            return skels
+
+        return ShippingCatalog(
+            version=version,
+            shippings=load(self.shop.shipping),
+            shipping_configs=load(self, ShippingConfigSkel.migrate_entity),
+        )
@@ -1,14 +1,20 @@
 import functools
+import typing as t  # noqa
 
+from viur.core import current
 from viur.core.prototypes import List
+from viur.core.skeleton import SkeletonInstance
 from .abstract import ShopModuleAbstract
 from ..globals import SHOP_LOGGER
-from ..services import HOOK_SERVICE, Hook
+from ..services import HOOK_SERVICE, Hook, VersionStamp
 from ..types import VatRateCategory
 from ..types.exceptions import ConfigurationError
 
 logger = SHOP_LOGGER.getChild(__name__)
 
+VAT_RATE_STAMP: t.Final[VersionStamp] = VersionStamp("vat_rate")
+"""Version of the vat rate configuration, bumped on every change"""
+
 
 class VatRate(ShopModuleAbstract, List):
     moduleName = "vat_rate"
@@ -21,27 +27,49 @@ class VatRate(ShopModuleAbstract, List):
         admin_info["icon"] = "cash-stack"
         return admin_info
 
-    @functools.cached_property
-    def vat_rates(self):
-        """Cache the vat rates
-
-        Since this configuration will not change much,
-        we cache the whole thing persistently within the instance.
-        So after changing the VAT rates, the instance would have to be
-        restarted -- or someone would have to create a pull request
-        with an alternative solution.
-        """
-        return {
-            skel["country"]: {
-                cfg["category"]: cfg["percentage"]
-                for cfg in skel["configuration"]
-            }
-            for skel in self.viewSkel().all().fetch(100)
-        }
+    def onAdded(self, skel: SkeletonInstance):
+        super().onAdded(skel)
+        VAT_RATE_STAMP.bump()
+
+    def onEdited(self, skel: SkeletonInstance):
+        super().onEdited(skel)
+        VAT_RATE_STAMP.bump()
+
+    def onDeleted(self, skel: SkeletonInstance):
+        super().onDeleted(skel)
+        VAT_RATE_STAMP.bump()
+
+    # --- VAT rate table ------------------------------------------------------
+
+    _vat_rate_table: tuple[int, dict[tuple[str, VatRateCategory], float], frozenset[str]] | None = None
+    """The cached (version, (country, category) -> rate, configured countries) of all instances"""
 
     @functools.cached_property
-    def _vat_skel(self):
-        return self.viewSkel()
+    def valid_countries(self) -> frozenset[str]:
+        """All country codes of the country bone, these never change at runtime"""
+        return frozenset(self.viewSkel().country.values)
+
+    def _get_vat_rate_table(self) -> tuple[dict[tuple[str, VatRateCategory], float], frozenset[str]]:
+        """Get the (country, category) -> rate table and the configured countries, rebuilt if outdated"""
+        version = VAT_RATE_STAMP.current
+        if (table := VatRate._vat_rate_table) is None or table[0] != version:
+            rates = {}
+            countries = set()
+            for skel in self.viewSkel().all().fetch(100):
+                countries.add(skel["country"])
+                for cfg in skel["configuration"]:
+                    rates[(skel["country"], cfg["category"])] = cfg["percentage"]
+            VatRate._vat_rate_table = table = (version, rates, frozenset(countries))
+            logger.debug(f"Built vat rate table {version=} with {len(rates)} rates")
+        return table[1], table[2]
+
+    @property
+    def vat_rates(self) -> dict[str, dict[VatRateCategory, float]]:
+        """The vat rates per country and category"""
+        vat_rates = {}
+        for (country, category), percentage in self._get_vat_rate_table()[0].items():
+            vat_rates.setdefault(country, {})[category] = percentage
+        return vat_rates
 
     def get_vat_rate_for_country(
         self,
@@ -53,14 +81,49 @@ class VatRate(ShopModuleAbstract, List):
         if not isinstance(category, VatRateCategory):
             raise TypeError(f"{category!r} is not a VatRateCategory")
         if country is None:
-            country = HOOK_SERVICE.dispatch(Hook.CURRENT_COUNTRY)("vat_rate")
-        if country not in self._vat_skel.country.values:
+            country = self.get_current_country()
+        rates, countries = self._get_vat_rate_table()
+        try:
+            return rates[(country, category)]
+        except KeyError:
+            pass
+        if country not in self.valid_countries:
             raise ValueError(f"Invalid country code {country}")
-        if country not in self.vat_rates:
+        if country not in countries:
             raise ConfigurationError(f"VatRate Skeleton missing for {country=}")
+        if category == VatRateCategory.ZERO:
+            return 0.0
+        raise ConfigurationError(f"VatRate configuration missing for {country=} and {category=}")
+
+    # --- Request-local memoization -------------------------------------------
+
+    @property
+    def _request_cache(self) -> dict[str, t.Any]:
+        if current.request_data.get() is None:
+            return {}
+        return current.request_data.get().setdefault("viur.shop", {}).setdefault("vat_rate_cache", {})
+
+    def get_current_country(self) -> str:
+        """Get the current country, the hook is dispatched only once per request"""
+        cache = self._request_cache
+        try:
+            return cache["country"]
+        except KeyError:
+            pass
+        cache["country"] = country = HOOK_SERVICE.dispatch(Hook.CURRENT_COUNTRY)("vat_rate")
+        return country
+
+    def get_vat_rate_for_current_country(self, category: VatRateCategory) -> float:
+        """
+        Get the configured vat rate percentage for the current country.
+
+        The rate is memoized per (country, category) for the current request.
+        """
+        country = self.get_current_country()
+        rates = self._request_cache.setdefault("rates", {})
         try:
-            return self.vat_rates[country][category]
+            return rates[(country, category)]
         except KeyError:
-            if category == VatRateCategory.ZERO:
-                return 0.0
-            raise ConfigurationError(f"VatRate configuration missing for {country=} and {category=}")
+            pass
+        rates[(country, category)] = rate = self.get_vat_rate_for_country(country=country, category=category)
+        return rate
@@ -1,7 +1,19 @@
+from .cache import CacheStats, StatsLRUCache, VersionStamp
+from .counter import ShardedCounter
 from .events import EVENT_SERVICE, Event, EventService, on_event
 from .hooks import Customization, HOOK_SERVICE, Hook, HookService
+from .tracing import (
+    ConditionTrace, DISCOUNT_TRACER, DiscountTrace, DiscountTracer, JsonLinesSink, LoggerSink,
+    RingBufferSink, ScopeTrace, TraceSink,
+)
 
 __all__ = [
+    # .cache
+    "CacheStats",
+    "StatsLRUCache",
+    "VersionStamp",
+    # .counter
+    "ShardedCounter",
     # .event
     "EVENT_SERVICE",
     "Event",
@@ -12,4 +24,14 @@ __all__ = [
     "HOOK_SERVICE",
     "Hook",
     "HookService",
+    # .tracing
+    "ConditionTrace",
+    "DISCOUNT_TRACER",
+    "DiscountTrace",
+    "DiscountTracer",
+    "JsonLinesSink",
+    "LoggerSink",
+    "RingBufferSink",
+    "ScopeTrace",
+    "TraceSink",
 ]
@@ -0,0 +1,178 @@
+"""
+Cache Invalidation Module
+=========================
+
+Some configurations (like the VAT rates) change rarely, but are read on
+nearly every request. Caching them in the instance memory is cheap, but an
+instance would not notice if the configuration was changed on another instance.
+
+A :class:`VersionStamp` is a version number of such a resource, stored in the
+datastore. Modules bump the stamp after each change of the resource, and
+caches compare the stamp they were built with against the current stamp.
+The stamp is read at most once per request and once per ``check_interval``,
+so an outdated cache is noticed on every instance after a short delay.
+
+Usage
+-----
+
+.. code-block:: python
+
+   from viur.shop.services import VersionStamp
+
+   STAMP = VersionStamp("my_config")
+
+   def get_config():
+       global _cache
+       if _cache is None or _cache[0] != STAMP.current:
+           _cache = (STAMP.current, build_config())
+       return _cache[1]
+
+   def on_config_changed():
+       STAMP.bump()
+
+For instance-local caches with metrics, use :class:`StatsLRUCache`, which
+counts its hits, misses and evictions in :class:`CacheStats`.
+"""
+
+import dataclasses
+import time
+import typing as t  # noqa
+
+import cachetools
+
+from viur.core import current, db
+from ..globals import SHOP_INSTANCE, SHOP_LOGGER
+
+logger = SHOP_LOGGER.getChild(__name__)
+
+
+class VersionStamp:
+    """
+    A version number of a cached resource, shared via the datastore across all instances.
+
+    :param name: Unique name of the resource.
+    :param check_interval: Minimum number of seconds between two reads of the stamp
+        in the same instance.
+    """
+
+    __slots__ = ("name", "check_interval", "_version", "_checked_at")
+
+    def __init__(self, name: str, *, check_interval: float = 10.0):
+        super().__init__()
+        self.name: str = name
+        self.check_interval: float = check_interval
+        self._version: int = 0
+        self._checked_at: float | None = None
+
+    @property
+    def kind(self) -> str:
+        """The datastore kind of the stamps, prefixed with the name of the shop module"""
+        return f"{SHOP_INSTANCE.get().moduleName}_version_stamp"
+
+    @property
+    def key(self) -> db.Key:
+        return db.Key(self.kind, self.name)
+
+    @property
+    def _request_cache(self) -> dict[str, int]:
+        if current.request_data.get() is None:
+            return {}
+        return current.request_data.get().setdefault("viur.shop", {}).setdefault("version_stamps", {})
+
+    @property
+    def current(self) -> int:
+        """The current version, read from the datastore if the local copy is outdated"""
+        try:
+            return self._request_cache[self.name]
+        except KeyError:
+            pass
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            self._version = self._read()
+            self._checked_at = now
+        self._request_cache[self.name] = self._version
+        return self._version
+
+    def _read(self) -> int:
+        entity = db.Get(self.key)
+        return entity["version"] if entity else 0
+
+    def invalidate(self) -> None:
+        """Forget the local copy, the next access reads the stamp from the datastore"""
+        self._checked_at = None
+        self._request_cache.pop(self.name, None)
+
+    def bump(self) -> int:
+        """
+        Increase the version, all caches based on this stamp become outdated.
+
+        :return: The new version.
+        """
+
+        def txn(key: db.Key) -> int:
+            entity = db.Get(key) or db.Entity(key)
+            entity["version"] = (entity.get("version") or 0) + 1
+            db.Put(entity)
+            return entity["version"]
+
+        self._version = db.RunInTransaction(txn, self.key)
+        self._checked_at = time.monotonic()
+        self._request_cache[self.name] = self._version
+        logger.debug(f"Bumped {self!r}")
+        return self._version
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} {self.name!r} at version {self._version}>"
+
+
+@dataclasses.dataclass(slots=True)
+class CacheStats:
+    """Counters of a cache"""
+
+    hits: int = 0
+    """Number of lookups served from the cache"""
+
+    misses: int = 0
+    """Number of lookups which had to be loaded"""
+
+    evictions: int = 0
+    """Number of entries removed because the cache was full"""
+
+    invalidations: int = 0
+    """Number of entries removed because they were outdated"""
+
+    @property
+    def hit_ratio(self) -> float:
+        """Ratio of hits to all lookups (0.0 - 1.0)"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def reset(self) -> None:
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+
+class StatsLRUCache(cachetools.LRUCache):
+    """
+    A :class:`cachetools.LRUCache` which counts evictions and invalidations.
+
+    Hits and misses must be counted by the caller via :attr:`stats`,
+    since the cache cannot distinguish a lookup from a membership test.
+    """
+
+    def __init__(self, maxsize: int, getsizeof: t.Callable[[t.Any], int] | None = None):
+        super().__init__(maxsize, getsizeof)
+        self.stats: CacheStats = CacheStats()
+
+    def popitem(self) -> tuple[t.Any, t.Any]:
+        item = super().popitem()
+        self.stats.evictions += 1
+        return item
+
+    def invalidate(self, key: t.Any = None) -> None:
+        """Remove an entry, or all entries if no key is given"""
+        if key is None:
+            self.stats.invalidations += len(self)
+            self.clear()
+        elif key in self:
+            del self[key]
+            self.stats.invalidations += 1
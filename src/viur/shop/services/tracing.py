@@ -0,0 +1,311 @@
+"""
+Discount Tracing Module
+=======================
+
+This module records how discounts were evaluated: the result and wall time
+of each discount, each of its conditions and each scope of a condition.
+
+A :class:`DiscountTrace` is emitted into all sinks registered on the
+:data:`DISCOUNT_TRACER`. Without a registered sink (and without
+:data:`viur.shop.globals.DEBUG_DISCOUNTS`) the tracer is disabled,
+and the discount evaluation does not build any trace.
+
+Sinks
+-----
+
+- :class:`LoggerSink`: Writes a tree of the evaluation into a logger.
+- :class:`RingBufferSink`: Keeps the latest traces in memory, they can be
+  queried with :meth:`DiscountTracer.query` (or via the ``discount_trace``
+  endpoint of the :class:`viur.shop.modules.api.Api` for root users).
+- :class:`JsonLinesSink`: Writes one JSON document per trace into a stream or file.
+
+Usage
+-----
+
+.. code-block:: python
+
+   from viur.shop.services import DISCOUNT_TRACER, RingBufferSink
+
+   DISCOUNT_TRACER.add_sink(RingBufferSink(maxlen=500))
+
+   DISCOUNT_TRACER.query(discount_key=discount_key, limit=10)
+"""
+
+import abc
+import collections
+import dataclasses
+import io
+import json
+import logging
+import threading
+import time
+import typing as t  # noqa
+
+from viur.core import db
+from ..globals import DEBUG_DISCOUNTS, SHOP_LOGGER
+
+if t.TYPE_CHECKING:
+    from ..types.dc_scope import ConditionValidator, DiscountConditionScope, DiscountValidator
+
+logger = SHOP_LOGGER.getChild(__name__)
+
+
+# --- Records -----------------------------------------------------------------
+
+@dataclasses.dataclass(slots=True)
+class ScopeTrace:
+    """Result of a :class:`viur.shop.types.dc_scope.DiscountConditionScope`"""
+
+    name: str
+    """Class name of the scope"""
+
+    is_applicable: bool | None
+    """Whether the precondition of the scope was met"""
+
+    is_fulfilled: bool | None
+    """The result, None if the scope was not evaluated (not applicable or skipped by a previous scope)"""
+
+    seconds: float | None
+    """Wall time of the evaluation, None if not evaluated"""
+
+
+@dataclasses.dataclass(slots=True)
+class ConditionTrace:
+    """Result of a :class:`viur.shop.types.dc_scope.ConditionValidator`"""
+
+    key: db.Key | None
+    name: str | None
+
+    is_fulfilled: bool | None
+    """The result, None if the condition was not evaluated (skipped by the condition operator)"""
+
+    seconds: float
+    """Wall time of all evaluated scopes"""
+
+    scopes: list[ScopeTrace] = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass(slots=True)
+class DiscountTrace:
+    """Result of a :class:`viur.shop.types.dc_scope.DiscountValidator`"""
+
+    key: db.Key | None
+    name: str | None
+    context: str | None
+    """The :class:`viur.shop.types.enums.DiscountValidationContext` of the evaluation"""
+
+    is_fulfilled: bool
+    seconds: float
+    """Wall time of the whole evaluation (including loading the conditions)"""
+
+    cart_key: db.Key | None = None
+    article_key: db.Key | None = None
+    code: str | None = None
+    timestamp: float = dataclasses.field(default_factory=time.time)
+    """Unix timestamp of the trace"""
+
+    conditions: list[ConditionTrace] = dataclasses.field(default_factory=list)
+
+    def as_dict(self) -> dict[str, t.Any]:
+        return dataclasses.asdict(self)
+
+    def format(self) -> str:
+        """A tree of the evaluation, with one line per discount, condition and scope"""
+
+        def flag(value: bool | None) -> str:
+            return "?" if value is None else "+" if value else "-"
+
+        buffer = io.StringIO()
+        print(f"{flag(self.is_fulfilled)} Discount {self.key!r} {self.name} "
+              f"[{self.context}] in {self.seconds * 1000:.2f}ms", file=buffer)
+        for condition in self.conditions:
+            print(f"  {flag(condition.is_fulfilled)} Condition {condition.key!r} {condition.name} "
+                  f"in {condition.seconds * 1000:.2f}ms", file=buffer)
+            for scope in condition.scopes:
+                seconds = "-" if scope.seconds is None else f"{scope.seconds * 1000:.2f}ms"
+                print(f"    {flag(scope.is_applicable)}/{flag(scope.is_fulfilled)} {scope.name} in {seconds}",
+                      file=buffer)
+        return buffer.getvalue().rstrip("\n")
+
+
+def _json_default(value: t.Any) -> t.Any:
+    if isinstance(value, db.Key):
+        return value.to_legacy_urlsafe().decode("ASCII")
+    return str(value)
+
+
+# --- Sinks -------------------------------------------------------------------
+
+class TraceSink(abc.ABC):
+    """A target of the discount traces"""
+
+    @abc.abstractmethod
+    def emit(self, trace: DiscountTrace) -> None:
+        ...
+
+
+class LoggerSink(TraceSink):
+    """Writes each trace as a tree into a logger"""
+
+    def __init__(self, logger_: logging.Logger | None = None, level: int = logging.DEBUG):
+        super().__init__()
+        self.logger: logging.Logger = logger_ or logger
+        self.level: int = level
+
+    def emit(self, trace: DiscountTrace) -> None:
+        self.logger.log(self.level, trace.format())
+
+
+class RingBufferSink(TraceSink):
+    """Keeps the latest ``maxlen`` traces in the memory of the instance"""
+
+    def __init__(self, maxlen: int = 1000):
+        super().__init__()
+        self.traces: collections.deque[DiscountTrace] = collections.deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def emit(self, trace: DiscountTrace) -> None:
+        with self._lock:
+            self.traces.append(trace)
+
+    def query(
+        self,
+        *,
+        discount_key: db.Key | None = None,
+        is_fulfilled: bool | None = None,
+        limit: int | None = None,
+    ) -> list[DiscountTrace]:
+        """Get the traces matching the filters, the latest first"""
+        with self._lock:
+            traces = list(reversed(self.traces))
+        result = [
+            trace for trace in traces
+            if (discount_key is None or trace.key == discount_key)
+            and (is_fulfilled is None or trace.is_fulfilled == is_fulfilled)
+        ]
+        return result[:limit]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.traces.clear()
+
+
+class JsonLinesSink(TraceSink):
+    """
+    Writes each trace as one line of JSON.
+
+    :param target: An opened text stream or the path of a file to append to.
+    """
+
+    def __init__(self, target: t.TextIO | str):
+        super().__init__()
+        self.target: t.TextIO | str = target
+        self._lock = threading.Lock()
+
+    def emit(self, trace: DiscountTrace) -> None:
+        line = json.dumps(trace.as_dict(), default=_json_default)
+        with self._lock:
+            if isinstance(self.target, str):
+                with open(self.target, "a", encoding="utf-8") as fh:
+                    fh.write(line + "\n")
+            else:
+                self.target.write(line + "\n")
+                self.target.flush()
+
+
+# --- Tracer ------------------------------------------------------------------
+
+class DiscountTracer:
+    """Builds the traces of discount evaluations and emits them into the registered sinks"""
+
+    def __init__(self):
+        super().__init__()
+        self.sinks: list[TraceSink] = []
+        self.debug_sink: TraceSink = LoggerSink(level=logging.INFO)
+        """Sink used while :data:`viur.shop.globals.DEBUG_DISCOUNTS` is set"""
+
+    def add_sink(self, sink: TraceSink) -> TraceSink:
+        self.sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink: TraceSink) -> None:
+        self.sinks.remove(sink)
+
+    @property
+    def enabled(self) -> bool:
+        """Whether traces should be built at all, check it before calling :meth:`trace`"""
+        return bool(self.sinks) or DEBUG_DISCOUNTS.get()
+
+    def trace(self, validator: "DiscountValidator", started_at: float) -> DiscountTrace:
+        """
+        Evaluate a discount validator, build its trace and emit it.
+
+        Besides the result of the validator, only the results of conditions and
+        scopes which were evaluated by the validator are recorded.
+
+        :param validator: The validator to trace.
+        :param started_at: :func:`time.perf_counter` value at the start of the evaluation.
+        """
+        is_fulfilled = validator.is_fulfilled
+        seconds = time.perf_counter() - started_at
+        discount_skel = validator.discount_skel
+        trace = DiscountTrace(
+            key=discount_skel["key"] if discount_skel else None,
+            name=discount_skel["name"] if discount_skel else None,
+            context=validator.context.name if validator.context else None,
+            is_fulfilled=is_fulfilled,
+            seconds=seconds,
+            cart_key=validator.cart_skel["key"] if validator.cart_skel else None,
+            article_key=validator.article_skel["key"] if validator.article_skel else None,
+            code=validator.code or None,
+            conditions=[
+                self._trace_condition(cv)
+                for cv in validator.condition_validator_instances
+                if cv is not None
+            ],
+        )
+        for sink in self.sinks:
+            self._emit(sink, trace)
+        if DEBUG_DISCOUNTS.get():
+            self._emit(self.debug_sink, trace)
+        return trace
+
+    def _trace_condition(self, cv: "ConditionValidator") -> ConditionTrace:
+        scopes = [self._trace_scope(scope) for scope in cv.scope_instances]
+        return ConditionTrace(
+            key=cv.condition_skel["key"],
+            name=cv.condition_skel["name"],
+            is_fulfilled=cv._is_fulfilled,
+            seconds=sum(scope.seconds or 0.0 for scope in scopes),
+            scopes=scopes,
+        )
+
+    @staticmethod
+    def _trace_scope(scope: "DiscountConditionScope") -> ScopeTrace:
+        return ScopeTrace(
+            name=scope.__class__.__name__,
+            is_applicable=scope._is_applicable,
+            is_fulfilled=scope._is_fulfilled,
+            seconds=scope.seconds,
+        )
+
+    @staticmethod
+    def _emit(sink: TraceSink, trace: DiscountTrace) -> None:
+        try:
+            sink.emit(trace)
+        except Exception as exc:  # a broken sink must never break the discount evaluation
+            logger.exception(f"Failed to emit trace into {sink!r}: {exc}")
+
+    def query(self, **filters: t.Any) -> list[DiscountTrace]:
+        """Query the traces of all :class:`RingBufferSink`, see :meth:`RingBufferSink.query`"""
+        traces = [
+            trace
+            for sink in self.sinks if isinstance(sink, RingBufferSink)
+            for trace in sink.query(**filters)
+        ]
+        traces.sort(key=lambda trace: trace.timestamp, reverse=True)
+        return traces[:filters.get("limit")]
+
+
+DISCOUNT_TRACER: t.Final[DiscountTracer] = DiscountTracer()
+"""The tracer used by :meth:`viur.shop.modules.discount.Discount.can_apply`"""
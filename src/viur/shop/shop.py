@@ -2,7 +2,7 @@ import copy
 import typing as t
 
 from viur.core import conf, logging
-from viur.core.bones import RelationalBone
+from viur.core.bones import BooleanBone, RelationalBone
 from viur.core.module import Module
 from viur.core.modules.translation import Creator, TranslationSkel
 from viur.core.modules.user import UserSkel
@@ -55,6 +55,7 @@ class Shop(InstancedModule, Module):
         payment_providers: list[PaymentProviderAbstract],
         suppliers: list[Supplier],
         admin_info_module_group: str | None = "viur-shop",
+        persist_article_prices: bool = False,
         # classes
         address_cls: t.Type[Address] = Address,
         api_cls: t.Type[Api] = Api,
@@ -78,6 +79,8 @@ class Shop(InstancedModule, Module):
         self.payment_providers: list[PaymentProviderAbstract] = payment_providers
         self.suppliers: list[Supplier] = suppliers
         self.admin_info_module_group: str | None = admin_info_module_group
+        self.persist_article_prices: bool = persist_article_prices
+        """Store the price with applied automatically discounts on the article (``shop_price_cached``)"""
         self.address_cls = address_cls
         self.api_cls = api_cls
         self.cart_cls = cart_cls
@@ -211,6 +214,12 @@ class Shop(InstancedModule, Module):
             kind=f"{self.moduleName}_cart_node",
             module=f"{self.moduleName}/cart",
         )
+        skel_cls.shop_has_ordered = BooleanBone(
+            descr="has ordered",
+            readOnly=True,
+            defaultValue=None,
+        )
+        """Cached customer group status, see :meth:`Order.user_has_ordered`"""
         # rebuild bonemap
         skel_cls.__boneMap__ = MetaSkel.generate_bonemap(skel_cls)
 
@@ -20,7 +20,7 @@ from .cart import CartNodeSkel, CartItemSkel  # noqa: E402
 from .discount import DiscountSkel  # noqa: E402
 from .discount_condition import DiscountConditionSkel  # noqa: E402
 from .order import OrderSkel  # noqa: E402
-from .shipping import ShippingSkel  # noqa: E402
+from .shipping import ShippingSkel, ShippingTierRelSkel  # noqa: E402
 from .shipping_config import ShippingConfigSkel  # noqa: E402
 from .shipping_precondition import ShippingPreconditionRelSkel  # noqa: E402
 from .vat import VatSkel  # noqa: E402
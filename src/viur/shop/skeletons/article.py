@@ -7,7 +7,6 @@ from viur.core.bones import *
 from viur.core.skeleton import BaseSkeleton
 from viur.shop.types import *
 from ..globals import SHOP_INSTANCE, SHOP_LOGGER
-from ..types.response import make_json_dumpable
 
 logger = SHOP_LOGGER.getChild(__name__)
 
@@ -103,9 +102,27 @@ class ArticleAbstractSkel(BaseSkeleton):
         compute=Compute(lambda skel: skel.shop_price_.to_dict(), ComputeInterval(ComputeMethod.Always))
     )
 
+    shop_price_cached = JsonBone(
+        readOnly=True,
+        visible=False,
+        compute=Compute(lambda skel: Price.create_snapshot(skel), ComputeInterval(ComputeMethod.OnWrite)),
+    )
+    """Persisted price snapshot, only used with ``Shop(persist_article_prices=True)``"""
+
+    shop_price_cached_current = NumericBone(
+        precision=2,
+        readOnly=True,
+        visible=False,
+        compute=Compute(
+            lambda skel: (skel["shop_price_cached"] or {}).get("current"),
+            ComputeInterval(ComputeMethod.OnWrite),
+        ),
+    )
+    """Current price of the snapshot, can be used to sort listings by price"""
+
     shop_shipping = JsonBone(
         compute=Compute(
-            lambda skel: make_json_dumpable(SHOP_INSTANCE.get().shipping.choose_shipping_skel_for_article(skel)),
+            lambda skel: SHOP_INSTANCE.get().shipping.get_shipping_value_for_article(skel),
             ComputeInterval(ComputeMethod.Always)),
     )
     """Calculated, cheapest shipping for this article"""
@@ -1,5 +1,6 @@
 import collections
 import typing as t  # noqa
+from contextvars import ContextVar
 
 from viur import toolkit
 from viur.core import current, db, utils
@@ -10,7 +11,6 @@ from viur.shop.types import *
 from .vat import VatIncludedSkel
 from ..globals import SHOP_INSTANCE, SHOP_LOGGER
 from ..skeletons.article import ArticleAbstractSkel
-from ..types.response import make_json_dumpable
 
 logger = SHOP_LOGGER.getChild(__name__)
 
@@ -91,8 +91,10 @@ def add_shipping(factory: TotalFactory, total: float, skel: "SkeletonInstance",
 
 def get_vat_for_node(skel: "CartNodeSkel", bone: RecordBone) -> list[dict]:
     children = SHOP_INSTANCE.get().cart.get_children_from_cache(skel["key"])
-    cat2value = collections.defaultdict(lambda: 0)
-    cat2rate = {}
+    # The VAT of the direct leafs is already summed up by the cart pricing
+    node_pricing = CartPricing.get_for(skel).node(skel["key"])
+    cat2value = collections.defaultdict(lambda: 0, node_pricing.vat_values)
+    cat2rate = dict(node_pricing.vat_rates)
     # logger.debug(f"{skel=}")
     for child in children:
         # logger.debug(f"{child=}")
@@ -101,12 +103,6 @@ def get_vat_for_node(skel: "CartNodeSkel", bone: RecordBone) -> list[dict]:
                 # logger.debug(f'{child["shop_vat_rate_category"]} | {entry=}')
                 cat2value[entry["category"]] += entry["value"]
                 cat2rate[entry["category"]] = entry["percentage"]
-        elif issubclass(child.skeletonCls, CartItemSkel):
-            try:
-                cat2value[child["shop_vat_rate_category"]] += child.price_.vat_included * child["quantity"]
-                cat2rate[child["shop_vat_rate_category"]] = child.price_.vat_rate_percentage
-            except TypeError as e:
-                logger.warning(e)
 
     if shipping := skel["shipping"]:
         try:
@@ -131,6 +127,10 @@ def get_vat_for_node(skel: "CartNodeSkel", bone: RecordBone) -> list[dict]:
     ]
 
 
+_COMPUTING_SHIPPING: ContextVar[bool] = ContextVar("_COMPUTING_SHIPPING", default=False)
+"""Is the cheapest shipping computed in this context? Avoids recursions via the totals of the cart."""
+
+
 class RelationalBoneShipping(RelationalBone):
     """A custom RelationalBone with conditionally compute logic for shipping"""
 
@@ -145,7 +145,7 @@ class RelationalBoneShipping(RelationalBone):
         assert name == "shipping", f"Special bone is only for shipping, but not for {name=}"
         # logger.debug(f"{skel["shipping_status"]=}")
 
-        if getattr(self, "_prevent_compute", False):  # avoid recursion errors
+        if _COMPUTING_SHIPPING.get():  # avoid recursion errors
             return False
 
         if skel["shipping_status"] == ShippingStatus.USER:  # should be unserialized from entity
@@ -154,22 +154,53 @@ class RelationalBoneShipping(RelationalBone):
 
         if skel["shipping_status"] == ShippingStatus.CHEAPEST:  # compute cheapest
             # TODO: if not locked ...
-            self._prevent_compute = True
+            cache = self._get_request_cache()
+            cache_key = self._get_cache_key(skel)
             try:
-                applicable_shippings = SHOP_INSTANCE.get().shipping.get_shipping_skels_for_cart(
-                    cart_skel=skel, use_cache=True,
+                value = cache[cache_key]
+            except KeyError:
+                pass
+            else:
+                skel.accessedValues[name] = value and {**value, "dest": value["dest"].clone()}
+                return True
+
+            token = _COMPUTING_SHIPPING.set(True)
+            try:
+                cheapest_shippings = SHOP_INSTANCE.get().shipping.get_shipping_skels_for_cart(
+                    cart_skel=skel, use_cache=True, cheapest=True,
                 )
-                if applicable_shippings:
-                    cheapest_shipping = min(applicable_shippings,
-                                            key=lambda shipping: shipping["dest"]["shipping_cost"] or 0)
-                    skel.setBoneValue("shipping", cheapest_shipping["dest"]["key"])
+                if cheapest_shippings:
+                    # With articles of multiple suppliers, each shipping only costs the part of its supplier.
+                    # The relation references the most expensive one, but costs the sum of all.
+                    costs = [shipping["dest"]["shipping_cost"] or 0.0 for shipping in cheapest_shippings]
+                    main_shipping = cheapest_shippings[costs.index(max(costs))]
+                    skel.setBoneValue("shipping", main_shipping["dest"]["key"])
+                    # Keep the cost calculated for this cart instead of the flat price
+                    skel.accessedValues[name]["dest"]["shipping_cost"] = sum(costs)
             finally:
-                self._prevent_compute = False
+                _COMPUTING_SHIPPING.reset(token)
 
+            if cache_key[0] is not None:
+                value = skel.accessedValues.get(name)
+                cache[cache_key] = value and {**value, "dest": value["dest"].clone()}
             return True
 
         return super().unserialize_compute(skel, name)
 
+    @staticmethod
+    def _get_request_cache() -> dict[tuple, dict | None]:
+        """The cheapest shippings of this request, cleared with the children cache of the cart"""
+        if current.request_data.get() is None:
+            return {}
+        return current.request_data.get().setdefault("shop_cache_cart_shipping", {})
+
+    @staticmethod
+    def _get_cache_key(skel: "SkeletonInstance") -> tuple[db.Key | None, t.Any, db.Key | None]:
+        """The cheapest shipping is decided per (cart, revision of the node, shipping address)"""
+        revision = skel.dbEntity.get("changedate") if skel.dbEntity is not None else None
+        shipping_address = skel["shipping_address"]
+        return skel["key"], revision, shipping_address and shipping_address["dest"]["key"]
+
 
 class CartNodeSkel(TreeSkel):
     kindName = "{{viur_shop_modulename}}_cart_node"
@@ -185,7 +216,7 @@ class CartNodeSkel(TreeSkel):
     total = NumericBone(
         precision=2,
         compute=Compute(
-            TotalFactory("total", lambda child: child.price_.current, True,
+            TotalFactory("total", lambda child: child.pricing_.current, True,
                          additions=[add_shipping]),
             ComputeInterval(ComputeMethod.Always),
         ),
@@ -194,7 +225,7 @@ class CartNodeSkel(TreeSkel):
     total_raw = NumericBone(
         precision=2,
         compute=Compute(
-            TotalFactory("total", lambda child: child.price_.current, True),
+            TotalFactory("total", lambda child: child.pricing_.current, True),
             ComputeInterval(ComputeMethod.Always),
         ),
     )
@@ -202,7 +233,7 @@ class CartNodeSkel(TreeSkel):
     total_discount_price = NumericBone(
         precision=2,
         compute=Compute(
-            TotalFactory("total_discount_price", lambda child: child.price_.current, True,
+            TotalFactory("total_discount_price", lambda child: child.pricing_.current, True,
                          additions=[add_discount, add_shipping]),
             ComputeInterval(ComputeMethod.Always),
         ),
@@ -424,9 +455,13 @@ class CartItemSkel(TreeSkel):
         assert skel.read(pk)
         return skel
 
+    @property
+    def pricing_(self) -> LeafPricing:
+        return CartPricing.get_for(self).leaf(self)
+
     @property
     def price_(self) -> Price:
-        return Price.get_or_create(self)
+        return self.pricing_.price
 
     price = JsonBone(
         compute=Compute(lambda skel: skel.price_.to_dict(), ComputeInterval(ComputeMethod.Always))
@@ -434,9 +469,7 @@ class CartItemSkel(TreeSkel):
 
     shipping = JsonBone(
         compute=Compute(
-            lambda skel: make_json_dumpable(
-                SHOP_INSTANCE.get().shipping.choose_shipping_skel_for_article(skel.article_skel_full)
-            ),
+            lambda skel: SHOP_INSTANCE.get().shipping.get_shipping_value_for_article(skel.article_skel_full),
             ComputeInterval(ComputeMethod.Always)),
     )
 
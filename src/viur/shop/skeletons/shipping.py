@@ -3,8 +3,9 @@ import typing as t  # noqa
 
 from viur.core.bones import *
 from viur.core.i18n import translate
-from viur.core.skeleton import Skeleton
+from viur.core.skeleton import RelSkel, Skeleton
 from ..globals import SHOP_INSTANCE, SHOP_LOGGER
+from ..types import ShippingTierMeasure
 
 logger = SHOP_LOGGER.getChild(__name__)
 
@@ -28,6 +29,27 @@ def is_empty(self: NumericBone, value: t.Any):
     return value is None
 
 
+class ShippingTierRelSkel(RelSkel):
+    measure = SelectBone(
+        values=ShippingTierMeasure,
+        translation_key_prefix="viur.shop.shipping_tier_measure.",
+        required=True,
+    )
+
+    minimum = NumericBone(
+        required=True,
+        precision=3,
+        min=0,
+    )
+    """The tier applies from this quantity or weight (kg) on"""
+
+    shipping_cost = NumericBone(
+        required=True,
+        precision=2,
+        min=0,
+    )
+
+
 class ShippingSkel(Skeleton):
     kindName = "{{viur_shop_modulename}}_shipping"
 
@@ -62,6 +84,20 @@ class ShippingSkel(Skeleton):
     )
     shipping_cost.isEmpty = functools.partial(is_empty, shipping_cost)  # Re-Assign with instance reference
 
+    free_shipping_threshold = NumericBone(
+        precision=2,
+        min=0,
+        getEmptyValueFunc=lambda: None,
+    )
+    """From this order value on the shipping is free"""
+
+    cost_tiers = RecordBone(
+        using=ShippingTierRelSkel,
+        multiple=True,
+        format="$(dest.measure) >= $(dest.minimum): $(dest.shipping_cost)",
+    )
+    """Costs depending on the quantity or the weight, they replace the flat shipping_cost"""
+
     art_no = StringBone(
         escape_html=False,
     )
@@ -1,5 +1,6 @@
 import typing as t  # noqa
 
+from viur.core import db
 from viur.core.bones import *
 from viur.core.skeleton import Skeleton, SkeletonInstance
 from .shipping_precondition import ShippingPreconditionRelSkel
@@ -35,8 +36,13 @@ class ShippingConfigSkel(Skeleton):
 
     @classmethod
     def read(cls, skel: SkeletonInstance, *args, **kwargs) -> bool:
-        # Migration after renaming
         res = super().read(skel, *args, **kwargs)
-        if not skel.dbEntity.get("shipping"):
-            skel.dbEntity["shipping"] = skel.dbEntity.get("shipping_skel")
+        cls.migrate_entity(skel.dbEntity)
         return res
+
+    @staticmethod
+    def migrate_entity(entity: db.Entity) -> db.Entity:
+        """Migration after renaming ``shipping_skel`` to ``shipping``"""
+        if not entity.get("shipping"):
+            entity["shipping"] = entity.get("shipping_skel")
+        return entity
@@ -1,8 +1,10 @@
 import typing as t  # noqa
 
+from viur.core import i18n
 from viur.core.bones import *
 from viur.core.skeleton import RelSkel
 from ..globals import SHOP_LOGGER
+from ..types.zip_rules import validate_zip_code_pattern
 
 logger = SHOP_LOGGER.getChild(__name__)
 
@@ -20,4 +22,23 @@ class ShippingPreconditionRelSkel(RelSkel):
     zip_code = StringBone(
         multiple=True,
         escape_html=False,
+        vfunc=validate_zip_code_pattern,
+        params={
+            "tooltip": i18n.translate(
+                "viur.shop.skeleton.shippingpreconditionrel.zip_code.tooltip",
+                defaultText="Zip codes (12345), prefixes (123*) or ranges (10000..10999)",
+            ),
+        },
+    )
+
+    zip_code_exclude = StringBone(
+        multiple=True,
+        escape_html=False,
+        vfunc=validate_zip_code_pattern,
+        params={
+            "tooltip": i18n.translate(
+                "viur.shop.skeleton.shippingpreconditionrel.zip_code.tooltip",
+                defaultText="Zip codes (12345), prefixes (123*) or ranges (10000..10999)",
+            ),
+        },
     )
@@ -18,9 +18,15 @@ del _Skeleton, _SkeletonInstance
 from .data import ClientError, Supplier  # noqa
 from .dc_scope import (  # noqa
     DiscountConditionScope,
+    CompiledCondition,
     ConditionValidator,
     DiscountValidator,
+    ScopeContext,
 )
+from .dc_index import AutomaticDiscountIndex  # noqa
+from .dc_schedule import DiscountSchedule, DiscountWindow  # noqa
+from .dc_catalog import AutomaticDiscountCatalog, ReadOnlySkeletonInstance  # noqa
+from .dc_code_index import BloomFilter, DiscountCodeIndex, ShardedBloomFilter  # noqa
 from .enums import (  # noqa
     AddressType,
     ApplicationDomain,
@@ -35,7 +41,9 @@ from .enums import (  # noqa
     OrderState,
     QuantityMode,
     Salutation,
+    ScopeCost,
     ShippingStatus,
+    ShippingTierMeasure,
     VatRateCategory,
 )
 from .exceptions import (  # noqa
@@ -49,5 +57,9 @@ from .exceptions import (  # noqa
     ViURShopHttpException,
 )
 from .price import Price  # noqa
+from .cart_pricing import CartPricing, LeafPricing, NodePricing  # noqa
 from .response import ExtendedCustomJsonEncoder, JsonResponse  # noqa
 from .results import (OrderViewResult, PaymentProviderResult, StatusError)  # noqa
+from .shipping_cost import ShipmentMeasures, ShippingCostEngine, ShippingCostTable  # noqa
+from .shipping_catalog import ShippingCatalog  # noqa
+from .zip_rules import ZipCodePatterns, ZipCodeRules  # noqa
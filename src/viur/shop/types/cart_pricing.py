@@ -0,0 +1,225 @@
+"""
+Price breakdown of a whole cart, computed in one pass.
+
+The computed bones of :class:`viur.shop.skeletons.cart.CartNodeSkel` and
+:class:`viur.shop.skeletons.cart.CartItemSkel` need the price, VAT and the
+discounts of every leaf. Without a shared result, each bone would resolve
+them on its own and each :class:`Price` would walk up the tree to collect
+the discounts of the parent nodes.
+
+:class:`CartPricing` walks the tree of a root cart once per request,
+resolves the discount of every node once and creates the :class:`Price`
+of every leaf with the already resolved discounts.
+"""
+
+import collections
+import dataclasses
+import typing as t  # noqa
+
+from viur import toolkit
+from viur.core import current, db
+from viur.core.skeleton import SkeletonInstance
+from .enums import VatRateCategory
+from .price import Price
+from ..globals import SHOP_INSTANCE, SHOP_LOGGER
+
+if t.TYPE_CHECKING:
+    from ..skeletons import CartItemSkel, CartNodeSkel, DiscountSkel
+    from . import SkeletonInstance_T
+
+logger = SHOP_LOGGER.getChild(__name__)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class LeafPricing:
+    """Pricing of a cart leaf (:class:`CartItemSkel`)"""
+
+    price: Price
+    """The price object of this leaf"""
+
+    quantity: int
+    """Quantity of the article"""
+
+    current: float | None
+    """Current price of one article"""
+
+    total: float
+    """Current price multiplied with the quantity"""
+
+    vat_category: VatRateCategory | None
+    """VAT rate category of the article"""
+
+    vat_rate: float | None
+    """VAT rate (0.0 - 1.0), None if it couldn't be determined"""
+
+    vat_value: float
+    """Included VAT of all articles (multiplied with the quantity)"""
+
+
+@dataclasses.dataclass(slots=True)
+class NodePricing:
+    """Pricing of a cart node (:class:`CartNodeSkel`) based on its direct leafs"""
+
+    discount: t.Optional["SkeletonInstance_T[DiscountSkel]"] = None
+    """The full skeleton of the discount applied on this node"""
+
+    discounts: tuple["SkeletonInstance_T[DiscountSkel]", ...] = ()
+    """Discounts of this node and all parent nodes, the nearest first"""
+
+    vat_values: dict[VatRateCategory, float] = dataclasses.field(
+        default_factory=lambda: collections.defaultdict(lambda: 0.0))
+    """Included VAT of the direct leafs per category"""
+
+    vat_rates: dict[VatRateCategory, float] = dataclasses.field(default_factory=dict)
+    """VAT rate of the direct leafs per category"""
+
+
+class CartPricing:
+    """
+    Price breakdown of all leafs and nodes of a root cart.
+
+    Use :meth:`get_for` to get the request-local instance for a cart skeleton.
+    """
+
+    def __init__(self, root_key: db.Key):
+        super().__init__()
+        self.root_key: db.Key = root_key
+        self.leafs: dict[db.Key, LeafPricing] = {}
+        self.nodes: dict[db.Key, NodePricing] = {}
+        self._discount_skels: dict[db.Key, SkeletonInstance] = {}
+        self._build()
+
+    def _build(self) -> None:
+        cart = SHOP_INSTANCE.get().cart
+        root_skel = cart.viewSkel("node", sub_skel="discount")
+        if not root_skel.read(self.root_key):
+            logger.warning(f"Root cart {self.root_key!r} does not exist")
+            return
+        node_queue = collections.deque([(root_skel, ())])
+        while node_queue:
+            node_skel, parent_discounts = node_queue.popleft()
+            node_pricing = self._add_node(node_skel, parent_discounts)
+            for child in cart.get_children_from_cache(node_skel["key"]):
+                if issubclass(child.skeletonCls, cart.nodeSkelCls):
+                    node_queue.append((child, node_pricing.discounts))
+                else:
+                    self._add_leaf(child, node_pricing)
+
+    def _add_node(
+        self,
+        node_skel: "SkeletonInstance_T[CartNodeSkel]",
+        parent_discounts: tuple["SkeletonInstance_T[DiscountSkel]", ...],
+    ) -> NodePricing:
+        discount = self._get_discount_skel(node_skel["discount"] and node_skel["discount"]["dest"])
+        self.nodes[node_skel["key"]] = node_pricing = NodePricing(
+            discount=discount,
+            discounts=parent_discounts if discount is None else (discount, *parent_discounts),
+        )
+        return node_pricing
+
+    def _add_leaf(self, leaf_skel: "SkeletonInstance_T[CartItemSkel]", node_pricing: NodePricing) -> LeafPricing:
+        price = Price.get_or_create(leaf_skel, cart_discounts=list(node_pricing.discounts), force=True)
+        quantity = leaf_skel["quantity"]
+        vat_category = leaf_skel["shop_vat_rate_category"]
+        current_price = price.current
+        try:
+            vat_rate = price.vat_rate_percentage
+            vat_value = price.vat_included * quantity
+        except TypeError as e:
+            logger.warning(e)
+            vat_rate = None
+            vat_value = 0.0
+        self.leafs[leaf_skel["key"]] = leaf_pricing = LeafPricing(
+            price=price,
+            quantity=quantity,
+            current=current_price,
+            total=(current_price or 0.0) * (quantity or 0),
+            vat_category=vat_category,
+            vat_rate=vat_rate,
+            vat_value=vat_value,
+        )
+        if vat_rate is not None:
+            node_pricing.vat_values[vat_category] += vat_value
+            node_pricing.vat_rates[vat_category] = vat_rate
+        return leaf_pricing
+
+    def _get_discount_skel(
+        self,
+        ref_skel: SkeletonInstance | None,
+    ) -> t.Optional["SkeletonInstance_T[DiscountSkel]"]:
+        """Resolve the full discount skeleton of a RefSkel, each discount is read only once"""
+        if not ref_skel:
+            return None
+        key = ref_skel["key"]
+        try:
+            return self._discount_skels[key]
+        except KeyError:
+            pass
+        try:
+            skel = toolkit.get_full_skel_from_ref_skel(ref_skel)
+        except Exception as exc:  # FIXME: some entities are broken?
+            logger.exception(exc)
+            skel = None
+        self._discount_skels[key] = skel
+        return skel
+
+    def leaf(self, leaf_skel: "SkeletonInstance_T[CartItemSkel]") -> LeafPricing:
+        """Get the pricing of a leaf, leafs which were not part of the tree are added"""
+        try:
+            return self.leafs[leaf_skel["key"]]
+        except KeyError:
+            pass
+        return self._add_leaf(leaf_skel, self.node(leaf_skel["parententry"]))
+
+    def node(self, node_key: db.Key) -> NodePricing:
+        """Get the pricing of a node, nodes which were not part of the tree are added"""
+        try:
+            return self.nodes[node_key]
+        except KeyError:
+            pass
+        logger.debug(f"{node_key=} is not part of the tree of {self.root_key=}")
+        cart = SHOP_INSTANCE.get().cart
+        node_skel = cart.viewSkel("node", sub_skel="discount")
+        if not node_skel.read(node_key):
+            return self.nodes.setdefault(node_key, NodePricing())
+        parent_discounts = tuple(
+            skel for skel in map(self._get_discount_skel, cart.get_discount_for_leaf(node_skel))
+            if skel is not None
+        )
+        return self._add_node(node_skel, parent_discounts)
+
+    @classmethod
+    def get_for(cls, skel: "SkeletonInstance_T[CartNodeSkel | CartItemSkel]") -> t.Self:
+        """
+        Get the request-local pricing of the root cart of a leaf or node.
+
+        :param skel: A leaf or node skeleton of the cart.
+        """
+        if skel["parentrepo"] is not None and not skel.get("is_root_node"):
+            root_key = skel["parentrepo"]
+        else:
+            root_key = skel["key"]
+        try:
+            return cls.cache[root_key]
+        except KeyError:
+            pass
+        cls.cache[root_key] = pricing = cls(root_key)
+        return pricing
+
+    @classmethod
+    @property
+    def cache(cls) -> dict[db.Key, t.Self]:
+        """Request-local cache of the :class:`CartPricing` objects, keyed by root cart key"""
+        if current.request_data.get() is None:
+            return {}
+        return current.request_data.get().setdefault("viur.shop", {}).setdefault("cart_pricing_cache", {})
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        cls.cache.clear()
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} for {self.root_key!r} "
+            f"with {len(self.nodes)} nodes and {len(self.leafs)} leafs>"
+        )
@@ -0,0 +1,103 @@
+"""
+Versioned catalog of the automatically applied discounts.
+
+The prevalidation of all automatically discounts is done by a deferred task
+(:meth:`viur.shop.modules.discount.Discount.rebuild_automatically_discounts_catalog`)
+after each change of a discount or a discount condition. The task stores the
+keys of the prevalidated discounts and bumps the version stamp. Each instance
+notices the new version and loads the catalog once into an immutable snapshot.
+
+The :attr:`AutomaticDiscountCatalog.version` can be used by dependent caches
+(like the persisted article prices) to detect outdated entries.
+
+The catalog contains discounts which start within the prevalidation period,
+the discounts which are live right now are provided by the :class:`DiscountSchedule`
+as :attr:`AutomaticDiscountCatalog.current_window`.
+
+The discount skeletons are shared by all requests of an instance,
+so they are read-only (see :class:`ReadOnlySkeletonInstance`).
+"""
+
+import dataclasses
+import typing as t  # noqa
+from datetime import datetime as dt, timedelta as td
+
+from viur.core import utils
+from viur.core.skeleton import SkeletonInstance
+from .dc_index import AutomaticDiscountIndex
+from .dc_schedule import DiscountSchedule, DiscountWindow
+from .exceptions import InvalidStateError
+from ..types import SkeletonInstance_T
+
+if t.TYPE_CHECKING:
+    from ..skeletons import DiscountSkel
+
+CATALOG_MAX_AGE: t.Final[td] = td(hours=1)
+"""After this age the catalog will be rebuilt, so discounts which enter the prevalidation period are added"""
+
+
+class ReadOnlySkeletonInstance(SkeletonInstance):
+    """
+    A skeleton instance which is shared between requests and can't be modified.
+
+    Use :meth:`clone` to get a modifiable copy.
+    """
+
+    __slots__ = ()
+
+    def __setitem__(self, key, value):
+        raise InvalidStateError(f"Cannot modify {key!r} of a shared skeleton, clone it first")
+
+    @classmethod
+    def freeze(cls, skel: SkeletonInstance_T) -> SkeletonInstance_T:
+        """Unserialize all bones of a skeleton instance and turn it into a read-only one"""
+        for _ in skel.items(yieldBoneValues=True):
+            pass
+        skel.__class__ = cls
+        return skel
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class AutomaticDiscountCatalog:
+    """
+    An immutable snapshot of the prevalidated automatically discounts.
+
+    The skeletons are shared between all requests of an instance and are read-only.
+    """
+
+    version: int
+    """Version of the catalog, changes whenever the set of discounts has been rebuilt"""
+
+    discounts: tuple[SkeletonInstance_T["DiscountSkel"], ...]
+    """The prevalidated discounts"""
+
+    built_at: dt
+    """Time of the prevalidation"""
+
+    index: AutomaticDiscountIndex = dataclasses.field(init=False)
+    """Index of the discounts by their scopes"""
+
+    schedule: DiscountSchedule = dataclasses.field(init=False)
+    """Interval index of the start and end dates of the discounts"""
+
+    def __post_init__(self):
+        for discount_skel in self.discounts:
+            ReadOnlySkeletonInstance.freeze(discount_skel)
+        object.__setattr__(self, "index", AutomaticDiscountIndex(self.discounts))
+        object.__setattr__(self, "schedule", DiscountSchedule(self.discounts))
+
+    @property
+    def current_window(self) -> DiscountWindow:
+        """The discounts which are live right now (by their dates)"""
+        return self.schedule.window()
+
+    @property
+    def is_expired(self) -> bool:
+        """Whether the prevalidation is older than :data:`CATALOG_MAX_AGE`"""
+        return self.built_at + CATALOG_MAX_AGE < utils.utcNow()
+
+    def __len__(self) -> int:
+        return len(self.discounts)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} {self.version=} with {len(self.discounts)} discounts>"
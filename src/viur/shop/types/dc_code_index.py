@@ -0,0 +1,364 @@
+"""
+Index of the discount codes.
+
+Resolving a code with queries needs a ``scope_code.idx`` query, a read of
+the parent condition for each individual code and a query for the discounts.
+Even an unknown (e.g. guessed) code costs a query.
+
+The :class:`DiscountCodeIndex` stores an entry per normalized code, which
+refers to the condition used by the discounts, so a valid code is resolved
+with one read. A :class:`ShardedBloomFilter` of all codes is held in memory,
+so an unknown code is rejected without any datastore access. The filter is
+persisted and updated incrementally when codes are added; other instances
+notice the change by a version stamp.
+
+The filter is persisted in shards of at most :data:`FILTER_SHARD_BYTES`, each
+code belongs to one shard. So a filter of millions of codes fits into the
+entity size limit, and concurrent updates of different shards don't collide.
+A head entity refers to the shards of the active generation. A rebuild writes
+a new generation; codes added during the rebuild go into both generations,
+so no code is missing after the switch.
+"""
+
+import hashlib
+import math
+import threading
+import typing as t  # noqa
+import zlib
+
+from viur.core import db
+from ..globals import SHOP_INSTANCE, SHOP_LOGGER
+from ..services import VersionStamp
+
+logger = SHOP_LOGGER.getChild(__name__)
+
+CODE_INDEX_STAMP: t.Final[VersionStamp] = VersionStamp("discount_code_index", check_interval=2.0)
+"""Version of the code index, bumped on every change of the bloom filter"""
+
+FILTER_SHARD_BYTES: t.Final[int] = 512 * 1024
+"""Maximum size of the bits of a persisted filter shard, an entity must not exceed 1 MiB"""
+
+
+class BloomFilter:
+    """
+    A space-efficient set of strings, which can have false positives, but no false negatives.
+
+    :param size: Number of bits.
+    :param hashes: Number of hash functions.
+    :param bits: The bits of an existing filter.
+    """
+
+    __slots__ = ("size", "hashes", "bits")
+
+    def __init__(self, size: int, hashes: int, bits: bytes | bytearray | None = None):
+        super().__init__()
+        self.size: int = size
+        self.hashes: int = hashes
+        self.bits: bytearray = bytearray(bits) if bits is not None else bytearray((size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float = 0.001) -> t.Self:
+        """Create an empty filter for ``capacity`` values with the given false positive rate"""
+        capacity = max(capacity, 1)
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        hashes = max(1, round(size / capacity * math.log(2)))
+        return cls(size, hashes)
+
+    def _positions(self, value: str) -> t.Iterator[int]:
+        # Double hashing (Kirsch-Mitzenmacher) based on one 128 bit digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, value: str) -> None:
+        for pos in self._positions(value):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} with {self.size} bits and {self.hashes} hashes>"
+
+
+class ShardedBloomFilter:
+    """
+    A bloom filter split into independent :class:`BloomFilter` shards, each value belongs to one shard.
+
+    :param shards: The filters of the shards.
+    """
+
+    __slots__ = ("shards",)
+
+    def __init__(self, shards: t.Sequence[BloomFilter]):
+        super().__init__()
+        self.shards: list[BloomFilter] = list(shards)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float = 0.001) -> t.Self:
+        """Create an empty filter for ``capacity`` values, with as many shards as :data:`FILTER_SHARD_BYTES` needs"""
+        size = len(BloomFilter.for_capacity(capacity, error_rate).bits)
+        shards = max(1, math.ceil(size / FILTER_SHARD_BYTES))
+        return cls([BloomFilter.for_capacity(math.ceil(capacity / shards), error_rate) for _ in range(shards)])
+
+    @staticmethod
+    def shard_of(value: str, shards: int) -> int:
+        """Get the shard of a value, independent of the hashes of the filters"""
+        return zlib.crc32(value.encode()) % shards
+
+    def add(self, value: str) -> None:
+        self.shards[self.shard_of(value, len(self.shards))].add(value)
+
+    def __contains__(self, value: str) -> bool:
+        return value in self.shards[self.shard_of(value, len(self.shards))]
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} with {len(self.shards)} shards of "
+            f"{self.shards[0].size if self.shards else 0} bits>"
+        )
+
+
+class DiscountCodeIndex:
+    """
+    Maps normalized discount codes to their conditions.
+
+    Use :meth:`lookup` to resolve a code, and :meth:`add` / :meth:`remove`
+    to keep the index up to date.
+    """
+
+    DEFAULT_CAPACITY: t.Final[int] = 100_000
+    """Minimum capacity of the bloom filter"""
+
+    def __init__(self):
+        super().__init__()
+        self._bloom: BloomFilter | None = None
+        self._version: int | None = None
+        self._lock = threading.Lock()
+
+    # --- Datastore keys ------------------------------------------------------
+
+    @property
+    def filter_key(self) -> db.Key:
+        return db.Key(f"{SHOP_INSTANCE.get().moduleName}_discount_code_index", "filter")
+
+    @property
+    def entry_kind(self) -> str:
+        return f"{SHOP_INSTANCE.get().moduleName}_discount_code"
+
+    def entry_key(self, code: str) -> db.Key:
+        return db.Key(self.entry_kind, self.normalize(code))
+
+    @staticmethod
+    def normalize(code: str) -> str:
+        return code.strip().lower()
+
+    # --- Bloom filter --------------------------------------------------------
+
+    def filter_shard_key(self, generation: int, shard: int) -> db.Key:
+        return db.Key(f"{SHOP_INSTANCE.get().moduleName}_discount_code_index", f"filter-{generation}-{shard}")
+
+    @property
+    def bloom(self) -> ShardedBloomFilter | None:
+        """The bloom filter of all codes, None if the index has not been built yet"""
+        version = CODE_INDEX_STAMP.current
+        with self._lock:
+            if self._version != version:
+                head = db.Get(self.filter_key)
+                if not head or head.get("generation") is None:
+                    self._bloom = None
+                elif (bloom := self._load_filter(head["generation"], head["shards"])) is not None:
+                    self._bloom = bloom
+                else:
+                    # Switched to a new generation in the meantime, try again on the next access
+                    return self._bloom
+                self._version = version
+            return self._bloom
+
+    def _load_filter(self, generation: int, shards: int) -> ShardedBloomFilter | None:
+        entities = db.Get([self.filter_shard_key(generation, shard) for shard in range(shards)])
+        if any(entity is None for entity in entities):
+            return None
+        return ShardedBloomFilter([
+            BloomFilter(entity["size"], entity["hashes"], entity["bits"]) for entity in entities
+        ])
+
+    @property
+    def is_ready(self) -> bool:
+        return self.bloom is not None
+
+    def _write_filter_shard(self, key: db.Key, bloom: BloomFilter, count: int) -> None:
+        entity = db.Entity(key)
+        entity["size"] = bloom.size
+        entity["hashes"] = bloom.hashes
+        entity["bits"] = bytes(bloom.bits)
+        entity["count"] = count
+        entity.exclude_from_indexes = {"bits"}
+        db.Put(entity)
+
+    def _add_to_filter_shards(self, head: db.Entity, codes: t.Iterable[str], *, building: bool = False) -> None:
+        """Add codes to the shards of the active (or the building) generation, must run in a transaction"""
+        prefix = "building_" if building else ""
+        generation, shards = head[f"{prefix}generation"], head[f"{prefix}shards"]
+        by_shard: dict[int, list[str]] = {}
+        for code in codes:
+            by_shard.setdefault(ShardedBloomFilter.shard_of(code, shards), []).append(code)
+        keys = [self.filter_shard_key(generation, shard) for shard in by_shard]
+        for key, entity, shard_codes in zip(keys, db.Get(keys), by_shard.values()):
+            if entity is not None:
+                bloom = BloomFilter(entity["size"], entity["hashes"], entity["bits"])
+                count = entity["count"] or 0
+            elif building:
+                bloom = BloomFilter(head["building_size"], head["building_hashes"])
+                count = 0
+            else:
+                logger.error(f"Missing filter shard {key!r}")
+                continue
+            for code in shard_codes:
+                bloom.add(code)
+            self._write_filter_shard(key, bloom, count + len(shard_codes))
+
+    def update_filter(self, codes: t.Iterable[str]) -> None:
+        """
+        Add codes to the persisted bloom filter.
+
+        Each shard is updated in its own transaction, which reads the head entity too,
+        so a concurrent switch to a new generation retries the update. The version stamp
+        is bumped once for all codes.
+        """
+        codes = {self.normalize(code) for code in codes}
+        if not codes or not (head := db.Get(self.filter_key)):
+            return  # Not built yet, the rebuild will add all codes
+
+        def txn(key: db.Key, shard_codes: list[str]) -> None:
+            if not (head := db.Get(key)):
+                return
+            if head.get("generation") is not None:
+                self._add_to_filter_shards(head, shard_codes)
+            if head.get("building_generation") is not None:
+                self._add_to_filter_shards(head, shard_codes, building=True)
+
+        shards = head.get("shards") or head.get("building_shards") or 1
+        by_shard: dict[int, list[str]] = {}
+        for code in codes:
+            by_shard.setdefault(ShardedBloomFilter.shard_of(code, shards), []).append(code)
+        for shard_codes in by_shard.values():
+            db.RunInTransaction(txn, self.filter_key, shard_codes)
+        CODE_INDEX_STAMP.bump()
+
+    def rebuild_filter(self, count: int) -> None:
+        """
+        Build a new generation of the bloom filter from all index entries.
+
+        The new generation is registered before the entries are read, so codes added
+        in the meantime go into both generations. The built shards are merged with
+        these codes, afterward the new generation is activated and the old one is deleted.
+
+        :param count: The expected number of codes, the filter is sized for twice this amount.
+        """
+        bloom = ShardedBloomFilter.for_capacity(max(self.DEFAULT_CAPACITY, 2 * count))
+
+        def start_txn(key: db.Key) -> int:
+            head = db.Get(key) or db.Entity(key)
+            for name in ("size", "hashes", "bits", "count"):
+                head.pop(name, None)  # Of the former unsharded filter
+            generation = max(head.get("generation") or 0, head.get("building_generation") or 0) + 1
+            head["building_generation"] = generation
+            head["building_shards"] = len(bloom.shards)
+            head["building_size"] = bloom.shards[0].size
+            head["building_hashes"] = bloom.shards[0].hashes
+            db.Put(head)
+            return generation
+
+        def merge_txn(key: db.Key, shard_bloom: BloomFilter, shard_count: int) -> None:
+            # Union with the codes added since the generation has been registered
+            if entity := db.Get(key):
+                for pos, byte in enumerate(entity["bits"]):
+                    shard_bloom.bits[pos] |= byte
+                shard_count += entity["count"] or 0
+            self._write_filter_shard(key, shard_bloom, shard_count)
+
+        def activate_txn(key: db.Key) -> tuple[int | None, int | None] | None:
+            head = db.Get(key)
+            if head["building_generation"] != generation:
+                return None  # Superseded by another rebuild
+            previous = head.get("generation"), head.get("shards")
+            head["generation"] = generation
+            head["shards"] = len(bloom.shards)
+            for name in ("building_generation", "building_shards", "building_size", "building_hashes"):
+                head[name] = None
+            db.Put(head)
+            return previous
+
+        generation = db.RunInTransaction(start_txn, self.filter_key)
+        counts = [0] * len(bloom.shards)
+        for entity in db.Query(self.entry_kind).iter():
+            code = entity.key.id_or_name
+            bloom.add(code)
+            counts[ShardedBloomFilter.shard_of(code, len(bloom.shards))] += 1
+        for shard, shard_bloom in enumerate(bloom.shards):
+            db.RunInTransaction(merge_txn, self.filter_shard_key(generation, shard), shard_bloom, counts[shard])
+
+        if (previous := db.RunInTransaction(activate_txn, self.filter_key)) is None:
+            logger.warning(f"Rebuild of the code index filter {generation=} has been superseded")
+            db.Delete([self.filter_shard_key(generation, shard) for shard in range(len(bloom.shards))])
+            return
+        CODE_INDEX_STAMP.bump()
+        logger.info(f"Activated {bloom=} {generation=} for {sum(counts)} codes")
+        if (previous_generation := previous[0]) is not None:
+            db.Delete([self.filter_shard_key(previous_generation, shard) for shard in range(previous[1] or 0)])
+
+    # --- Entries -------------------------------------------------------------
+
+    def _make_entry(self, code: str, condition_key: db.Key, code_condition_key: db.Key) -> db.Entity:
+        entity = db.Entity(self.entry_key(code))
+        entity["condition_key"] = condition_key
+        entity["code_condition_key"] = code_condition_key
+        return entity
+
+    def add(self, entries: t.Iterable[tuple[str, db.Key, db.Key]]) -> None:
+        """
+        Add codes to the index.
+
+        :param entries: Tuples of (code, key of the condition used by the discounts,
+            key of the condition with this code), these keys differ for individual codes.
+        """
+        entries = list(entries)
+        if not entries:
+            return
+        db.Put([self._make_entry(*entry) for entry in entries])
+        self.update_filter(code for code, *_ in entries)
+
+    def write_entries(self, entries: t.Iterable[tuple[str, db.Key, db.Key]]) -> None:
+        """Write entries without updating the bloom filter, use :meth:`update_filter` or :meth:`rebuild_filter`"""
+        if entities := [self._make_entry(*entry) for entry in entries]:
+            db.Put(entities)
+
+    def remove(self, code: str) -> None:
+        """
+        Remove a code from the index.
+
+        The code stays in the bloom filter until the next rebuild,
+        but :meth:`lookup` will not find an entry anymore.
+        """
+        db.Delete(self.entry_key(code))
+
+    def lookup(self, code: str) -> db.Entity | None | t.Literal[False]:
+        """
+        Resolve a code.
+
+        :return: The entry with ``condition_key`` and ``code_condition_key``,
+            None if the code is unknown or False if the index is not built yet.
+        """
+        if not (code := self.normalize(code)):
+            return None
+        if (bloom := self.bloom) is None:
+            return False
+        if code not in bloom:
+            return None
+        return db.Get(self.entry_key(code))
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} {self._version=} with {self._bloom=}>"
@@ -0,0 +1,193 @@
+"""
+In-memory index of the automatically applied discounts.
+
+Evaluating a discount with :meth:`viur.shop.modules.discount.Discount.can_apply`
+builds a whole validator tree. For article prices this is done for every
+automatically discount on every article, although most discounts are limited
+to some articles, countries or languages and can never match.
+
+The :class:`AutomaticDiscountIndex` buckets the discounts by these scopes, so
+the price calculation has to validate only the candidates which can possibly
+match an article. The index is conservative: a candidate still has to pass
+the full validation, but a discount which is not a candidate can never apply.
+
+Discounts limited to some countries or languages are marked as context dependent,
+their result can differ between requests for the same article.
+"""
+
+import collections
+import typing as t  # noqa
+
+from viur.core import current, db
+from .enums import ConditionOperator
+from .exceptions import DispatchError
+from ..globals import SHOP_INSTANCE, SHOP_LOGGER
+from ..services import HOOK_SERVICE, Hook
+from ..types import SkeletonInstance_T
+
+if t.TYPE_CHECKING:
+    from ..skeletons import ArticleAbstractSkel, DiscountConditionSkel, DiscountSkel
+
+logger = SHOP_LOGGER.getChild(__name__)
+
+Scope: t.TypeAlias = frozenset | None
+"""A set of allowed values, ``None`` means unrestricted"""
+
+
+class AutomaticDiscountIndex:
+    """
+    Buckets automatically discounts by ``scope_article``, ``scope_country`` and ``scope_language``.
+
+    The index is immutable, it must be rebuilt if the list of discounts changes.
+    """
+
+    __slots__ = (
+        "source",
+        "discounts",
+        "_by_key",
+        "_by_article", "_any_article",
+        "_by_country", "_any_country",
+        "_by_language", "_any_language",
+        "_context_dependent",
+    )
+
+    def __init__(self, discounts: t.Sequence[SkeletonInstance_T["DiscountSkel"]]):
+        self.source: t.Sequence[SkeletonInstance_T["DiscountSkel"]] = discounts
+        """The indexed sequence, used to detect if the index is outdated"""
+        self.discounts: tuple[SkeletonInstance_T["DiscountSkel"], ...] = tuple(discounts)
+        self._by_key: dict[str, SkeletonInstance_T["DiscountSkel"]] = {
+            str(discount_skel["key"]): discount_skel for discount_skel in self.discounts
+        }
+        self._by_article: dict[db.Key, set[int]] = collections.defaultdict(set)
+        self._any_article: set[int] = set()
+        self._by_country: dict[str, set[int]] = collections.defaultdict(set)
+        self._any_country: set[int] = set()
+        self._by_language: dict[str, set[int]] = collections.defaultdict(set)
+        self._any_language: set[int] = set()
+        self._context_dependent: set[int] = set()
+
+        for idx, discount_skel in enumerate(self.discounts):
+            condition_scopes = self._get_all_condition_scopes(discount_skel)
+            if condition_scopes is None or any(scopes[1] or scopes[2] for scopes in condition_scopes):
+                self._context_dependent.add(idx)
+            articles, countries, languages = self._get_scopes(discount_skel, condition_scopes)
+            self._add(idx, articles, self._by_article, self._any_article)
+            self._add(idx, countries, self._by_country, self._any_country)
+            self._add(idx, languages, self._by_language, self._any_language)
+
+    @staticmethod
+    def _add(idx: int, scope: Scope, bucket: dict[t.Any, set[int]], any_bucket: set[int]) -> None:
+        if scope is None:
+            any_bucket.add(idx)
+        else:
+            for value in scope:
+                bucket[value].add(idx)
+
+    @classmethod
+    def _get_all_condition_scopes(
+        cls,
+        discount_skel: SkeletonInstance_T["DiscountSkel"],
+    ) -> list[tuple[Scope, Scope, Scope]] | None:
+        """Get the scopes of each condition of a discount, None if a relation is broken"""
+        condition_scopes = []
+        for condition_skel in SHOP_INSTANCE.get().discount_condition.get_many(
+            condition["dest"]["key"] for condition in discount_skel["condition"]
+        ):
+            if condition_skel is None:
+                return None
+            condition_scopes.append(cls._get_condition_scopes(condition_skel))
+        return condition_scopes
+
+    @classmethod
+    def _get_scopes(
+        cls,
+        discount_skel: SkeletonInstance_T["DiscountSkel"],
+        condition_scopes: list[tuple[Scope, Scope, Scope]] | None,
+    ) -> tuple[Scope, Scope, Scope]:
+        """Combine the scopes of all conditions of a discount, depending on the condition operator"""
+        if condition_scopes is None:
+            # Broken relation, let the validator handle this
+            return None, None, None
+
+        if discount_skel["condition_operator"] == ConditionOperator.ONE_OF:
+            combine = cls._union
+        else:
+            combine = cls._intersection
+        return t.cast(tuple[Scope, Scope, Scope], tuple(
+            combine([scopes[pos] for scopes in condition_scopes])
+            for pos in range(3)
+        ))
+
+    @staticmethod
+    def _get_condition_scopes(
+        condition_skel: SkeletonInstance_T["DiscountConditionSkel"],
+    ) -> tuple[Scope, Scope, Scope]:
+        return (
+            frozenset(article["dest"]["key"] for article in condition_skel["scope_article"] or ()) or None,
+            frozenset(condition_skel["scope_country"] or ()) or None,
+            frozenset(condition_skel["scope_language"] or ()) or None,
+        )
+
+    @staticmethod
+    def _union(scopes: list[Scope]) -> Scope:
+        if not scopes or any(scope is None for scope in scopes):
+            return None
+        return frozenset().union(*scopes)
+
+    @staticmethod
+    def _intersection(scopes: list[Scope]) -> Scope:
+        scopes = [scope for scope in scopes if scope is not None]
+        if not scopes:
+            return None
+        return frozenset.intersection(*scopes)
+
+    def get(self, key: db.Key | str) -> SkeletonInstance_T["DiscountSkel"] | None:
+        """Get an indexed discount by its key"""
+        return self._by_key.get(str(key))
+
+    def candidates(
+        self,
+        article_key: db.Key,
+        *,
+        country: str | None = None,
+        language: str | None = None,
+    ) -> list[SkeletonInstance_T["DiscountSkel"]]:
+        """
+        Get the discounts which could apply to an article.
+
+        :param article_key: Key of the article.
+        :param country: The current country, ``None`` doesn't filter by country.
+        :param language: The current language, ``None`` doesn't filter by language.
+        :return: The candidates, in the same order as the indexed discounts.
+        """
+        idxs = self._any_article | self._by_article.get(article_key, set())
+        if country is not None:
+            idxs &= self._any_country | self._by_country.get(country, set())
+        if language is not None:
+            idxs &= self._any_language | self._by_language.get(language, set())
+        return [self.discounts[idx] for idx in sorted(idxs)]
+
+    def is_context_dependent(self, article_key: db.Key) -> bool:
+        """Could the discount of an article depend on the current country or language?"""
+        idxs = self._any_article | self._by_article.get(article_key, set())
+        return not self._context_dependent.isdisjoint(idxs)
+
+    def candidates_for_article(
+        self,
+        article_skel: SkeletonInstance_T["ArticleAbstractSkel"],
+    ) -> list[SkeletonInstance_T["DiscountSkel"]]:
+        """Get the candidates for an article in the current context (country and language)"""
+        try:
+            country = HOOK_SERVICE.dispatch(Hook.CURRENT_COUNTRY)("article")
+        except DispatchError:
+            country = None
+        return self.candidates(article_skel["key"], country=country, language=current.language.get())
+
+    def __len__(self) -> int:
+        return len(self.discounts)
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} with {len(self.discounts)} discounts, "
+            f"{len(self._by_article)} articles, {len(self._any_article)} for any article>"
+        )
@@ -0,0 +1,147 @@
+"""
+Interval index of the date boundaries of the automatically discounts.
+
+The prevalidation keeps discounts which start within the next days
+(:data:`viur.shop.types.dc_scope.PREVALIDATION_OFFSET`) in the catalog,
+so not every cached discount is live. Without an index, the date scopes
+of each condition are compared against the current time on every evaluation.
+
+The :class:`DiscountSchedule` collects the ``scope_date_start`` and
+``scope_date_end`` values of all conditions as sorted boundaries. Between
+two boundaries, the set of live discounts cannot change, so it's computed
+once per :class:`DiscountWindow`. The window is swapped on the first access
+after the next boundary has been reached. Conditions which are live in the
+window are validated without their date scopes.
+"""
+
+import bisect
+import dataclasses
+import typing as t  # noqa
+from datetime import datetime as dt
+
+from viur.core import db, utils
+from .dc_index import AutomaticDiscountIndex
+from .enums import ConditionOperator
+from ..globals import SHOP_INSTANCE, SHOP_LOGGER
+from ..types import SkeletonInstance_T
+
+if t.TYPE_CHECKING:
+    from ..skeletons import DiscountSkel
+
+logger = SHOP_LOGGER.getChild(__name__)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class DiscountWindow:
+    """The live discounts between two boundaries"""
+
+    start: dt | None
+    """First point in time of this window, None if unbounded"""
+
+    end: dt | None
+    """The next boundary (exclusive), None if unbounded"""
+
+    discounts: tuple[SkeletonInstance_T["DiscountSkel"], ...]
+    """The discounts which are live by their dates"""
+
+    live_conditions: frozenset[db.Key]
+    """Keys of the conditions which are live by their dates, their date scopes can be skipped"""
+
+    index: AutomaticDiscountIndex = dataclasses.field(init=False)
+    """Index of the live discounts by their scopes"""
+
+    def __post_init__(self):
+        object.__setattr__(self, "index", AutomaticDiscountIndex(self.discounts))
+
+    def contains(self, now: dt) -> bool:
+        return (self.start is None or self.start <= now) and (self.end is None or now < self.end)
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} from {self.start} until {self.end} "
+            f"with {len(self.discounts)} discounts>"
+        )
+
+
+class DiscountSchedule:
+    """
+    Interval index of the date boundaries of some discounts.
+
+    The schedule is immutable, it must be rebuilt if the list of discounts changes.
+    """
+
+    __slots__ = ("discounts", "boundaries", "_dates", "_window")
+
+    def __init__(self, discounts: t.Sequence[SkeletonInstance_T["DiscountSkel"]]):
+        super().__init__()
+        self.discounts: tuple[SkeletonInstance_T["DiscountSkel"], ...] = tuple(discounts)
+        self._dates: list[tuple[ConditionOperator, list[tuple[db.Key, dt | None, dt | None]] | None]] = []
+        """Per discount the condition operator and (key, start, end) of each condition, None if broken"""
+        self._window: DiscountWindow | None = None
+
+        boundaries = set()
+        discount_condition = SHOP_INSTANCE.get().discount_condition
+        for discount_skel in self.discounts:
+            condition_skels = discount_condition.get_many(
+                condition["dest"]["key"] for condition in discount_skel["condition"]
+            )
+            if any(condition_skel is None for condition_skel in condition_skels):
+                # Broken relation, let the validator handle this
+                self._dates.append((discount_skel["condition_operator"], None))
+                continue
+            dates = [
+                (condition_skel["key"], condition_skel["scope_date_start"], condition_skel["scope_date_end"])
+                for condition_skel in condition_skels
+            ]
+            boundaries.update(date for _, *start_end in dates for date in start_end if date is not None)
+            self._dates.append((discount_skel["condition_operator"], dates))
+        self.boundaries: tuple[dt, ...] = tuple(sorted(boundaries))
+        """All start and end dates of the conditions, ascending"""
+
+    @staticmethod
+    def _is_live(start: dt | None, end: dt | None, window_start: dt | None, window_end: dt | None) -> bool:
+        """Is a condition live during the whole window?"""
+        # Since all dates are boundaries, a condition is either live in the whole window or not at all
+        return (
+            (start is None or (window_start is not None and start <= window_start))
+            and (end is None or (window_end is not None and end >= window_end))
+        )
+
+    def _build_window(self, now: dt) -> DiscountWindow:
+        pos = bisect.bisect_right(self.boundaries, now)
+        start = self.boundaries[pos - 1] if pos else None
+        end = self.boundaries[pos] if pos < len(self.boundaries) else None
+        discounts = []
+        live_conditions = set()
+        for discount_skel, (operator, dates) in zip(self.discounts, self._dates):
+            if dates is None:
+                discounts.append(discount_skel)
+                continue
+            live = [key for key, cond_start, cond_end in dates if self._is_live(cond_start, cond_end, start, end)]
+            live_conditions.update(live)
+            if len(live) == len(dates) or (live and operator == ConditionOperator.ONE_OF):
+                discounts.append(discount_skel)
+        return DiscountWindow(start, end, tuple(discounts), frozenset(live_conditions))
+
+    def window(self, now: dt | None = None) -> DiscountWindow:
+        """Get the window of the current (or given) point in time, the window is swapped at each boundary"""
+        if now is None:
+            now = utils.utcNow()
+        window = self._window
+        if window is None or not window.contains(now):
+            window = self._window = self._build_window(now)
+            logger.debug(f"Swapped to {window=}")
+        return window
+
+    def next_boundary(self, now: dt | None = None) -> dt | None:
+        """Get the next boundary after the given point in time, None if there's none"""
+        if now is None:
+            now = utils.utcNow()
+        pos = bisect.bisect_right(self.boundaries, now)
+        return self.boundaries[pos] if pos < len(self.boundaries) else None
+
+    def __len__(self) -> int:
+        return len(self.boundaries)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} with {len(self.discounts)} discounts and {len(self.boundaries)} boundaries>"
@@ -22,14 +22,28 @@ Each validator refers to a layer of the model
 -   :class:`DiscountValidator` <-> :class:`DiscountSkel`
 -   :class:`ConditionValidator` <-> :class:`DiscountConditionSkel`
 -   :class:`DiscountConditionScope` <-> bones in :class:`DiscountConditionSkel`
+
+A :class:`DiscountConditionSkel` is compiled once (per key and changedate)
+into a :class:`CompiledCondition`, which holds only the scopes that are
+relevant for the condition. A :class:`ConditionValidator` instantiates
+only these scopes instead of every registered scope.
+
+The scopes are evaluated ordered by their :class:`ScopeCost`, so cheap
+in-memory checks can fail before any datastore query is run.
+The time spent per scope is collected in :data:`SCOPE_TIMINGS`.
 """
 
 import abc
-import pprint
+import collections
+import dataclasses
+import threading
+import time
 import typing as t  # noqa
 from datetime import timedelta as td
 
-from viur.core import current, utils
+import cachetools
+
+from viur.core import current, db, utils
 from .enums import *
 from .exceptions import DispatchError, InvalidStateError
 from ..globals import SENTINEL, SHOP_INSTANCE, SHOP_LOGGER, Sentinel
@@ -41,6 +55,35 @@ if t.TYPE_CHECKING:
 
 logger = SHOP_LOGGER.getChild(__name__)
 
+PREVALIDATION_OFFSET: t.Final[td] = td(days=7)
+"""Offset which is added to the start date on prevalidation of automatically discounts"""
+
+
+@dataclasses.dataclass(slots=True)
+class ScopeTiming:
+    """Timing counters of a scope class"""
+
+    calls: int = 0
+    """How often the scope was evaluated"""
+
+    fulfilled: int = 0
+    """How often the scope was fulfilled"""
+
+    seconds: float = 0.0
+    """Total time spent in the evaluation"""
+
+    @property
+    def mean(self) -> float:
+        """Average time per evaluation in seconds"""
+        return self.seconds / self.calls if self.calls else 0.0
+
+
+SCOPE_TIMINGS: t.Final[collections.defaultdict[str, ScopeTiming]] = collections.defaultdict(ScopeTiming)
+"""Timing counters per scope class name, to tune the :attr:`DiscountConditionScope.cost`"""
+
+SCOPE_TIMINGS_LOCK: t.Final[threading.Lock] = threading.Lock()
+"""Guards :data:`SCOPE_TIMINGS`, scopes are evaluated by concurrent requests and batch validations"""
+
 
 def _skel_repr(skel: SkeletonInstance_T | None) -> str:
     if skel is None:
@@ -52,6 +95,18 @@ class DiscountConditionScope:
     _is_applicable = None
     _is_fulfilled = None
 
+    seconds: float | None = None
+    """Wall time of the evaluation, None if not evaluated yet"""
+
+    cost: ScopeCost = ScopeCost.MEMORY
+    """Cost class of the evaluation, cheaper scopes are evaluated first"""
+
+    is_date_scope: t.ClassVar[bool] = False
+    """
+    Compares only against the current date, skipped for conditions which are live
+    in a :class:`viur.shop.types.dc_schedule.DiscountWindow`
+    """
+
     def __init__(
         self,
         *,
@@ -69,6 +124,17 @@ class DiscountConditionScope:
         self.code = code
         self.context = context
 
+    @classmethod
+    def is_relevant(cls, condition_skel: SkeletonInstance_T["DiscountConditionSkel"]) -> bool:
+        """
+        Check if this scope can be applicable for a condition at all.
+
+        Unlike :meth:`precondition` this depends only on the condition,
+        not on the validation context, so the result can be compiled once.
+        Scopes which return False are never instantiated for this condition.
+        """
+        return True
+
     def precondition(self) -> bool:
         return True
 
@@ -91,7 +157,17 @@ class DiscountConditionScope:
     @property
     def is_fulfilled(self) -> bool:
         if self._is_fulfilled is None and self.is_applicable:
-            self._is_fulfilled = self()
+            start = time.perf_counter()
+            try:
+                self._is_fulfilled = self()
+            finally:
+                self.seconds = time.perf_counter() - start
+                with SCOPE_TIMINGS_LOCK:
+                    timing = SCOPE_TIMINGS[self.__class__.__name__]
+                    timing.calls += 1
+                    timing.seconds += self.seconds
+                    if self._is_fulfilled:
+                        timing.fulfilled += 1
         return self._is_fulfilled
 
     def __repr__(self) -> str:
@@ -101,6 +177,91 @@ class DiscountConditionScope:
         )
 
 
+@dataclasses.dataclass(frozen=True, slots=True)
+class ScopeContext:
+    """The arguments of a validation, shared by all validators and scopes of a discount"""
+
+    cart_skel: SkeletonInstance_T["CartNodeSkel"] | None | Sentinel = SENTINEL
+    article_skel: SkeletonInstance_T["ArticleAbstractSkel"] | None | Sentinel = SENTINEL
+    discount_skel: SkeletonInstance_T["DiscountSkel"] | None | Sentinel = SENTINEL
+    code: str | None | Sentinel = SENTINEL
+    context: DiscountValidationContext = SENTINEL
+
+    def as_kwargs(self) -> dict[str, t.Any]:
+        """The fields as keyword arguments (without copying the skeletons like :func:`dataclasses.asdict`)"""
+        return {field.name: getattr(self, field.name) for field in dataclasses.fields(self)}
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class CompiledCondition:
+    """A condition with the scopes which are relevant for it"""
+
+    condition_skel: SkeletonInstance_T["DiscountConditionSkel"]
+    """The compiled condition"""
+
+    changedate: t.Any
+    """The changedate of the condition at compile time, used to detect changes"""
+
+    scopes: tuple[t.Type[DiscountConditionScope], ...]
+    """The relevant scopes, ordered by cost (in the order of registration for the same cost)"""
+
+    registered: int
+    """Number of registered scopes at compile time, used to detect later registrations"""
+
+    _cache: t.ClassVar[cachetools.LRUCache] = cachetools.LRUCache(maxsize=4096)
+    _lock: t.ClassVar[threading.Lock] = threading.Lock()
+
+    @classmethod
+    def get(cls, condition_skel: SkeletonInstance_T["DiscountConditionSkel"]) -> t.Self:
+        """Get the compiled condition, it will be (re)compiled if the condition or the scopes have changed"""
+        key = condition_skel["key"]
+        with cls._lock:
+            compiled = cls._cache.get(key)
+        if (
+            compiled is None
+            or compiled.changedate != condition_skel["changedate"]
+            or compiled.registered != len(ConditionValidator.scopes)
+        ):
+            compiled = cls.compile(condition_skel)
+            with cls._lock:
+                cls._cache[key] = compiled
+        return compiled
+
+    @classmethod
+    def compile(cls, condition_skel: SkeletonInstance_T["DiscountConditionSkel"]) -> t.Self:
+        scopes = tuple(ConditionValidator.scopes)
+        return cls(
+            condition_skel=condition_skel,
+            changedate=condition_skel["changedate"],
+            scopes=tuple(sorted(
+                (Scope for Scope in scopes if Scope.is_relevant(condition_skel)),
+                key=lambda Scope: Scope.cost,
+            )),
+            registered=len(scopes),
+        )
+
+    @classmethod
+    def invalidate(cls, key: db.Key | None = None) -> None:
+        """Remove a compiled condition from the cache, or all if no key is given"""
+        with cls._lock:
+            if key is None:
+                cls._cache.clear()
+            else:
+                cls._cache.pop(key, None)
+
+    def scopes_for(
+        self,
+        context: DiscountValidationContext,
+        *,
+        skip_date_scopes: bool = False,
+    ) -> tuple[t.Type[DiscountConditionScope], ...]:
+        """The relevant scopes which are allowed in a validation context"""
+        return tuple(
+            Scope for Scope in self.scopes
+            if context in Scope.allowed_contexts and not (skip_date_scopes and Scope.is_date_scope)
+        )
+
+
 class ConditionValidator:
     scopes: list[t.Type[DiscountConditionScope]] = []
 
@@ -123,23 +284,33 @@ class ConditionValidator:
         code: str | None | Sentinel = SENTINEL,
         condition_skel: SkeletonInstance_T["DiscountConditionSkel"],
         context: DiscountValidationContext,
+        scope_context: ScopeContext | None = None,
+        date_validated: bool = False,
     ) -> t.Self:
-        self.cart_skel = cart_skel
-        self.discount_skel = discount_skel
-        self.condition_skel = condition_skel
-        self.code = code
-        self.context = context
-
-        for Scope in ConditionValidator.scopes:
-            scope = Scope(
+        """
+        :param scope_context: The shared arguments, replaces the single arguments.
+        :param date_validated: The dates of the condition are already validated
+            (by a :class:`viur.shop.types.dc_schedule.DiscountWindow`), the date scopes are skipped.
+        """
+        if scope_context is None:
+            scope_context = ScopeContext(
                 cart_skel=cart_skel,
                 article_skel=article_skel,
                 discount_skel=discount_skel,
-                condition_skel=condition_skel,
                 code=code,
                 context=context,
             )
-            self.scope_instances.append(scope)
+        self.cart_skel = scope_context.cart_skel
+        self.article_skel = scope_context.article_skel
+        self.discount_skel = scope_context.discount_skel
+        self.condition_skel = condition_skel
+        self.code = scope_context.code
+        self.context = scope_context.context
+
+        kwargs = scope_context.as_kwargs()
+        compiled = CompiledCondition.get(condition_skel)
+        for Scope in compiled.scopes_for(scope_context.context, skip_date_scopes=date_validated):
+            self.scope_instances.append(Scope(condition_skel=condition_skel, **kwargs))
         # logger.debug(f"{self.scope_instances = }")
         return self
 
@@ -191,28 +362,41 @@ class DiscountValidator:
         discount_skel: SkeletonInstance_T["DiscountSkel"] | None | Sentinel = SENTINEL,
         code: str | None | Sentinel = SENTINEL,
         context: DiscountValidationContext = SENTINEL,
+        live_conditions: frozenset[db.Key] = frozenset(),
     ) -> t.Self:
+        """
+        :param live_conditions: Keys of the conditions which are live by their dates
+            (see :attr:`viur.shop.types.dc_schedule.DiscountWindow.live_conditions`), their date scopes are skipped.
+        """
         self.cart_skel = cart_skel
         self.article_skel = article_skel
         self.discount_skel = discount_skel
         self.code = code
         self.context = context
+        scope_context = ScopeContext(
+            cart_skel=cart_skel,
+            article_skel=article_skel,
+            discount_skel=discount_skel,
+            code=code,
+            context=context,
+        )
 
         # We need the full skel with all bones (otherwise the refSkel would be to large)
-        for condition in discount_skel["condition"]:
-            if not (condition_skel := SHOP_INSTANCE.get().discount_condition.get_skel(condition["dest"]["key"])):
+        condition_skels = SHOP_INSTANCE.get().discount_condition.get_many(
+            condition["dest"]["key"] for condition in discount_skel["condition"]
+        )
+        for condition, condition_skel in zip(discount_skel["condition"], condition_skels):
+            if not condition_skel:
                 logger.warning(f'Broken relation {condition=} in {discount_skel["key"]}?!')
                 raise InvalidStateError(f'Broken relation {condition=} in {discount_skel["key"]}?!')
                 self.condition_skels.append(None)  # TODO
                 self.condition_validator_instances.append(None)  # TODO
                 continue
             cv = ConditionValidator()(
-                cart_skel=cart_skel,
-                article_skel=article_skel,
-                discount_skel=discount_skel,
                 condition_skel=condition_skel,
-                code=code,
                 context=context,
+                scope_context=scope_context,
+                date_validated=condition_skel["key"] in live_conditions,
             )
             self.condition_skels.append(condition_skel)
             self.condition_validator_instances.append(cv)
@@ -227,9 +411,6 @@ class DiscountValidator:
                 self._is_fulfilled = any(cv.is_fulfilled for cv in self.condition_validator_instances)
             elif self.discount_skel["condition_operator"] == ConditionOperator.ALL:
                 logger.debug("Checking for all")
-                logger.debug(f"{self.condition_validator_instances=}")
-
-                pprint.pprint(self.condition_validator_instances)
                 self._is_fulfilled = all(cv.is_fulfilled for cv in self.condition_validator_instances)
             else:
                 raise InvalidStateError(f'Invalid condition operator: {self.discount_skel["condition_operator"]}')
@@ -255,6 +436,12 @@ class DiscountValidator:
 
 @ConditionValidator.register
 class ScopeCode(DiscountConditionScope):
+    cost = ScopeCost.DATASTORE
+
+    @classmethod
+    def is_relevant(cls, condition_skel: SkeletonInstance_T["DiscountConditionSkel"]) -> bool:
+        return condition_skel["code_type"] == CodeType.INDIVIDUAL
+
     def precondition(self) -> bool:
         return (
             self.condition_skel["code_type"] in {CodeType.INDIVIDUAL, CodeType.INDIVIDUAL}
@@ -278,14 +465,40 @@ class ScopeCode(DiscountConditionScope):
                 .getSkel()
             )
             logger.debug(f"{sub = }")
-            if sub["quantity_used"] > 0:
+            # Read the usages from the sharded counter, quantity_used is only updated on roll-up
+            if SHOP_INSTANCE.get().discount_condition.get_quantity_used(sub["key"]) > 0:
                 logger.info(f'code_type INDIVIDUAL not reached (sub already used)')
                 return False
         return True
 
 
+@ConditionValidator.register
+class ScopeQuantityVolume(DiscountConditionScope):
+    """
+    The condition must not be used more often than ``quantity_volume``.
+
+    The usages are read from the sharded counter, which can be outdated for some seconds.
+    """
+
+    cost = ScopeCost.DATASTORE
+
+    @classmethod
+    def is_relevant(cls, condition_skel: SkeletonInstance_T["DiscountConditionSkel"]) -> bool:
+        return condition_skel["quantity_volume"] is not None and condition_skel["quantity_volume"] >= 0
+
+    def __call__(self) -> bool:
+        quantity_used = SHOP_INSTANCE.get().discount_condition.get_quantity_used(self.condition_skel["key"])
+        return quantity_used < self.condition_skel["quantity_volume"]
+
+
 @ConditionValidator.register
 class ScopeMinimumOrderValue(DiscountConditionScope):
+    cost = ScopeCost.COMPUTED
+
+    @classmethod
+    def is_relevant(cls, condition_skel: SkeletonInstance_T["DiscountConditionSkel"]) -> bool:
+        return condition_skel["scope_minimum_order_value"] is not None
+
     def precondition(self) -> bool:
         return (
             self.condition_skel["scope_minimum_order_value"] is not None
@@ -313,6 +526,12 @@ class ScopeMinimumOrderValue(DiscountConditionScope):
 
 @ConditionValidator.register
 class ScopeDateStart(DiscountConditionScope):
+    is_date_scope = True
+
+    @classmethod
+    def is_relevant(cls, condition_skel: SkeletonInstance_T["DiscountConditionSkel"]) -> bool:
+        return condition_skel["scope_date_start"] is not None
+
     def precondition(self) -> bool:
         return self.condition_skel["scope_date_start"] is not None
 
@@ -325,25 +544,32 @@ class ScopeDateStartPrevalidation(DiscountConditionScope):
     """
     Start date prevalidation for automatically discounts
 
-    For prevalidation an offset of 7 days will be added,
+    For prevalidation an offset of 7 days (:data:`PREVALIDATION_OFFSET`) will be added,
     so entries that will be active soon are already in the cache,
     but entries in the distant future are filtered out.
     """
 
+    is_date_scope = True
+
     allowed_contexts = [
         DiscountValidationContext.AUTOMATICALLY_PREVALIDATE,
     ]
 
+    @classmethod
+    def is_relevant(cls, condition_skel: SkeletonInstance_T["DiscountConditionSkel"]) -> bool:
+        return condition_skel["scope_date_start"] is not None
+
     def precondition(self) -> bool:
         return self.condition_skel["scope_date_start"] is not None
 
     def __call__(self) -> bool:
-        return self.condition_skel["scope_date_start"] <= utils.utcNow() + td(days=7)
+        return self.condition_skel["scope_date_start"] <= utils.utcNow() + PREVALIDATION_OFFSET
 
 
 @ConditionValidator.register
 class ScopeDateEnd(DiscountConditionScope):
     prevalidate_for_automatically = True
+    is_date_scope = True
 
     allowed_contexts: t.Final[list[DiscountValidationContext]] = [
         DiscountValidationContext.NORMAL,
@@ -351,6 +577,10 @@ class ScopeDateEnd(DiscountConditionScope):
         DiscountValidationContext.AUTOMATICALLY_LIVE,
     ]
 
+    @classmethod
+    def is_relevant(cls, condition_skel: SkeletonInstance_T["DiscountConditionSkel"]) -> bool:
+        return condition_skel["scope_date_end"] is not None
+
     def precondition(self) -> bool:
         return self.condition_skel["scope_date_end"] is not None
 
@@ -360,6 +590,10 @@ class ScopeDateEnd(DiscountConditionScope):
 
 @ConditionValidator.register
 class ScopeLanguage(DiscountConditionScope):
+    @classmethod
+    def is_relevant(cls, condition_skel: SkeletonInstance_T["DiscountConditionSkel"]) -> bool:
+        return bool(condition_skel["scope_language"])
+
     def precondition(self) -> bool:
         return bool(self.condition_skel["scope_language"])
 
@@ -369,6 +603,10 @@ class ScopeLanguage(DiscountConditionScope):
 
 @ConditionValidator.register
 class ScopeCountry(DiscountConditionScope):
+    @classmethod
+    def is_relevant(cls, condition_skel: SkeletonInstance_T["DiscountConditionSkel"]) -> bool:
+        return bool(condition_skel["scope_country"])
+
     def precondition(self) -> bool:
         return bool(self.condition_skel["scope_country"])
 
@@ -390,6 +628,12 @@ class ScopeCountry(DiscountConditionScope):
 
 @ConditionValidator.register
 class ScopeMinimumQuantity(DiscountConditionScope):
+    cost = ScopeCost.COMPUTED
+
+    @classmethod
+    def is_relevant(cls, condition_skel: SkeletonInstance_T["DiscountConditionSkel"]) -> bool:
+        return condition_skel["scope_minimum_quantity"] is not None
+
     def precondition(self) -> bool:
         return (
             self.condition_skel["scope_minimum_quantity"] is not None
@@ -404,6 +648,12 @@ class ScopeMinimumQuantity(DiscountConditionScope):
 
 @ConditionValidator.register
 class ScopeCustomerGroup(DiscountConditionScope):
+    cost = ScopeCost.MEMORY  # cached in the user, see Order.user_has_ordered
+
+    @classmethod
+    def is_relevant(cls, condition_skel: SkeletonInstance_T["DiscountConditionSkel"]) -> bool:
+        return condition_skel["scope_customer_group"] is not None
+
     def precondition(self) -> bool:
         return (
             self.condition_skel["scope_customer_group"] is not None
@@ -415,21 +665,20 @@ class ScopeCustomerGroup(DiscountConditionScope):
             return True
         if current.user.get() is None:
             return False
-        orders = (
-            SHOP_INSTANCE.get().order.viewSkel().all()
-            .filter("customer.dest.__key__ =", current.user.get()["key"])
-            .filter("is_ordered =", True)
-            .count(2)
-        )
+        has_ordered = SHOP_INSTANCE.get().order.user_has_ordered(current.user.get())
         if self.condition_skel["scope_customer_group"] == CustomerGroup.FIRST_ORDER:
-            return orders == 0
-        elif self.condition_skel["scope_customer_group"] == CustomerGroup.FIRST_ORDER:
-            return orders > 0
+            return not has_ordered
+        elif self.condition_skel["scope_customer_group"] == CustomerGroup.FOLLOW_UP_ORDER:
+            return has_ordered
         raise NotImplementedError
 
 
 @ConditionValidator.register
 class ScopeCombinableLowPrice(DiscountConditionScope):
+    @classmethod
+    def is_relevant(cls, condition_skel: SkeletonInstance_T["DiscountConditionSkel"]) -> bool:
+        return condition_skel["scope_combinable_low_price"] is not None
+
     def precondition(self) -> bool:
         # logger.debug(f"ScopeCombinableLowPrice :: {self.cart_skel=} | {self.article_skel=}")
         return (
@@ -443,6 +692,12 @@ class ScopeCombinableLowPrice(DiscountConditionScope):
 
 @ConditionValidator.register
 class ScopeArticle(DiscountConditionScope):
+    cost = ScopeCost.COMPUTED  # on basket level based on the cached cart tree, otherwise it's only a comparison
+
+    @classmethod
+    def is_relevant(cls, condition_skel: SkeletonInstance_T["DiscountConditionSkel"]) -> bool:
+        return bool(condition_skel["scope_article"])
+
     def precondition(self) -> bool:
         return (
             bool(self.condition_skel["scope_article"])
@@ -453,28 +708,20 @@ class ScopeArticle(DiscountConditionScope):
             )
         )
 
+    @property
+    def scope_article_keys(self) -> set[db.Key]:
+        return {article["dest"]["key"] for article in self.condition_skel["scope_article"]}
+
     def __call__(self) -> bool:
         if self.cart_skel is not None and self.condition_skel["application_domain"] == ApplicationDomain.BASKET:
             # In this case the discount should be applied on the basket,
             # the scope_article must be inside of it.
-            leaf_skels = (
-                SHOP_INSTANCE.get().cart.viewSkel("leaf").all()
-                .filter("parentrepo =", self.cart_skel["key"])
-                .filter(
-                    "article.dest.__key__ IN",
-                    [article["dest"]["key"] for article in self.condition_skel["scope_article"]]
-                )
-                .fetch()
-            )
-            # logger.debug(f"<{len(leaf_skels)}>{leaf_skels = }")
-            return len(leaf_skels) > 0
+            article_keys = SHOP_INSTANCE.get().cart.get_article_keys(self.cart_skel["key"])
+            return not self.scope_article_keys.isdisjoint(article_keys)
 
         if self.article_skel is None:
             raise InvalidStateError("Missing context article")
 
         # In this case the discount should be applied only on specific articles,
         # the current article must be in scope_article.
-        return any(
-            self.article_skel["key"] == article["dest"]["key"]
-            for article in self.condition_skel["scope_article"]
-        )
+        return self.article_skel["key"] in self.scope_article_keys
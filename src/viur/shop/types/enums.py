@@ -132,6 +132,16 @@ class ShippingStatus(enum.Enum):
     """Cheapest shipping selected"""
 
 
+class ShippingTierMeasure(enum.Enum):
+    """The measure of a shipment which a shipping cost tier depends on."""
+
+    QUANTITY = "quantity"
+    """Number of articles"""
+
+    WEIGHT = "weight"
+    """Total weight of the articles, needs a ``shop_weight`` bone in the article skeleton"""
+
+
 class VatRateCategory(enum.StrEnum):
     """Categorizes different VAT rate categories in the EU applied to goods and services."""
 
@@ -162,3 +172,16 @@ class DiscountValidationContext(enum.IntEnum):
 
     AUTOMATICALLY_LIVE = enum.auto()
     """Validate automatically discount in real time"""
+
+
+class ScopeCost(enum.IntEnum):
+    """Cost class of a :class:`DiscountConditionScope`, cheaper scopes are evaluated first."""
+
+    MEMORY = 10
+    """Compares only values in memory (condition, article or context)"""
+
+    COMPUTED = 20
+    """Needs computed values of the cart, like the total (may read the cart tree)"""
+
+    DATASTORE = 30
+    """Runs a datastore query"""
@@ -13,11 +13,13 @@ Core functionality includes:
 -   Evaluation of applicable discounts from both article and cart context.
 -   Price serialization for frontend/API consumption.
 -   Request-local price caching to optimize performance.
+-   Persisted price snapshots on the article (opt-in via ``Shop(persist_article_prices=True)``).
 """
 
 import functools
 import json
 import typing as t  # noqa
+from datetime import datetime as dt
 
 from viur import toolkit
 from viur.core import current, db, utils
@@ -58,12 +60,21 @@ class Price:
     article_skel = None
     cart_leaf = None
 
-    def __init__(self, src_object: SkeletonInstance):
+    def __init__(
+        self,
+        src_object: SkeletonInstance,
+        *,
+        use_snapshot: bool = True,
+        cart_discounts: list[SkeletonInstance] | None = None,
+    ):
         """
         Initialize a Price object based on an article or cart item skeleton.
         Sets up the article reference, detects cart state, and loads applicable discounts.
 
         :param src_object: Either an article skeleton or a cart item skeleton.
+        :param use_snapshot: Use the persisted ``shop_price_cached`` snapshot of the article, if valid.
+        :param cart_discounts: The already resolved (full) discount skeletons of the parent nodes
+            of a cart item. If not provided, they will be read.
         :raises TypeError: If `src_object` is not a supported type.
         :raises InvalidStateError: If the article skeleton has already run renderPreparation.
         """
@@ -74,12 +85,15 @@ class Price:
             self.is_in_cart = True
             self.cart_leaf = src_object
             self.article_skel = toolkit.without_render_preparation(src_object.article_skel_full)
-            try:
-                self.cart_discounts = shop.cart.get_discount_for_leaf(src_object)
-            except Exception as exc:  # FIXME: some entities are broken?
-                logger.exception(exc)
-                self.cart_discounts = []
-            self.cart_discounts = [toolkit.get_full_skel_from_ref_skel(d) for d in self.cart_discounts]
+            if cart_discounts is not None:
+                self.cart_discounts = cart_discounts
+            else:
+                try:
+                    self.cart_discounts = shop.cart.get_discount_for_leaf(src_object)
+                except Exception as exc:  # FIXME: some entities are broken?
+                    logger.exception(exc)
+                    self.cart_discounts = []
+                self.cart_discounts = [toolkit.get_full_skel_from_ref_skel(d) for d in self.cart_discounts]
         elif isinstance(src_object, SkeletonInstance) and issubclass(src_object.skeletonCls, shop.article_skel):
             self.is_in_cart = False
             self.article_skel = toolkit.without_render_preparation(src_object)
@@ -91,6 +105,9 @@ class Price:
         if self.article_skel.renderPreparation is not None:
             raise InvalidStateError("ArticleSkel must not have renderPreparation")
 
+        if not self.is_in_cart and use_snapshot and self._restore_snapshot():
+            return
+
         if (best_discount := self.shop_current_discount(self.article_skel)) is not None:
             price, skel = best_discount
             self.article_discount = skel
@@ -202,10 +219,14 @@ class Price:
         if not article_price:
             return None
         discount_module: "Discount" = SHOP_INSTANCE.get().discount
-        for skel in SHOP_INSTANCE.get().discount.current_automatically_discounts:
+        window = discount_module.current_automatically_discounts_window
+        # Evaluate only the live discounts which can match this article at all,
+        # the dates of their conditions are already validated by the window
+        for skel in window.index.candidates_for_article(article_skel):
             applicable, dv = discount_module.can_apply(
                 skel, article_skel=article_skel,
-                context=DiscountValidationContext.AUTOMATICALLY_LIVE
+                context=DiscountValidationContext.AUTOMATICALLY_LIVE,
+                live_conditions=window.live_conditions,
             )
             # logger.debug(f"{dv=}")
             if not applicable:
@@ -216,6 +237,66 @@ class Price:
                 best_discount = price, skel
         return best_discount
 
+    def _restore_snapshot(self) -> bool:
+        """
+        Restore the automatically discount from the persisted snapshot of the article.
+
+        :return: True, if the snapshot is valid and has been used.
+        """
+        shop = SHOP_INSTANCE.get()
+        if not shop.persist_article_prices or not (snapshot := self.article_skel["shop_price_cached"]):
+            return False
+        try:
+            now = utils.utcNow()
+            if not (dt.fromisoformat(snapshot["valid_from"]) <= now < dt.fromisoformat(snapshot["valid_until"])):
+                return False
+            if snapshot["retail"] != self.retail:
+                return False
+            catalog = shop.discount.current_automatically_discounts_catalog
+            if snapshot["version"] != catalog.version:
+                # The automatically discounts have been changed since the snapshot
+                return False
+            if catalog.index.is_context_dependent(self.article_skel["key"]):
+                # The snapshot has been created for another country or language
+                return False
+            if (discount_key := snapshot["article_discount"]) is not None:
+                # The discount must be still live
+                if (discount := catalog.current_window.index.get(discount_key)) is None:
+                    return False
+                self.article_discount = discount
+        except (KeyError, TypeError, ValueError) as exc:
+            logger.warning(f'Invalid price snapshot on {self.article_skel["key"]!r}: {exc}')
+            return False
+        return True
+
+    @classmethod
+    def create_snapshot(cls, article_skel: SkeletonInstance) -> dict[str, t.Any] | None:
+        """
+        Create a snapshot of the article price with the applied automatically discount.
+
+        The snapshot is valid until the next boundary of the automatically discounts
+        and will be persisted as ``shop_price_cached`` on the article.
+
+        :param article_skel: The article skeleton.
+        :return: The snapshot as JSON serializable dict, or None if persisted prices are disabled
+            or the price could depend on the country or language.
+        """
+        shop = SHOP_INSTANCE.get()
+        if not shop.persist_article_prices:
+            return None
+        if shop.discount.current_automatically_discounts_catalog.index.is_context_dependent(article_skel["key"]):
+            return None
+        price = cls(article_skel, use_snapshot=False)
+        now = utils.utcNow()
+        return {
+            "retail": price.retail,
+            "current": price.current,
+            "article_discount": price.article_discount and str(price.article_discount["key"]),
+            "version": shop.discount.current_automatically_discounts_catalog.version,
+            "valid_from": now.isoformat(),
+            "valid_until": shop.discount.get_next_automatically_discounts_boundary(now).isoformat(),
+        }
+
     def choose_best_discount_set(self) -> tuple[float, list[SkeletonInstance]]:
         """
         Find the best combination of applicable cart discounts for the article.
@@ -268,12 +349,15 @@ class Price:
 
         :return: VAT rate as float between 0.0 and 1.0.
         """
-        try:
+        article_skel = self.article_skel
+        if article_skel.renderPreparation is not None:
             # FIXME: self.article_skel has here sometimes renderPreparation set,
             #        but toolkit.without_render_preparation is already called in __init__
             #        What's going on here?
-            vat_rate = SHOP_INSTANCE.get().vat_rate.get_vat_rate_for_country(
-                category=toolkit.without_render_preparation(self.article_skel)["shop_vat_rate_category"],
+            article_skel = toolkit.without_render_preparation(article_skel)
+        try:
+            vat_rate = SHOP_INSTANCE.get().vat_rate.get_vat_rate_for_current_country(
+                article_skel["shop_vat_rate_category"],
             )
         except ConfigurationError as e:  # TODO(discussion): Or re-raise or implement fallback?
             logger.warning(f"No vat rate for article :: {e}")
@@ -367,23 +451,26 @@ class Price:
         return Price.gross_to_net(gross_value, vat_value) * vat_value
 
     @classmethod
-    def get_or_create(cls, src_object) -> t.Self:
+    def get_or_create(cls, src_object, *, force: bool = False, **kwargs) -> t.Self:
         """
         Returns a cached or newly created Price object for the given article or cart item.
 
         Caches the result in the current request context for reuse.
 
         :param src_object: Source article or cart item skeleton.
+        :param force: Create a new Price object, even if one is cached.
+        :param kwargs: Additional arguments for :meth:`__init__`.
         :return: Price instance.
         """
         # logger.debug(f"Called get_or_create with {src_object = }")
-        try:
-            cls.cache[src_object["key"]]
-            logger.debug(f'Price.get_or_create() hit cache for {src_object["key"]}')
-            return cls.cache[src_object["key"]]
-        except KeyError:
-            pass
-        obj = Price(src_object)
+        if not force:
+            try:
+                cls.cache[src_object["key"]]
+                logger.debug(f'Price.get_or_create() hit cache for {src_object["key"]}')
+                return cls.cache[src_object["key"]]
+            except KeyError:
+                pass
+        obj = Price(src_object, **kwargs)
         cls.cache[src_object["key"]] = obj
         return obj
 
@@ -0,0 +1,105 @@
+"""
+Versioned in-memory catalog of the shippings and shipping configs.
+
+Shippings and shipping configs are small tables, which are rarely edited but
+needed for every article and cart. The :class:`ShippingCatalog` holds all of them
+(with the precondition rels of the configs) in an immutable snapshot per instance.
+It's loaded on the first access and again after the version stamp
+(:data:`viur.shop.modules.shipping.SHIPPING_STAMP`) has been bumped by an edit,
+so all shipping decisions run in memory.
+
+The copies of the shippings in the shipping configs are updated by a deferred
+task after the stamp has been bumped, so the catalog takes the values of the
+shippings from :attr:`ShippingCatalog.shippings` instead.
+
+The :class:`ShippingCostTable` of each shipping and the :class:`ZipCodeRules`
+of each shipping precondition are precomputed with the catalog.
+"""
+
+import dataclasses
+import typing as t  # noqa
+
+from viur.core import db
+from .shipping_cost import ShippingCostTable
+from .zip_rules import ZipCodeRules
+from ..types import SkeletonInstance_T
+
+if t.TYPE_CHECKING:
+    from ..skeletons import ShippingConfigSkel, ShippingSkel
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class ShippingCatalog:
+    """
+    An immutable snapshot of all shippings and shipping configs.
+
+    The skeletons are shared between all requests of an instance and must not be modified.
+    """
+
+    version: int
+    """Version of the shippings this catalog has been loaded with"""
+
+    shippings: dict[db.Key, SkeletonInstance_T["ShippingSkel"]]
+    """All shippings by their key"""
+
+    shipping_configs: dict[db.Key, SkeletonInstance_T["ShippingConfigSkel"]]
+    """All shipping configs by their key"""
+
+    cost_tables: dict[db.Key, ShippingCostTable] = dataclasses.field(init=False)
+    """The cost tables of all shippings by their key"""
+
+    zip_rules: dict[tuple[db.Key, int], ZipCodeRules] = dataclasses.field(init=False)
+    """The zip code rules of all shipping preconditions by (shipping config key, position in its shipping bone)"""
+
+    def __post_init__(self):
+        for shipping_config_skel in self.shipping_configs.values():
+            for shipping in shipping_config_skel["shipping"] or []:
+                if (shipping_skel := self.shippings.get(shipping["dest"]["key"])) is not None:
+                    self._update_dest(shipping["dest"], shipping_skel)
+        object.__setattr__(self, "cost_tables", {
+            key: ShippingCostTable(shipping_skel) for key, shipping_skel in self.shippings.items()
+        })
+        object.__setattr__(self, "zip_rules", {
+            (key, pos): ZipCodeRules(
+                (shipping["rel"] and shipping["rel"]["zip_code"]) or (),
+                (shipping["rel"] and shipping["rel"]["zip_code_exclude"]) or (),
+            )
+            for key, shipping_config_skel in self.shipping_configs.items()
+            for pos, shipping in enumerate(shipping_config_skel["shipping"] or [])
+        })
+
+    def get_shipping(self, key: db.Key) -> SkeletonInstance_T["ShippingSkel"] | None:
+        return self.shippings.get(key)
+
+    def get_shipping_config(self, key: db.Key) -> SkeletonInstance_T["ShippingConfigSkel"] | None:
+        return self.shipping_configs.get(key)
+
+    def get_zip_rules(self, shipping_config_key: db.Key, pos: int) -> ZipCodeRules | None:
+        return self.zip_rules.get((shipping_config_key, pos))
+
+    @staticmethod
+    def _update_dest(dest: SkeletonInstance_T, shipping_skel: SkeletonInstance_T["ShippingSkel"]) -> None:
+        """Replace the values of a (maybe outdated) relational copy by the values of the shipping"""
+        for name in dest:
+            if name in shipping_skel:
+                dest[name] = shipping_skel[name]
+
+    @staticmethod
+    def freeze(skel: SkeletonInstance_T) -> SkeletonInstance_T:
+        """Unserialize all bones (and the relations of the shipping configs) before the skeleton is shared"""
+        for _, value in skel.items(yieldBoneValues=True):
+            for entry in value if isinstance(value, list) else ():
+                if isinstance(entry, dict) and "dest" in entry:
+                    ShippingCatalog.freeze(entry["dest"])
+                    if entry.get("rel") is not None:
+                        ShippingCatalog.freeze(entry["rel"])
+        return skel
+
+    def __len__(self) -> int:
+        return len(self.shipping_configs)
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} {self.version=} with {len(self.shippings)} shippings "
+            f"and {len(self.shipping_configs)} shipping configs>"
+        )
@@ -0,0 +1,233 @@
+"""
+Tiered shipping costs.
+
+A shipping costs its flat ``shipping_cost``, unless
+
+- the order value of its shipment reaches the ``free_shipping_threshold``, then it's free,
+- or any of its ``cost_tiers`` matches the quantity or the weight of its shipment.
+  Per measure the tier with the greatest minimum (not above the measure)
+  matches, if tiers of both measures match, the more expensive one wins.
+
+The shipment of a shipping are the leafs of the cart it delivers, grouped by
+its supplier: All leafs whose shipping config contains any shipping of the
+same supplier (or this shipping, if it has no supplier). So in a cart with
+articles of multiple suppliers, each shipping is calculated for its part
+and the cart costs the sum of the cheapest shipping of each supplier
+(see :meth:`ShippingCostEngine.select_cheapest`).
+
+The :class:`ShippingCostTable` of each shipping is precomputed with the
+:class:`viur.shop.types.shipping_catalog.ShippingCatalog`, the
+:class:`ShippingCostEngine` measures the leafs in one pass per shipping
+config and looks up the costs with a binary search in the tables.
+"""
+
+import bisect
+import dataclasses
+import typing as t  # noqa
+
+from viur.core import db
+from .enums import ShippingTierMeasure
+from ..globals import SHOP_LOGGER
+from ..types import SkeletonInstance_T
+
+if t.TYPE_CHECKING:
+    from ..skeletons import CartItemSkel, ShippingSkel
+
+logger = SHOP_LOGGER.getChild(__name__)
+
+
+@dataclasses.dataclass(slots=True)
+class ShipmentMeasures:
+    """The sums of some leafs of a cart"""
+
+    order_value: float = 0.0
+    """Total of the leafs"""
+
+    quantity: float = 0.0
+    """Number of articles"""
+
+    weight: float = 0.0
+    """Total weight of the articles, 0 if the article skeleton has no ``shop_weight`` bone"""
+
+    def add_leaf(self, leaf_skel: SkeletonInstance_T["CartItemSkel"]) -> None:
+        quantity = leaf_skel["quantity"] or 0
+        article_skel = leaf_skel.article_skel
+        self.order_value += (leaf_skel.pricing_.current or 0.0) * quantity
+        self.quantity += quantity
+        if "shop_weight" in article_skel:
+            self.weight += (article_skel["shop_weight"] or 0.0) * quantity
+
+    def __add__(self, other: t.Self) -> t.Self:
+        return ShipmentMeasures(
+            self.order_value + other.order_value,
+            self.quantity + other.quantity,
+            self.weight + other.weight,
+        )
+
+    def get(self, measure: ShippingTierMeasure) -> float:
+        return getattr(self, measure.value)
+
+
+class ShippingCostTable:
+    """The precomputed costs of a shipping"""
+
+    __slots__ = ("shipping_cost", "free_shipping_threshold", "tiers")
+
+    def __init__(self, shipping_skel: SkeletonInstance_T["ShippingSkel"]):
+        super().__init__()
+        self.shipping_cost: float = shipping_skel["shipping_cost"] or 0.0
+        self.free_shipping_threshold: float | None = shipping_skel["free_shipping_threshold"]
+        tiers: dict[ShippingTierMeasure, dict[float, float]] = {}
+        for tier in shipping_skel["cost_tiers"] or []:
+            # The last tier of the same minimum wins, like with a dict
+            tiers.setdefault(ShippingTierMeasure(tier["measure"]), {})[tier["minimum"]] = tier["shipping_cost"]
+        self.tiers: dict[ShippingTierMeasure, tuple[list[float], list[float]]] = {
+            measure: (sorted(costs), [costs[minimum] for minimum in sorted(costs)])
+            for measure, costs in tiers.items()
+        }
+        """Per measure the minimums (ascending) and their costs"""
+
+    @property
+    def is_flat(self) -> bool:
+        """Are the costs independent of the shipment?"""
+        return not self.tiers and self.free_shipping_threshold is None
+
+    def cost(self, measures: ShipmentMeasures) -> float:
+        """Calculate the costs of a shipment"""
+        if self.free_shipping_threshold is not None and measures.order_value >= self.free_shipping_threshold:
+            return 0.0
+        costs = []
+        for measure, (minimums, tier_costs) in self.tiers.items():
+            if (pos := bisect.bisect_right(minimums, measures.get(measure)) - 1) >= 0:
+                costs.append(tier_costs[pos])
+        return max(costs, default=self.shipping_cost)
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} {self.shipping_cost=} {self.free_shipping_threshold=} "
+            f"with {sum(len(minimums) for minimums, _ in self.tiers.values())} tiers>"
+        )
+
+
+class ShippingCostEngine:
+    """
+    Calculates the costs of the shippings for the leafs of a cart.
+
+    :param cost_tables: The precomputed tables by shipping key, shippings without a table cost their flat price.
+    :param leafs: The leafs of the cart by the key of their shipping config.
+    """
+
+    __slots__ = ("cost_tables", "leafs", "_measures")
+
+    def __init__(
+        self,
+        cost_tables: t.Mapping[db.Key, ShippingCostTable],
+        leafs: t.Mapping[db.Key, t.Sequence[SkeletonInstance_T["CartItemSkel"]]],
+    ):
+        super().__init__()
+        self.cost_tables = cost_tables
+        self.leafs = leafs
+        self._measures: dict[db.Key, ShipmentMeasures] | None = None
+
+    @property
+    def measures(self) -> dict[db.Key, ShipmentMeasures]:
+        """The measures of the leafs per shipping config, measured once on the first access"""
+        if self._measures is None:
+            self._measures = {}
+            for shipping_config_key, leaf_skels in self.leafs.items():
+                self._measures[shipping_config_key] = measures = ShipmentMeasures()
+                for leaf_skel in leaf_skels:
+                    measures.add_leaf(leaf_skel)
+        return self._measures
+
+    def apply(self, shipping_configs: t.Mapping[db.Key, t.Any], shippings: list[dict]) -> list[dict]:
+        """
+        Calculate the costs of the shippings of these shipping configs.
+
+        :return: The shippings, with a copy of the dest containing the
+            calculated ``shipping_cost`` if it differs from the flat price.
+        """
+        if all(
+            (table := self.cost_tables.get(shipping["dest"]["key"])) is None or table.is_flat
+            for shipping in shippings
+        ):
+            return shippings
+
+        # The shipment of a shipping are the leafs of all configs with a shipping of the same supplier
+        groups: dict[t.Any, list[db.Key]] = {}
+        for shipping_config_key, shipping_config_skel in shipping_configs.items():
+            for shipping in shipping_config_skel["shipping"] or []:
+                group = groups.setdefault(self._group_of(shipping["dest"]), [])
+                if shipping_config_key not in group:
+                    group.append(shipping_config_key)
+
+        measures = self.measures
+        results = []
+        for shipping in shippings:
+            table = self.cost_tables.get(shipping["dest"]["key"])
+            if table is None or table.is_flat:
+                results.append(shipping)
+                continue
+            shipment = sum(
+                (measures.get(key, ShipmentMeasures()) for key in groups.get(self._group_of(shipping["dest"]), ())),
+                ShipmentMeasures(),
+            )
+            cost = table.cost(shipment)
+            if cost == shipping["dest"]["shipping_cost"]:
+                results.append(shipping)
+                continue
+            # The shippings may be shared (e.g. by the catalog), the calculated cost goes into a copy
+            dest = shipping["dest"].clone()
+            dest["shipping_cost"] = cost
+            results.append({**shipping, "dest": dest})
+        return results
+
+    def select_cheapest(self, shipping_configs: t.Mapping[db.Key, t.Any], shippings: list[dict]) -> list[dict]:
+        """
+        Select the shippings which deliver the whole cart for the lowest costs.
+
+        Since each shipping only costs the shipment of its supplier, a cart with
+        articles of multiple suppliers needs a shipping per supplier. The cheapest
+        shipping of each supplier is taken, the suppliers are chosen cheapest first
+        until every shipping config with an applicable shipping is delivered.
+
+        :param shippings: The applicable shippings, with their costs calculated by :meth:`apply`.
+        :return: One shipping per chosen supplier, the sum of their costs is the cost of the cart.
+        """
+        cheapest: dict[t.Any, dict] = {}
+        for shipping in shippings:
+            group = self._group_of(shipping["dest"])
+            if group not in cheapest or self._cost_of(shipping) < self._cost_of(cheapest[group]):
+                cheapest[group] = shipping
+
+        # The suppliers which can deliver each shipping config
+        shipping_keys = {shipping["dest"]["key"] for shipping in shippings}
+        config_groups = [
+            groups for shipping_config_skel in shipping_configs.values()
+            if (groups := {
+                self._group_of(shipping["dest"])
+                for shipping in shipping_config_skel["shipping"] or []
+                if shipping["dest"]["key"] in shipping_keys
+            })
+        ]
+
+        selection = []
+        uncovered = config_groups
+        for group in sorted(cheapest, key=lambda group: self._cost_of(cheapest[group])):
+            if any(group in groups for groups in uncovered):
+                selection.append(group)
+                uncovered = [groups for groups in uncovered if group not in groups]
+        # Drop suppliers (most expensive first) whose configs are delivered by the others as well
+        for group in reversed(selection[:]):
+            others = set(selection) - {group}
+            if all(groups & others for groups in config_groups):
+                selection.remove(group)
+        return [cheapest[group] for group in selection]
+
+    @staticmethod
+    def _cost_of(shipping: dict) -> float:
+        return shipping["dest"]["shipping_cost"] or 0.0
+
+    @staticmethod
+    def _group_of(dest: SkeletonInstance_T["ShippingSkel"]) -> t.Any:
+        return dest["supplier"] or dest["key"]
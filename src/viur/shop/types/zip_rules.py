@@ -0,0 +1,153 @@
+"""
+Compiled zip code rules of the shipping preconditions.
+
+A :class:`viur.shop.skeletons.ShippingPreconditionRelSkel` limits a shipping
+to some zip codes (``zip_code``) or excludes some zip codes (``zip_code_exclude``).
+Shops with island or remote-area surcharges maintain thousands of zip codes
+per rule, so the patterns are compiled once into :class:`ZipCodePatterns`:
+
+- ``12345``: exactly this zip code,
+- ``123*``: all zip codes starting with ``123``,
+- ``10000..10999``: all zip codes of the same length within this (inclusive) range.
+
+A ``-`` is part of the zip code (like in ``00-950`` or ``100-0001``), not a range.
+Exact patterns and prefixes are looked up in sets, with one lookup per distinct
+prefix length, ranges are merged and looked up with a binary search.
+Zip codes and patterns are compared in upper case and without whitespace.
+"""
+
+import bisect
+import functools
+import typing as t  # noqa
+
+from ..globals import SHOP_LOGGER
+
+logger = SHOP_LOGGER.getChild(__name__)
+
+
+def normalize_zip_code(zip_code: str) -> str:
+    return "".join(str(zip_code).split()).upper()
+
+
+def validate_zip_code_pattern(pattern: str) -> str | None:
+    """Validate a zip code pattern, returns the error message or None if it's valid"""
+    pattern = normalize_zip_code(pattern)
+    if not pattern:
+        return "Empty zip code pattern"
+    if "*" in pattern[:-1]:
+        return "The wildcard * is only allowed at the end"
+    if ".." in pattern:
+        start, _, end = pattern.partition("..")
+        if not start or not end or "." in end or pattern.endswith("*"):
+            return "A range must look like 10000..10999"
+        if len(start) != len(end):
+            return "Both bounds of a range must have the same length"
+        if start > end:
+            return "The start of a range must not be greater than its end"
+    return None
+
+
+class ZipCodePatterns:
+    """A compiled list of zip code patterns, see the module documentation"""
+
+    __slots__ = ("patterns", "exact", "prefixes", "prefix_lengths", "ranges")
+
+    def __init__(self, patterns: t.Iterable[str]):
+        super().__init__()
+        self.patterns: tuple[str, ...] = tuple(patterns)
+        exact = set()
+        prefixes = set()
+        ranges: dict[int, list[tuple[str, str]]] = {}
+        for pattern in self.patterns:
+            if error := validate_zip_code_pattern(pattern):
+                logger.warning(f"Ignoring invalid zip code pattern {pattern!r}: {error}")
+                continue
+            pattern = normalize_zip_code(pattern)
+            if pattern.endswith("*"):
+                prefixes.add(pattern[:-1])
+            elif ".." in pattern:
+                start, _, end = pattern.partition("..")
+                ranges.setdefault(len(start), []).append((start, end))
+            else:
+                exact.add(pattern)
+        self.exact: frozenset[str] = frozenset(exact)
+        self.prefixes: frozenset[str] = frozenset(prefixes)
+        self.prefix_lengths: tuple[int, ...] = tuple(sorted({len(prefix) for prefix in prefixes}))
+        self.ranges: dict[int, tuple[list[str], list[str]]] = {
+            length: self._merge(bounds) for length, bounds in ranges.items()
+        }
+        """Per zip code length the starts and the ends of the merged ranges, ascending"""
+
+    @staticmethod
+    def _merge(bounds: list[tuple[str, str]]) -> tuple[list[str], list[str]]:
+        starts: list[str] = []
+        ends: list[str] = []
+        for start, end in sorted(bounds):
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        return starts, ends
+
+    def matches(self, zip_code: str | None) -> bool:
+        """Does any pattern match this zip code?"""
+        if not zip_code:
+            return False
+        zip_code = normalize_zip_code(zip_code)
+        if zip_code in self.exact:
+            return True
+        for length in self.prefix_lengths:
+            if length > len(zip_code):
+                break
+            if zip_code[:length] in self.prefixes:
+                return True
+        if bounds := self.ranges.get(len(zip_code)):
+            starts, ends = bounds
+            pos = bisect.bisect_right(starts, zip_code) - 1
+            return pos >= 0 and zip_code <= ends[pos]
+        return False
+
+    def __bool__(self) -> bool:
+        return bool(self.exact or self.prefixes or self.ranges)
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} with {len(self.exact)} zip codes, "
+            f"{len(self.prefixes)} prefixes and {sum(len(s) for s, _ in self.ranges.values())} ranges>"
+        )
+
+
+class ZipCodeRules:
+    """The compiled include and exclude patterns of a shipping precondition"""
+
+    __slots__ = ("include", "exclude")
+
+    def __init__(self, include: t.Iterable[str], exclude: t.Iterable[str]):
+        super().__init__()
+        self.include: ZipCodePatterns = ZipCodePatterns(include)
+        self.exclude: ZipCodePatterns = ZipCodePatterns(exclude)
+
+    def allows(self, zip_code: str | None) -> bool:
+        """Is the zip code included (if there are include patterns) and not excluded?"""
+        if self.include and not self.include.matches(zip_code):
+            return False
+        return not self.exclude.matches(zip_code)
+
+    @classmethod
+    def of(cls, rel: t.Mapping[str, t.Any]) -> t.Self:
+        """
+        Get the compiled rules of a shipping precondition, each revision is compiled only once.
+
+        Prefer the rules compiled with the :class:`viur.shop.types.shipping_catalog.ShippingCatalog`,
+        this has to look up all patterns of the precondition.
+        """
+        return cls._compile(tuple(rel["zip_code"] or ()), tuple(rel["zip_code_exclude"] or ()))
+
+    @classmethod
+    @functools.lru_cache(maxsize=1024)
+    def _compile(cls, include: tuple[str, ...], exclude: tuple[str, ...]) -> t.Self:
+        return cls(include, exclude)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} include={self.include!r} exclude={self.exclude!r}>"